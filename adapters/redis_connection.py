@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+
+import redis.asyncio as async_redis
+from redis import Redis, BlockingConnectionPool
+
+from config import get_redis_host_and_port, REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT_SECONDS, \
+    REDIS_SOCKET_TIMEOUT_SECONDS, REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS, REDIS_HEALTH_CHECK_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 1024
+
+
+class RedisStats:
+    def __init__(self):
+        self.commands = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, failed: bool = False):
+        with self._lock:
+            self.commands += 1
+            self.errors += failed
+            self._latencies.append(elapsed)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            commands, errors = self.commands, self.errors
+
+        def percentile(p):
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2) if latencies else None
+
+        return {
+            "commands": commands,
+            "errors": errors,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)}
+        }
+
+
+# Pools that know how many of their connections are checked out right now. Tracked per connection,
+# since the pool also releases connections internally when connecting fails.
+class _TrackedPool(BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checked_out = set()
+        self.peak_in_use = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def in_use(self) -> int:
+        return len(self.checked_out)
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        with self._count_lock:
+            self.checked_out.add(connection)
+            self.peak_in_use = max(self.peak_in_use, len(self.checked_out))
+        return connection
+
+    def release(self, connection):
+        with self._count_lock:
+            self.checked_out.discard(connection)
+        super().release(connection)
+
+
+class _TrackedAsyncPool(async_redis.BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checked_out = set()
+        self.peak_in_use = 0
+
+    @property
+    def in_use(self) -> int:
+        return len(self.checked_out)
+
+    async def get_connection(self, *args, **kwargs):
+        connection = await super().get_connection(*args, **kwargs)
+        self.checked_out.add(connection)
+        self.peak_in_use = max(self.peak_in_use, len(self.checked_out))
+        return connection
+
+    async def release(self, connection):
+        self.checked_out.discard(connection)
+        await super().release(connection)
+
+
+# Clients that time every command they send
+class _TimedRedis(Redis):
+    stats = None
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return super().execute_command(*args, **options)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - started, failed)
+
+
+class _TimedAsyncRedis(async_redis.Redis):
+    stats = None
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await super().execute_command(*args, **options)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.stats.record(time.perf_counter() - started, failed)
+
+
+# The one place the process connects to Redis from. Owns a blocking pool for threads (message bus
+# handlers, workers, the pub/sub listener) and an asyncio pool for the event loop, both bounded,
+# with socket timeouts and periodic health checks on idle connections. Callers borrow the clients,
+# pipelines count as a single round trip in the stats.
+class RedisConnectionManager:
+    def __init__(self,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 db: int = 0,
+                 max_connections: int = REDIS_MAX_CONNECTIONS,
+                 pool_timeout: float = REDIS_POOL_TIMEOUT_SECONDS,
+                 socket_timeout: float = REDIS_SOCKET_TIMEOUT_SECONDS,
+                 socket_connect_timeout: float = REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS,
+                 health_check_interval: int = REDIS_HEALTH_CHECK_INTERVAL_SECONDS):
+        address = get_redis_host_and_port()
+        options = dict(
+            host=host or address["host"],
+            port=port or address["port"],
+            db=db,
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+            health_check_interval=health_check_interval
+        )
+        self.max_connections = max_connections
+        self.stats = RedisStats()
+        self.sync_pool = _TrackedPool(**options)
+        self.async_pool = _TrackedAsyncPool(**options)
+        self.sync_client = _TimedRedis(connection_pool=self.sync_pool)
+        self.sync_client.stats = self.stats
+        self.async_client = _TimedAsyncRedis(connection_pool=self.async_pool)
+        self.async_client.stats = self.stats
+        self._scripts = {}
+        self._async_scripts = {}
+
+    def register_script(self, source: str):
+        # Registered once, later calls run with EVALSHA
+        if source not in self._scripts:
+            self._scripts[source] = self.sync_client.register_script(source)
+        return self._scripts[source]
+
+    def register_async_script(self, source: str):
+        if source not in self._async_scripts:
+            self._async_scripts[source] = self.async_client.register_script(source)
+        return self._async_scripts[source]
+
+    @contextmanager
+    def pipeline(self, transaction: bool = False):
+        # Commands queued inside the block go out in one round trip when it exits
+        pipe = self.sync_client.pipeline(transaction=transaction)
+        try:
+            yield pipe
+            started = time.perf_counter()
+            failed = False
+            try:
+                pipe.execute()
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.stats.record(time.perf_counter() - started, failed)
+        finally:
+            pipe.reset()
+
+    @asynccontextmanager
+    async def async_pipeline(self, transaction: bool = False):
+        pipe = self.async_client.pipeline(transaction=transaction)
+        try:
+            yield pipe
+            started = time.perf_counter()
+            failed = False
+            try:
+                await pipe.execute()
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.stats.record(time.perf_counter() - started, failed)
+        finally:
+            await pipe.reset()
+
+    async def health(self) -> dict:
+        started = time.perf_counter()
+        try:
+            await self.async_client.ping()
+        except Exception as error:
+            return {"ok": False, "error": str(error)}
+        return {"ok": True, "ping_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats.snapshot(),
+            "max_connections": self.max_connections,
+            "sync_pool": {"in_use": self.sync_pool.in_use, "peak_in_use": self.sync_pool.peak_in_use},
+            "async_pool": {"in_use": self.async_pool.in_use, "peak_in_use": self.async_pool.peak_in_use}
+        }
+
+    async def close(self):
+        await self.async_pool.disconnect()
+        self.sync_pool.disconnect()
+
+
+_manager = None
+_closed = False
+_manager_lock = threading.Lock()
+
+
+# Composition roots (the app, workers, scripts) create the manager once and pass it to bootstrap()
+# and the services they build. Everything else receives it and never looks it up.
+def init_redis_manager(**options) -> RedisConnectionManager:
+    global _manager, _closed
+    with _manager_lock:
+        if _manager is None:
+            _manager = RedisConnectionManager(**options)
+            _closed = False
+        return _manager
+
+
+def get_redis_manager() -> RedisConnectionManager:
+    # After close_redis_manager() a late caller fails instead of quietly opening a fresh pool
+    with _manager_lock:
+        if _manager is None and _closed:
+            raise RuntimeError("the Redis connection manager is closed")
+    return _manager if _manager is not None else init_redis_manager()
+
+
+async def close_redis_manager():
+    global _manager, _closed
+    with _manager_lock:
+        manager, _manager = _manager, None
+        _closed = True
+    if manager is not None:
+        await manager.close()
@@ -1,13 +1,16 @@
 import abc
 from abc import abstractmethod
-from typing import Set
+from typing import Set, Optional
 
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only, joinedload, lazyload
 
 from adapters.repositories.AbstractSqlAlchemyRepository import AbstractSqlAlchemyRepository
-from adapters.repositories.CityRepository import CityRepository
-from domains.models.BookManagementModels import Author
+from domains.models.BookManagementModels import Author, City
+from exceptions.BaseException import AuthorsNotFoundError
+
+AUTHOR_FIELDS = ("id", "first_name", "last_name")
+AUTHOR_INCLUDES = ("city",)
 
 
 class AbstractAuthorRepository(abc.ABC):
@@ -16,7 +19,19 @@ class AbstractAuthorRepository(abc.ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def get_author_list(self)-> list[Author]:
+    def get_authors_by_ids(self, author_ids: list[int])-> list[Author]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_author_list(self, fields: Optional[tuple] = None, include_city: bool = True)-> list[Author]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_author_city_ids(self)-> list[tuple]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_existing_author_ids(self, author_ids: list[int])-> set[int]:
         raise NotImplementedError
 
 
@@ -32,11 +47,34 @@ class AuthorRepository(AbstractSqlAlchemyRepository,AbstractAuthorRepository):
             raise NoResultFound("Book not found.")
         return author
 
-    def get_author_list(self):
-        authors = super().list()
-        for author in authors:
-            city_repo = CityRepository(self.session)
-            city = city_repo.get_city_by_id(author.city_id)
-            author.set_city(city)
+    def get_authors_by_ids(self, author_ids):
+        # One IN query for any number of ids, returned in the order they were asked for
+        author_ids = list(dict.fromkeys(author_ids))
+        if not author_ids:
+            return []
+        authors = {author.id: author for author in
+                   self.session.query(Author).filter(Author.id.in_(author_ids)).all()}
+        missing = [author_id for author_id in author_ids if author_id not in authors]
+        if missing:
+            raise AuthorsNotFoundError(f"Authors not found: {', '.join(map(str, missing))}")
+        return [authors[author_id] for author_id in author_ids]
+
+    def get_author_list(self, fields=None, include_city=True):
+        # Only the requested columns are selected and the city join runs only when it is wanted
+        fields = AUTHOR_FIELDS if fields is None else fields
+        query = self.session.query(Author).options(load_only(*[getattr(Author, name) for name in fields]))
+        if include_city:
+            query = query.options(joinedload(Author.city).load_only(City.id, City.title))
+        else:
+            query = query.options(lazyload(Author.city))
+        return query.order_by(Author.id).all()
+
+    def get_author_city_ids(self):
+        rows = self.session.query(Author.id, Author.city_id).all()
+        return [tuple(row) for row in rows]
 
-        return authors
\ No newline at end of file
+    def get_existing_author_ids(self, author_ids):
+        if not author_ids:
+            return set()
+        rows = self.session.query(Author.id).filter(Author.id.in_(author_ids)).all()
+        return {row.id for row in rows}
@@ -0,0 +1,492 @@
+import json
+from abc import abstractmethod, ABC
+from functools import lru_cache
+from typing import Optional, Set, Iterator, Callable
+
+from sqlalchemy import and_, select, text, func, or_, tuple_, case, delete, literal_column, true
+from sqlalchemy.dialects.postgresql import insert, aggregate_order_by, array
+from sqlalchemy.orm import Session
+
+from adapters.repositories.BookRepository import search_query, search_config, search_vector_expression
+from adapters.table_mapping import book_card_table, book_table, author_table, city_table, \
+    book_author_association, reservation_table
+from config import BOOK_SEARCH_HIGHLIGHT_OPTIONS, BOOK_FACET_PRICE_BUCKETS, BOOK_FACET_LIMIT
+from domains.models.BookManagementModels import ReservationStatus, normalize_genres
+from helpers.serialization import row_serializer
+from helpers.pagination_cursor import encode_cursor, decode_cursor, CURSOR_DIRECTION_NEXT, CURSOR_DIRECTION_PREV
+
+cards = book_card_table.c
+
+BOOK_CARD_FIELDS = {
+    "id": cards.book_id,
+    "title": cards.title,
+    "genres": cards.genres,
+    "isbn": cards.isbn,
+    "release_date": cards.release_date,
+    "price": cards.price,
+    "status": cards.status
+}
+BOOK_CARD_INCLUDES = ("authors", "authors.city")
+
+
+def card_columns(fields: Optional[tuple] = None, include: Optional[tuple] = None) -> tuple:
+    fields = tuple(BOOK_CARD_FIELDS) if fields is None else fields
+    include = BOOK_CARD_INCLUDES if include is None else include
+    # Ordering and cursors need the key columns even when the client did not ask for them
+    columns = [cards.book_id, cards.price] + [BOOK_CARD_FIELDS[name] for name in fields]
+    if "authors" in include:
+        columns.append(cards.authors)
+    return tuple(dict.fromkeys(columns))
+
+
+CARD_COLUMNS = card_columns()
+
+
+@lru_cache(maxsize=64)
+def book_card_serializer(fields: Optional[tuple] = None, include: Optional[tuple] = None,
+                         ranked: bool = False) -> Callable:
+    # One compiled function per projection, reused for every row of every page
+    fields = tuple(BOOK_CARD_FIELDS) if fields is None else fields
+    include = BOOK_CARD_INCLUDES if include is None else include
+    to_dict = row_serializer(tuple(BOOK_CARD_FIELDS[name].key for name in fields), fields)
+    with_authors = "authors" in include
+    with_cities = "authors.city" in include
+
+    def serialize(row) -> dict:
+        book_data = to_dict(row)
+        if with_authors:
+            authors = row.authors
+            if not with_cities:
+                authors = [{key: value for key, value in author.items() if key != 'city'} for author in authors]
+            book_data["authors"] = authors
+        if ranked:
+            book_data["rank"] = row.rank
+            book_data["highlight"] = row.highlight
+        return book_data
+
+    return serialize
+
+
+def _price_bucket_bounds(bucket: int) -> dict:
+    # width_bucket gives 0 below the first threshold and len(thresholds) above the last one
+    return {
+        "min": BOOK_FACET_PRICE_BUCKETS[bucket - 1] if bucket > 0 else None,
+        "max": BOOK_FACET_PRICE_BUCKETS[bucket] if bucket < len(BOOK_FACET_PRICE_BUCKETS) else None
+    }
+
+
+def _card_source_select():
+    # Builds card rows straight from the normalized tables, one row per book
+    authors = (
+        select(func.jsonb_agg(aggregate_order_by(
+            func.jsonb_build_object(
+                'id', author_table.c.id,
+                'first_name', author_table.c.first_name,
+                'last_name', author_table.c.last_name,
+                'city', case(
+                    (city_table.c.id.is_(None), None),
+                    else_=func.jsonb_build_object('id', city_table.c.id, 'title', city_table.c.title))
+            ),
+            book_author_association.c.author_id)))
+        .select_from(book_author_association
+                     .join(author_table, author_table.c.id == book_author_association.c.author_id)
+                     .outerjoin(city_table, city_table.c.id == author_table.c.city_id))
+        .where(book_author_association.c.book_id == book_table.c.id)
+        .scalar_subquery()
+    )
+    city_ids = (
+        select(func.array_agg(author_table.c.city_id.distinct()))
+        .select_from(book_author_association
+                     .join(author_table, author_table.c.id == book_author_association.c.author_id))
+        .where(and_(book_author_association.c.book_id == book_table.c.id,
+                    author_table.c.city_id.is_not(None)))
+        .scalar_subquery()
+    )
+    status = case(
+        *[(book_table.c.status == member, member.value) for member in ReservationStatus]
+    )
+    return select(
+        book_table.c.id,
+        book_table.c.title,
+        book_table.c.genres,
+        book_table.c.isbn,
+        book_table.c.release_date,
+        book_table.c.price,
+        status,
+        func.coalesce(city_ids, literal_column("'{}'::integer[]")),
+        func.coalesce(authors, literal_column("'[]'::jsonb")),
+        # Books written before search_vector existed have none stored yet
+        func.coalesce(book_table.c.search_vector,
+                      search_vector_expression(book_table.c.title, func.array_to_string(book_table.c.genres, ' '))),
+        func.now()
+    )
+
+
+class AbstractBookCardRepository(ABC):
+
+    @abstractmethod
+    def refresh_book_cards(self, book_ids: list[int]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def rebuild_book_cards(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_book_list_filtered(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        page: int = 1,
+        per_page: int = 10,
+        sort_by_price: str = 'asc',
+        sort_by_relevance: bool = False,
+        fields: Optional[tuple] = None,
+        include: Optional[tuple] = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_book_list_by_cursor(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        per_page: int = 10,
+        sort_by_price: str = 'asc',
+        with_total: bool = False,
+        fields: Optional[tuple] = None,
+        include: Optional[tuple] = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_book_facets(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_reserved_book_cards(self, member_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_book_cards_by_ids(self, book_ids: list[int], fields: Optional[tuple] = None,
+                              include: Optional[tuple] = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def stream_book_cards(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        batch_size: int = 1000) -> Iterator[dict]:
+        raise NotImplementedError
+
+
+class BookCardRepository(AbstractBookCardRepository):
+    def __init__(self, session: Session):
+        self.session = session
+        self.seen = set()  # type: Set
+
+    def refresh_book_cards(self, book_ids: list[int]) -> None:
+        if not book_ids:
+            return
+        self._upsert_cards(_card_source_select().where(book_table.c.id.in_(book_ids)))
+        self.session.commit()
+
+    def rebuild_book_cards(self) -> int:
+        # Delete and reinsert in one transaction so readers never see a half-built projection
+        self.session.execute(delete(book_card_table))
+        self._upsert_cards(_card_source_select())
+        self.session.commit()
+        return self.session.execute(select(func.count()).select_from(book_card_table)).scalar()
+
+    def _upsert_cards(self, source) -> None:
+        stmt = insert(book_card_table).from_select(
+            [cards.book_id, cards.title, cards.genres, cards.isbn, cards.release_date, cards.price,
+             cards.status, cards.city_ids, cards.authors, cards.search_vector, cards.updated_at],
+            source
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cards.book_id],
+            set_={column.name: stmt.excluded[column.name] for column in book_card_table.columns
+                  if column.name != 'book_id'}
+        )
+        self.session.execute(stmt)
+
+    def get_book_list_filtered(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        page: int = 1,
+        per_page: int = 10,
+        sort_by_price: str = 'asc',
+        sort_by_relevance: bool = False,
+        fields: Optional[tuple] = None,
+        include: Optional[tuple] = None):
+
+        filters = self._build_filters(search, min_price, max_price, genres, genres_match, city_id)
+
+        # Sorting, id is the tie-breaker so pages are stable between requests
+        if sort_by_price == 'asc':
+            sort_order = (cards.price.asc(), cards.book_id.asc())
+        else:
+            sort_order = (cards.price.desc(), cards.book_id.desc())
+
+        search_columns = self._search_columns(search)
+        if search_columns and sort_by_relevance:
+            sort_order = (search_columns[0].desc(), cards.book_id.asc())
+
+        rows = self._query_cards(filters, search_columns, sort_order, (page-1)*per_page, per_page,
+                                 card_columns(fields, include))
+        serialize = book_card_serializer(fields, include, bool(search_columns))
+        return [serialize(row) for row in rows]
+
+    def get_book_list_by_cursor(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        per_page: int = 10,
+        sort_by_price: str = 'asc',
+        with_total: bool = False,
+        fields: Optional[tuple] = None,
+        include: Optional[tuple] = None):
+
+        filters = self._build_filters(search, min_price, max_price, genres, genres_match, city_id)
+        ascending = sort_by_price == 'asc'
+        backward = False
+
+        if cursor is not None:
+            position = decode_cursor(cursor, sort_by_price)
+            backward = position["direction"] == CURSOR_DIRECTION_PREV
+            key = tuple_(cards.price, cards.book_id)
+            bound = tuple_(position["price"], position["id"])
+            # Walking backwards flips both the comparison and the scan order
+            if ascending != backward:
+                filters.append(key > bound)
+            else:
+                filters.append(key < bound)
+
+        if ascending != backward:
+            sort_order = (cards.price.asc(), cards.book_id.asc())
+        else:
+            sort_order = (cards.price.desc(), cards.book_id.desc())
+
+        # Fetch one extra row to know whether another page exists in the scan direction
+        search_columns = self._search_columns(search)
+        rows = self._query_cards(filters, search_columns, sort_order, 0, per_page + 1,
+                                 card_columns(fields, include))
+
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if backward:
+            rows.reverse()
+
+        next_cursor = None
+        prev_cursor = None
+        if rows:
+            first, last = rows[0], rows[-1]
+            if has_more or backward:
+                next_cursor = encode_cursor(last.price, last.book_id, sort_by_price, CURSOR_DIRECTION_NEXT)
+            if (has_more and backward) or (cursor is not None and not backward):
+                prev_cursor = encode_cursor(first.price, first.book_id, sort_by_price, CURSOR_DIRECTION_PREV)
+
+        result = {
+            "books": list(map(book_card_serializer(fields, include, bool(search_columns)), rows)),
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor
+        }
+        if with_total:
+            result["total_estimate"] = self.estimate_book_count(
+                search, min_price, max_price, genres, genres_match, city_id)
+        return result
+
+    def estimate_book_count(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None) -> int:
+        filters = self._build_filters(search, min_price, max_price, genres, genres_match, city_id)
+
+        # Without filters the planner statistics are as good as a count and cost nothing
+        if not filters:
+            stmt = text("SELECT reltuples::bigint FROM pg_class WHERE relname = 'book_cards'")
+            estimate = self.session.execute(stmt).scalar()
+            return max(int(estimate or 0), 0)
+
+        # Otherwise ask the planner for its row estimate instead of running a count(*)
+        stmt = select(cards.book_id).where(and_(*filters))
+        compiled = stmt.compile(dialect=self.session.bind.dialect,
+                                compile_kwargs={"render_postcompile": True})
+        plan = (self.session.connection()
+                .exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params)
+                .scalar())
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def get_book_facets(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None) -> dict:
+        filters = self._build_filters(search, min_price, max_price, genres, genres_match, city_id)
+        filtered = (select(cards.book_id, cards.genres, cards.city_ids, cards.price)
+                    .where(and_(*filters))
+                    .cte("filtered"))
+
+        # Every book is expanded to one row per (genre, city) pair and then counted once per facet value
+        genre = func.unnest(filtered.c.genres).table_valued("value").render_derived().lateral("genre")
+        city = func.unnest(filtered.c.city_ids).table_valued("value").render_derived().lateral("city")
+        bucket = func.width_bucket(filtered.c.price, array(BOOK_FACET_PRICE_BUCKETS)).label("bucket")
+        counts = (
+            select(
+                genre.c.value.label("genre"),
+                city.c.value.label("city_id"),
+                bucket,
+                func.grouping(genre.c.value, city.c.value, bucket).label("dimension_mask"),
+                func.count(filtered.c.book_id.distinct()).label("count"))
+            .select_from(filtered
+                         .outerjoin(genre, true())
+                         .outerjoin(city, true()))
+            .group_by(func.grouping_sets(
+                tuple_(genre.c.value), tuple_(city.c.value), tuple_(bucket), tuple_()))
+            .subquery("counts")
+        )
+        stmt = (
+            select(counts, city_table.c.title.label("city_title"))
+            .select_from(counts.outerjoin(city_table, city_table.c.id == counts.c.city_id))
+            .order_by(counts.c.count.desc())
+        )
+
+        # grouping() has one bit per dimension, set for the dimensions rolled up in that row
+        facets = {"total": 0, "genres": [], "cities": [], "price_buckets": []}
+        for row in self.session.execute(stmt):
+            if row.dimension_mask == 0b011:
+                if row.genre is not None:
+                    facets["genres"].append({"genre": row.genre, "count": row.count})
+            elif row.dimension_mask == 0b101:
+                if row.city_id is not None:
+                    facets["cities"].append({"id": row.city_id, "title": row.city_title, "count": row.count})
+            elif row.dimension_mask == 0b110:
+                facets["price_buckets"].append({**_price_bucket_bounds(row.bucket), "count": row.count})
+            else:
+                facets["total"] = row.count
+
+        facets["genres"] = facets["genres"][:BOOK_FACET_LIMIT]
+        facets["cities"] = facets["cities"][:BOOK_FACET_LIMIT]
+        facets["price_buckets"].sort(key=lambda price_bucket: price_bucket["min"] or 0)
+        return facets
+
+    def get_reserved_book_cards(self, member_id: int):
+        reserved_book_ids = select(reservation_table.c.book_id).where(
+            and_(reservation_table.c.member_id == member_id, reservation_table.c.released_at.is_(None)))
+        rows = self.session.execute(
+            select(*CARD_COLUMNS).where(cards.book_id.in_(reserved_book_ids)).order_by(cards.book_id)
+        ).all()
+        return list(map(book_card_serializer(), rows))
+
+    def get_book_cards_by_ids(self, book_ids: list[int], fields: Optional[tuple] = None,
+                              include: Optional[tuple] = None):
+        if not book_ids:
+            return []
+        rows = self.session.execute(
+            select(*card_columns(fields, include)).where(cards.book_id.in_(book_ids))).all()
+        # Keep the order the ids were given in, callers pass an already sorted page
+        serialize = book_card_serializer(fields, include)
+        by_id = {row.book_id: serialize(row) for row in rows}
+        return [by_id[book_id] for book_id in book_ids if book_id in by_id]
+
+    def stream_book_cards(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        batch_size: int = 1000) -> Iterator[dict]:
+        filters = self._build_filters(search, min_price, max_price, genres, genres_match, city_id)
+        # Ordering by id lets a client resume an interrupted export from the last id it saw
+        if after_id is not None:
+            filters.append(cards.book_id > after_id)
+        stmt = (select(*CARD_COLUMNS)
+                .where(and_(*filters))
+                .order_by(cards.book_id)
+                .execution_options(stream_results=True, yield_per=batch_size))
+        serialize = book_card_serializer()
+        for row in self.session.execute(stmt):
+            yield serialize(row)
+
+    def _query_cards(self, filters: list, search_columns: tuple, sort_order: tuple, offset: int, limit: int,
+                     columns: tuple = CARD_COLUMNS) -> list:
+        stmt = (select(*columns, *search_columns)
+                .where(and_(*filters))
+                .order_by(*sort_order)
+                .offset(offset)
+                .limit(limit))
+        return self.session.execute(stmt).all()
+
+    def _search_columns(self, search: Optional[str]) -> tuple:
+        if not search:
+            return ()
+        query = search_query(search)
+        rank = (func.ts_rank_cd(cards.search_vector, query) + func.similarity(cards.title, search)).label("rank")
+        # Titles are user input and the highlight carries <mark> markup, so the title is HTML escaped first
+        title = func.replace(func.replace(func.replace(cards.title, '&', '&amp;'), '<', '&lt;'), '>', '&gt;')
+        highlight = func.ts_headline(search_config(), title, query,
+                                     BOOK_SEARCH_HIGHLIGHT_OPTIONS).label("highlight")
+        return rank, highlight
+
+    def _build_filters(self,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None) -> list:
+        filters = []
+
+        # Collect filter conditions
+        if search:
+            # Either the full-text index or the trigram index can answer this
+            filters.append(or_(cards.search_vector.op('@@')(search_query(search)),
+                               cards.title.op('%')(search)))
+        if min_price is not None:
+            filters.append(cards.price >= min_price)
+        if max_price is not None:
+            filters.append(cards.price <= max_price)
+        if genres:
+            # Array containment/overlap is answered by the GIN index on book_cards.genres
+            if genres_match == 'all':
+                filters.append(cards.genres.contains(normalize_genres(genres)))
+            else:
+                filters.append(cards.genres.overlap(normalize_genres(genres)))
+        if city_id is not None:
+            # The card keeps its authors' city ids, so no join is needed for this filter
+            filters.append(cards.city_ids.contains([city_id]))
+        return filters
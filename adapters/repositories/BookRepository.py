@@ -3,34 +3,40 @@ from platform import version
 from time import sleep
 from typing import Optional, Set
 
-from sqlalchemy import and_, update
+from sqlalchemy import and_, update, func, cast, select
+from sqlalchemy.dialects.postgresql import REGCONFIG, insert
 from sqlalchemy.orm.exc import StaleDataError
 
 from adapters.repositories.AbstractSqlAlchemyRepository import AbstractSqlAlchemyRepository
+from adapters.table_mapping import book_table, book_author_association
+from config import BOOK_SEARCH_TEXT_CONFIG
 from domains.models.BookManagementModels import Author
-from domains.models.BookManagementModels import Book
+from domains.models.BookManagementModels import Book, ReservationStatus
+from exceptions.BaseException import BookIsReservedError
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.orm.attributes import set_committed_value
 
+def search_config():
+    return cast(BOOK_SEARCH_TEXT_CONFIG, REGCONFIG)
+
+
+def search_query(search: str):
+    return func.websearch_to_tsquery(search_config(), search)
+
+
+def search_vector_expression(title, genres_text):
+    # Titles weigh more than genres when ranking
+    return (func.setweight(func.to_tsvector(search_config(), func.coalesce(title, '')), 'A')
+            .op('||')(func.setweight(func.to_tsvector(search_config(), func.coalesce(genres_text, '')), 'B')))
+
+
 class AbstractBookRepository(ABC):
 
     @abstractmethod
     def get_book_list(self):
         raise NotImplementedError
 
-    @abstractmethod
-    def get_book_list_filtered(self,
-        search: Optional[str] = None,
-        min_price: Optional[float] = None,
-        max_price: Optional[float] = None,
-        genres: Optional[str] = None,
-        city_id: Optional[int] = None,
-        page: int = 1,
-        per_page: int = 10,
-        sort_by_price: str = 'asc'):
-        raise NotImplementedError
-
     @abstractmethod
     def add_book(self,book:Book)->Book:
         raise NotImplementedError
@@ -52,7 +58,23 @@ class AbstractBookRepository(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def set_to_reserved(self,book:Book,reservation_id:int):
+    def claim_for_reservation(self, book_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_books_for_reservation(self, book_ids: list[int]) -> list:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_catalog_rows(self, book_ids: Optional[list[int]] = None) -> list[tuple]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_existing_isbns(self, isbns: list[str]) -> set[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_books_bulk(self, books: list[dict]) -> dict[str, int]:
         raise NotImplementedError
         
 class BookRepository(AbstractSqlAlchemyRepository,AbstractBookRepository):
@@ -65,72 +87,22 @@ class BookRepository(AbstractSqlAlchemyRepository,AbstractBookRepository):
         books = super().list()
         return books
 
-    def get_book_list_filtered(self,
-        search: Optional[str] = None,
-        min_price: Optional[float] = None,
-        max_price: Optional[float] = None,
-        genres: Optional[str] = None,
-        city_id: Optional[int] = None,
-        page: int = 1,
-        per_page: int = 10,
-        sort_by_price: str = 'asc'):
-
-        filters = []
-
-        # Collect filter conditions
-        if search:
-            filters.append(Book.title.ilike(f"%{search}%"))
-        if min_price is not None:
-            filters.append(Book.price >= min_price)
-        if max_price is not None:
-            filters.append(Book.price <= max_price)
-        if genres is not None:
-            filters.append(Book.genres.ilike(f"%{genres}%"))
-        if city_id is not None:
-            filters.append(Author.city_id == city_id)
-
-        # Sorting
-        sort_order = Book.price.asc() if sort_by_price == 'asc' else Book.price.desc()
-
-        books = (self.session
-                 .query(Book)
-                 .options(joinedload(Book.authors)
-                          .joinedload(Author.city))
-                 .filter(and_(*filters))
-                 .order_by(sort_order)
-                 .offset((page-1)*per_page)).all()
-
-        result = []
-        for book in books:
-            book_data = {
-                "id": book.id,
-                "title": book.title,
-                "genres": book.genres,
-                "isbn": book.isbn,
-                "release_date": book.release_date,
-                "price": book.price,
-                "status":book.status.value,
-                "authors": []  # Start with an empty list for authors
-            }
-
-            # Iterate over the authors and serialize their data
-            for author in book.authors:
-                author_data = {
-                    "id": author.id,
-                    "first_name": author.first_name,
-                    "last_name": author.last_name,
-                    "city":{
-                        "id":author.city.id,
-                        "title":author.city.title
-                    }
-                }
-                book_data["authors"].append(author_data)
-            result.append(book_data)
-
-        return result
+    def _refresh_search_vector(self, book_id: int, title=None, genres=None) -> None:
+        # Without explicit values the vector is rebuilt from the row as currently stored
+        stmt = (
+            update(Book)
+            .where(Book.id == book_id)
+            .values(search_vector=search_vector_expression(
+                Book.title if title is None else title,
+                func.array_to_string(Book.genres, ' ') if genres is None else ' '.join(genres)))
+        )
+        super().execute(stmt)
 
     def add_book(self, book):
-        super().add(book)
+        self.session.add(book)
+        self.session.flush()
+        self._refresh_search_vector(book.id)
+        self.session.commit()
         self.seen.add(book)
         return book
 
@@ -163,6 +135,8 @@ class BookRepository(AbstractSqlAlchemyRepository,AbstractBookRepository):
         if result.rowcount == 0:
             raise StaleDataError("The book has been modified by another transaction.")
 
+        self._refresh_search_vector(book_id, book.title, book.genres)
+
         # Step 3: Update authors relationship
         # Directly assign the authors list to the existing_book's authors relationship
         existing_book.authors = book.authors
@@ -171,10 +145,81 @@ class BookRepository(AbstractSqlAlchemyRepository,AbstractBookRepository):
         self.session.flush()  # Flush pending changes to the database
         self.session.refresh(existing_book)  # Refresh to reflect the new state
         self.session.commit()
+        self.seen.add(existing_book)
 
         # Optional: Print for confirmation
         print("Book updated successfully with new authors and version.")
 
+    def get_catalog_rows(self, book_ids: Optional[list[int]] = None) -> list[tuple]:
+        # (id, price, status, author ids) per book, in a single grouped query
+        stmt = (
+            select(Book.id, Book.price, Book.status,
+                   func.array_remove(func.array_agg(book_author_association.c.author_id), None))
+            .select_from(book_table.outerjoin(book_author_association,
+                                              book_author_association.c.book_id == book_table.c.id))
+            .group_by(Book.id)
+        )
+        if book_ids is not None:
+            stmt = stmt.where(Book.id.in_(book_ids))
+        return [tuple(row) for row in self.session.execute(stmt)]
+
+    def claim_books_for_reservation(self, book_ids: list[int]) -> list:
+        # All pending books of the set are locked in id order, so two overlapping requests always
+        # lock in the same order and cannot deadlock, then claimed by the same statement.
+        # Books that are reserved, missing or claimed meanwhile are simply not returned.
+        claimable = (
+            select(book_table.c.id)
+            .where(and_(book_table.c.id.in_(book_ids), book_table.c.status == ReservationStatus.PENDING))
+            .order_by(book_table.c.id)
+            .with_for_update()
+            .cte("claimable")
+        )
+        stmt = (
+            update(book_table)
+            .where(book_table.c.id == claimable.c.id)
+            .values(status=ReservationStatus.RESERVED, version=book_table.c.version + 1)
+            .returning(book_table.c.id, book_table.c.price)
+        )
+        return sorted(super().execute(stmt).all(), key=lambda book: book.id)
+
+    def get_existing_isbns(self, isbns: list[str]) -> set[str]:
+        if not isbns:
+            return set()
+        rows = self.session.execute(select(Book.isbn).where(Book.isbn.in_(isbns)))
+        return {row.isbn for row in rows}
+
+    def add_books_bulk(self, books: list[dict]) -> dict[str, int]:
+        # One multi-row INSERT per chunk; ISBNs that lost a race are skipped instead of failing the chunk
+        values = [
+            {
+                "title": book["title"],
+                "genres": book["genres"],
+                "release_date": book["release_date"],
+                "isbn": book["isbn"],
+                "price": book["price"],
+                "status": ReservationStatus.PENDING,
+                "version": 0,
+                "search_vector": search_vector_expression(book["title"], ' '.join(book["genres"]))
+            }
+            for book in books
+        ]
+        stmt = (
+            insert(book_table)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=[book_table.c.isbn])
+            .returning(book_table.c.id, book_table.c.isbn)
+        )
+        inserted = {row.isbn: row.id for row in self.session.execute(stmt)}
+
+        associations = [
+            {"book_id": inserted[book["isbn"]], "author_id": author_id}
+            for book in books if book["isbn"] in inserted
+            for author_id in dict.fromkeys(book["author_ids"])
+        ]
+        if associations:
+            self.session.execute(insert(book_author_association).values(associations))
+        return inserted
+
     def get_book_by_id(self, id:int):
         book = super().get(id)
         if book is None:
@@ -197,19 +242,18 @@ class BookRepository(AbstractSqlAlchemyRepository,AbstractBookRepository):
             print(f"An error occurred: {e}")  # Optionally log the error
             return False  # An error occurred, deletion failed
 
-    def set_to_reserved(self, book:Book,reservation_id:int):
-        book.set_to_reserved(reservation_id)
-        existing_book = self.get_book_by_id(book.id)
+    def claim_for_reservation(self, book_id: int):
+        # One conditional UPDATE both checks and takes the book. Concurrent claims queue on the row lock
+        # only until the winner commits, then match no row and fail instead of reserving twice.
         stmt = (
-            update(Book)
-            .where(and_(Book.version == existing_book.version))
-            .values(
-                status=book.status,
-                version=book.version+1 )
+            update(book_table)
+            .where(and_(book_table.c.id == book_id, book_table.c.status == ReservationStatus.PENDING))
+            .values(status=ReservationStatus.RESERVED, version=book_table.c.version + 1)
+            .returning(book_table.c.id, book_table.c.price)
         )
-        result = super().execute(stmt)
-        if not result:
-            raise StaleDataError("The book has been modified by another transaction.")
-        super().add(book)
-    
-    
\ No newline at end of file
+        claimed = super().execute(stmt).first()
+        if claimed is None:
+            if self.session.execute(select(book_table.c.id).where(book_table.c.id == book_id)).first() is None:
+                raise NoResultFound("Book not found.")
+            raise BookIsReservedError()
+        return claimed
@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 from adapters.repositories.AbstractSqlAlchemyRepository import AbstractSqlAlchemyRepository
 from domains.models.BookManagementModels import City
 
+CITY_FIELDS = ("id", "title")
 
 class AbstractCityRepository(abc.ABC):
     @abstractmethod
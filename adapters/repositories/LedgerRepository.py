@@ -0,0 +1,103 @@
+from abc import abstractmethod, ABC
+from datetime import datetime
+from typing import Set
+
+from sqlalchemy import select, func, true, literal, insert, and_, or_
+from sqlalchemy.orm import Session
+
+from adapters.table_mapping import member_table, payment_table, balance_snapshot_table
+
+members = member_table.c
+payments = payment_table.c
+snapshots = balance_snapshot_table.c
+
+
+class AbstractLedgerRepository(ABC):
+
+    @abstractmethod
+    def lock_members(self, after_id: int, limit: int) -> list[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def take_snapshots(self, member_ids: list[int], taken_at: datetime) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def reconcile_balances(self, after_id: int, limit: int) -> list:
+        raise NotImplementedError
+
+
+class LedgerRepository(AbstractLedgerRepository):
+    def __init__(self, session: Session):
+        self.session = session
+        self.seen = set()  # type: Set
+
+    def lock_members(self, after_id: int, limit: int) -> list[int]:
+        # Every ledger write updates the member row first and keeps it locked until it commits,
+        # so while these locks are held no entry of these members is in flight
+        stmt = (
+            select(members.id)
+            .where(members.id > after_id)
+            .order_by(members.id)
+            .limit(limit)
+            .with_for_update()
+        )
+        return list(self.session.execute(stmt).scalars())
+
+    def take_snapshots(self, member_ids: list[int], taken_at: datetime) -> int:
+        # Must run as its own statement after lock_members, so it sees the entries committed while waiting.
+        # A snapshot is the previous one plus the entries after it, read from the ledger only: the stored
+        # balance is what reconciliation audits, so it never becomes an opening balance here.
+        # Members without new entries are skipped, members without any snapshot open at 0.
+        previous = (
+            select(snapshots.balance, snapshots.last_payment_id)
+            .where(snapshots.member_id == members.id)
+            .order_by(snapshots.id.desc())
+            .limit(1)
+            .lateral("previous")
+        )
+        source = (
+            select(members.id,
+                   func.coalesce(previous.c.balance, 0) + func.coalesce(func.sum(payments.amount), 0),
+                   func.coalesce(func.max(payments.id), previous.c.last_payment_id, 0),
+                   literal(taken_at))
+            .select_from(member_table
+                         .outerjoin(previous, true())
+                         .outerjoin(payment_table, and_(payments.member_id == members.id,
+                                                        payments.id > func.coalesce(previous.c.last_payment_id, 0))))
+            .where(members.id.in_(member_ids))
+            .group_by(members.id, previous.c.balance, previous.c.last_payment_id)
+            .having(or_(func.count(payments.id) > 0, previous.c.last_payment_id.is_(None)))
+        )
+        stmt = insert(balance_snapshot_table).from_select(
+            [snapshots.member_id, snapshots.balance, snapshots.last_payment_id, snapshots.taken_at], source)
+        return self.session.execute(stmt).rowcount
+
+    def reconcile_balances(self, after_id: int, limit: int) -> list:
+        # Stored balance next to latest snapshot + entries after it, both read by one statement.
+        # Entry ids of one member grow in commit order since writers queue on the member row.
+        # Members without a snapshot are left out until the next snapshot pass opens their ledger.
+        # Balances that predate the ledger get their opening snapshot from the migration.
+        snapshot = (
+            select(snapshots.balance, snapshots.last_payment_id)
+            .where(snapshots.member_id == members.id)
+            .order_by(snapshots.id.desc())
+            .limit(1)
+            .lateral("snapshot")
+        )
+        replayed = (
+            select(func.coalesce(func.sum(payments.amount), 0))
+            .where(payments.member_id == members.id,
+                   payments.id > snapshot.c.last_payment_id)
+            .scalar_subquery()
+        )
+        stmt = (
+            select(members.id.label("member_id"),
+                   func.coalesce(members.balance, 0).label("balance"),
+                   (snapshot.c.balance + replayed).label("ledger_balance"))
+            .select_from(member_table.join(snapshot, true()))
+            .where(members.id > after_id)
+            .order_by(members.id)
+            .limit(limit)
+        )
+        return self.session.execute(stmt).all()
@@ -1,15 +1,24 @@
 from abc import abstractmethod,ABC
+from datetime import datetime
+from typing import Optional, Set
 
-from sqlalchemy.orm import Session
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import update, and_, func
+from sqlalchemy.orm import Session, load_only
 
 from adapters.repositories.AbstractSqlAlchemyRepository import AbstractSqlAlchemyRepository
-from domains.models.MemberManagementModels import Member
+from adapters.table_mapping import member_table
+from config import MEMBER_PREMIUM_COST, MEMBER_PREMIUM_Period_Month
+from domains.models.MemberManagementModels import Member, MembershipType
+from exceptions.BaseException import MemberDoesNotExistError, AlreadyPremiumError, NotEnoughBudgetError
+
+MEMBER_FIELDS = ("id", "first_name", "last_name", "phone_number", "membership_type", "membership_expiry", "balance")
 
 
 class AbstractMemberRepository(ABC):
 
     @abstractmethod
-    def get_members_list(self):
+    def get_members_list(self, fields: Optional[tuple] = None):
         raise NotImplementedError
 
     @abstractmethod
@@ -25,22 +34,25 @@ class AbstractMemberRepository(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def add_to_balance(self,member_id,amount:int)-> None:
+    def add_to_balance(self,member_id,amount:int)-> int:
         raise NotImplementedError
 
     @abstractmethod
-    def set_vip(self, member_id: int):
+    def set_vip(self, member_id: int) -> int:
         raise NotImplementedError
 
 
 class MemberRepository(AbstractSqlAlchemyRepository,AbstractMemberRepository):
     def __init__(self,session:Session):
         super().__init__(session,Member)
-        self.seen = set[Member]
+        self.seen = set()  # type: Set[Member]
 
-    def get_members_list(self):
-        members = super().list()
-        return members
+    def get_members_list(self, fields=None):
+        fields = MEMBER_FIELDS if fields is None else fields
+        return (self.session.query(Member)
+                .options(load_only(*[getattr(Member, name) for name in fields]))
+                .order_by(Member.id)
+                .all())
 
     def add_member(self, member:Member)-> Member:
         super().add(member)
@@ -55,12 +67,38 @@ class MemberRepository(AbstractSqlAlchemyRepository,AbstractMemberRepository):
         member = query.filter(Member.phone_number == phone_number).first()
         return  member
 
-    def add_to_balance(self,member_id:int,amount:int)-> None:
-        member = super().get(member_id)
-        member.add_to_balance(amount)
-        super().add(member)
-
-    def set_vip(self,member_id:int):
-        member = super().get(member_id)
-        member.set_vip()
-        super().add(member)
+    def add_to_balance(self,member_id:int,amount:int)-> int:
+        # The database adds to the stored value under the row lock, so concurrent deposits queue
+        # instead of overwriting each other. The lock is held until the ledger entry commits with it.
+        stmt = (
+            update(member_table)
+            .where(member_table.c.id == member_id)
+            .values(balance=func.coalesce(member_table.c.balance, 0) + amount)
+            .returning(member_table.c.balance)
+        )
+        balance = super().execute(stmt).scalar()
+        if balance is None:
+            raise MemberDoesNotExistError()
+        return balance
+
+    def set_vip(self,member_id:int)-> int:
+        # Charging and upgrading is one conditional UPDATE, the balance can not be spent twice
+        stmt = (
+            update(member_table)
+            .where(and_(member_table.c.id == member_id,
+                        member_table.c.membership_type != MembershipType.PREMIUM,
+                        func.coalesce(member_table.c.balance, 0) >= MEMBER_PREMIUM_COST))
+            .values(balance=member_table.c.balance - MEMBER_PREMIUM_COST,
+                    membership_type=MembershipType.PREMIUM,
+                    membership_expiry=datetime.now() + relativedelta(months=MEMBER_PREMIUM_Period_Month))
+            .returning(member_table.c.balance)
+        )
+        balance = super().execute(stmt).scalar()
+        if balance is None:
+            member = super().get(member_id)
+            if member is None:
+                raise MemberDoesNotExistError()
+            if member.membership_type == MembershipType.PREMIUM:
+                raise AlreadyPremiumError()
+            raise NotEnoughBudgetError()
+        return balance
@@ -1,11 +1,22 @@
 from abc import ABC, abstractmethod
 
-import redis.asyncio as redis
+from adapters.redis_connection import RedisConnectionManager
 
-from config import get_redis_host_and_port
+# Deletes the key only while it still holds the given value, so a late caller never removes a newer entry
+DELETE_IF_EQUAL_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
 
-# Initialize Redis connection
-redis = redis.Redis(**get_redis_host_and_port(), db=0)
+# Extends the expiry only while the key still holds the given value, so a lost lease is never revived
+EXPIRE_IF_EQUAL_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
 
 class AbstractMemoryCacheRepository(ABC):
 
@@ -21,14 +32,78 @@ class AbstractMemoryCacheRepository(ABC):
     def delete(self, key):
         raise NotImplementedError
 
+    @abstractmethod
+    def incr(self, key, amount: int = 1):
+        raise NotImplementedError
+
 
+# Both repositories borrow the shared clients of the Redis connection manager they are given,
+# creating one costs nothing
 class MemoryCacheRepository(AbstractMemoryCacheRepository):
+    def __init__(self, redis_manager: RedisConnectionManager):
+        self.manager = redis_manager
 
     async def get(self, key):
-        return await redis.get(key)
+        return await self.manager.async_client.get(key)
 
     async def set(self, key, value, expires:int):
-        await redis.set(key, value, expires)
+        await self.manager.async_client.set(key, value, expires)
 
     async def delete(self, key):
-        await redis.delete(key)
\ No newline at end of file
+        await self.manager.async_client.delete(key)
+
+    async def incr(self, key, amount: int = 1):
+        return await self.manager.async_client.incr(key, amount)
+
+    async def get_many(self, keys: list):
+        return await self.manager.async_client.mget(keys)
+
+    async def publish(self, channel: str, message: str):
+        return await self.manager.async_client.publish(channel, message)
+
+    async def run_script(self, source: str, keys: list, args: list):
+        return await self.manager.register_async_script(source)(keys=keys, args=args)
+
+    def pipeline(self):
+        return self.manager.async_pipeline()
+
+
+class SyncMemoryCacheRepository(AbstractMemoryCacheRepository):
+    def __init__(self, redis_manager: RedisConnectionManager):
+        self.manager = redis_manager
+
+    def get(self, key):
+        return self.manager.sync_client.get(key)
+
+    def set(self, key, value, expires:int):
+        self.manager.sync_client.set(key, value, expires)
+
+    def delete(self, key):
+        self.manager.sync_client.delete(key)
+
+    def incr(self, key, amount: int = 1):
+        return self.manager.sync_client.incr(key, amount)
+
+    def publish(self, channel: str, message: str):
+        return self.manager.sync_client.publish(channel, message)
+
+    def zrem(self, key, *members):
+        return self.manager.sync_client.zrem(key, *members)
+
+    def set_if_absent(self, key, value, expires: int) -> bool:
+        return bool(self.manager.sync_client.set(key, value, ex=expires, nx=True))
+
+    def delete_if_equal(self, key, value) -> bool:
+        return bool(self.run_script(DELETE_IF_EQUAL_SCRIPT, [key], [value]))
+
+    def expire_if_equal(self, key, value, expires: int) -> bool:
+        return bool(self.run_script(EXPIRE_IF_EQUAL_SCRIPT, [key], [value, expires]))
+
+    def run_script(self, source: str, keys: list, args: list):
+        return self.manager.register_script(source)(keys=keys, args=args)
+
+    def pipeline(self):
+        return self.manager.pipeline()
+
+    def pubsub(self):
+        return self.manager.sync_client.pubsub(ignore_subscribe_messages=True)
@@ -1,8 +1,11 @@
 from abc import ABC, abstractmethod
 from datetime import datetime
+from typing import Set
+
+from sqlalchemy import select, func, and_
 
 from adapters.repositories.AbstractSqlAlchemyRepository import AbstractSqlAlchemyRepository
-from domains.models.PaymentModels import Payment
+from domains.models.PaymentModels import Payment, LedgerEntryType
 
 
 class AbstractPaymentRepository(ABC):
@@ -15,16 +18,34 @@ class AbstractPaymentRepository(ABC):
     def get_payments_by_dates(self,member_id:int,start_date:datetime, end_date:datetime):
         raise NotImplementedError
 
+    @abstractmethod
+    def get_payments_total(self, member_id: int, start_date: datetime, end_date: datetime) -> int:
+        raise NotImplementedError
+
 class PaymentRepository(AbstractSqlAlchemyRepository,AbstractPaymentRepository):
     def __init__(self,session):
         self.session = session
-        self.seen = set[Payment]
+        self.seen = set()  # type: Set[Payment]
         super().__init__(session,Payment)
 
     def add_payment(self, payment:Payment):
-        super().add(payment)
+        # Committed together with the balance change by the unit of work
+        self.session.add(payment)
+        self.seen.add(payment)
 
     def get_payments_by_dates(self,member_id:int,start_date:datetime, end_date:datetime):
         query = self.session.query(Payment)
-        payments = query.filter(Payment.member_id == member_id)
-        return payments
+        payments = query.filter(Payment.member_id == member_id,
+                                Payment.payment_date >= start_date,
+                                Payment.payment_date < end_date)
+        return payments.all()
+
+    def get_payments_total(self, member_id: int, start_date: datetime, end_date: datetime) -> int:
+        # Summed by the database over the (member_id, payment_date) index, no rows are loaded.
+        # Only money paid in counts, charges such as the premium purchase are ledger entries too
+        stmt = select(func.coalesce(func.sum(Payment.amount), 0)).where(
+            and_(Payment.member_id == member_id,
+                 Payment.entry_type == LedgerEntryType.DEPOSIT,
+                 Payment.payment_date >= start_date,
+                 Payment.payment_date < end_date))
+        return int(self.session.execute(stmt).scalar())
@@ -1,9 +1,13 @@
 from abc import abstractmethod,ABC
+from datetime import datetime
+from typing import Set, Optional
 
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, update, and_, func
+from sqlalchemy.orm import Session
 
 from adapters.repositories.AbstractSqlAlchemyRepository import AbstractSqlAlchemyRepository
-from domains.models.BookManagementModels import Reservation
+from adapters.table_mapping import reservation_table, book_table
+from domains.models.BookManagementModels import Reservation, ReservationStatus
 
 
 class AbstractReservationRepository(ABC):
@@ -13,48 +17,81 @@ class AbstractReservationRepository(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def get_reserved_books(self,member_id):
+    def reserve_many(self, reservations: list[Reservation]) -> list[Reservation]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_member_reservations(self, member_id: int, start_date: datetime, end_date: datetime) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_expired(self, now: datetime, batch_size: int) -> list[tuple]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_oldest_expired_end_date(self, now: datetime) -> Optional[datetime]:
         raise NotImplementedError
 
 
 class ReservationRepository(AbstractSqlAlchemyRepository,AbstractReservationRepository):
     def __init__(self,session:Session):
         super().__init__(session,Reservation)
-        self.seen = set[Reservation]
+        self.seen = set()  # type: Set[Reservation]
 
     def reserve(self,reservation:Reservation):
-        super().add(reservation)
+        # Flushed only, the caller's unit of work commits it together with the book claim
+        self.session.add(reservation)
+        self.session.flush()
+        self.seen.add(reservation)
         return reservation
 
-    def get_reserved_books(self,member_id):
-        query = self.session.query(Reservation)
-        reserved_books = query.options(joinedload(Reservation.member),joinedload(Reservation.book)).filter(Reservation.member_id == member_id).all()
-        result = []
-
-        for reserve in reserved_books:
-            book = reserve.book
-            # Now we can serialize the book with all the author data
-            book_data = {
-                "id": book.id,
-                "title": book.title,
-                "genres": book.genres,
-                "isbn": book.isbn,
-                "release_date": book.release_date,
-                "price": book.price,
-                "status": book.status,
-                "authors": []  # Start with an empty list for authors
-            }
-            for author in book.authors:
-                author_data = {
-                    "id": author.id,
-                    "first_name": author.first_name,
-                    "last_name": author.last_name,
-                    "city":{
-                        "id":author.city.id,
-                        "title":author.city.title
-                    }
-                }
-                book_data["authors"].append(author_data)
-            result.append(book_data)
-
-        return result
+    def reserve_many(self, reservations: list[Reservation]) -> list[Reservation]:
+        # A single flush, the inserts go out as one batched statement
+        self.session.add_all(reservations)
+        self.session.flush()
+        self.seen.update(reservations)
+        return reservations
+
+    def count_member_reservations(self, member_id: int, start_date: datetime, end_date: datetime) -> int:
+        # Counted on the (member_id, start_date) index instead of loading the member's history
+        stmt = select(func.count()).where(
+            and_(reservation_table.c.member_id == member_id,
+                 reservation_table.c.start_date >= start_date,
+                 reservation_table.c.start_date < end_date))
+        return self.session.execute(stmt).scalar()
+
+    def release_expired(self, now: datetime, batch_size: int) -> list[tuple]:
+        # One statement per batch: pick the oldest expired active reservations through the partial
+        # end_date index, mark them released and put their books back to PENDING.
+        # SKIP LOCKED lets several sweepers work side by side without picking the same rows.
+        expired = (
+            select(reservation_table.c.id)
+            .where(and_(reservation_table.c.released_at.is_(None), reservation_table.c.end_date <= now))
+            .order_by(reservation_table.c.end_date)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .cte("expired")
+        )
+        released = (
+            update(reservation_table)
+            .where(reservation_table.c.id == expired.c.id)
+            .values(released_at=now)
+            .returning(reservation_table.c.id, reservation_table.c.book_id,
+                       reservation_table.c.member_id, reservation_table.c.end_date)
+            .cte("released")
+        )
+        books = (
+            update(book_table)
+            .where(and_(book_table.c.id == released.c.book_id,
+                        book_table.c.status == ReservationStatus.RESERVED))
+            .values(status=ReservationStatus.PENDING, version=book_table.c.version + 1)
+            .cte("released_books")
+        )
+        stmt = select(released.c.id, released.c.book_id, released.c.member_id, released.c.end_date).add_cte(books)
+        return self.session.execute(stmt).all()
+
+    def get_oldest_expired_end_date(self, now: datetime) -> Optional[datetime]:
+        return self.session.execute(
+            select(func.min(reservation_table.c.end_date))
+            .where(and_(reservation_table.c.released_at.is_(None), reservation_table.c.end_date <= now))
+        ).scalar()
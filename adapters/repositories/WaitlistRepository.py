@@ -0,0 +1,86 @@
+from abc import abstractmethod, ABC
+from datetime import datetime
+from typing import Optional, Set
+
+from sqlalchemy import select, delete, and_, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from adapters.table_mapping import waitlist_table
+
+entries = waitlist_table.c
+
+
+class AbstractWaitlistRepository(ABC):
+
+    @abstractmethod
+    def join(self, book_id: int, member_id: int, duration: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def leave(self, book_id: int, member_id: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_position(self, book_id: int, member_id: int) -> Optional[int]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def pop_next(self, book_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, entry_id: int) -> None:
+        raise NotImplementedError
+
+
+class WaitlistRepository(AbstractWaitlistRepository):
+    def __init__(self, session: Session):
+        self.session = session
+        self.seen = set()  # type: Set
+
+    def join(self, book_id: int, member_id: int, duration: int) -> None:
+        # Joining again keeps the original place in line
+        stmt = (
+            insert(waitlist_table)
+            .values(book_id=book_id, member_id=member_id, duration=duration, created_at=datetime.now())
+            .on_conflict_do_nothing(index_elements=[entries.book_id, entries.member_id])
+        )
+        self.session.execute(stmt)
+
+    def leave(self, book_id: int, member_id: int) -> bool:
+        result = self.session.execute(
+            delete(waitlist_table).where(and_(entries.book_id == book_id, entries.member_id == member_id)))
+        return result.rowcount > 0
+
+    def get_position(self, book_id: int, member_id: int) -> Optional[int]:
+        own = (select(entries.id)
+               .where(and_(entries.book_id == book_id, entries.member_id == member_id))
+               .correlate(None)
+               .scalar_subquery())
+        position = self.session.execute(
+            select(func.count()).where(and_(entries.book_id == book_id, entries.id <= own))
+        ).scalar()
+        return position or None
+
+    def pop_next(self, book_id: int):
+        # Takes the head of the queue. SKIP LOCKED keeps two handoffs of the same book from getting
+        # the same member, and a rollback puts the entry back in its original place.
+        head = (
+            select(entries.id)
+            .where(entries.book_id == book_id)
+            .order_by(entries.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .correlate(None)
+            .scalar_subquery()
+        )
+        stmt = (
+            delete(waitlist_table)
+            .where(entries.id == head)
+            .returning(entries.id, entries.member_id, entries.duration)
+        )
+        return self.session.execute(stmt).first()
+
+    def remove(self, entry_id: int) -> None:
+        self.session.execute(delete(waitlist_table).where(entries.id == entry_id))
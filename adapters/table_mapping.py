@@ -1,18 +1,24 @@
 from datetime import datetime
 
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Table, create_engine, Enum
-from sqlalchemy.orm import relationship, sessionmaker, registry
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Table, create_engine, Enum, Index, DDL, event, \
+    and_, UniqueConstraint
+from sqlalchemy.dialects.postgresql import TSVECTOR, ARRAY, JSONB
+from sqlalchemy.orm import relationship, sessionmaker, registry, deferred
 
 from config import SQLALCHEMY_DATABASE_URL
 from domains.models.BookManagementModels import City, Author, Book, ReservationStatus, Reservation
 from domains.models.MemberManagementModels import MembershipType, Member
-from domains.models.PaymentModels import Payment
+from domains.models.PaymentModels import Payment, LedgerEntryType
+from exceptions.BaseException import LedgerEntryImmutableError
 
 # Initialize a registry
 mapper_registry = registry()
 # Define the association table for many-to-many relationship between Book and Author
 metadata = mapper_registry.metadata
 
+# Trigram operators and index classes used by the fuzzy title search
+event.listen(metadata, 'before_create', DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 book_author_association = Table(
     'book_author_association',
     metadata,
@@ -42,25 +48,73 @@ book_table = Table(
     metadata,
     Column('id', Integer, primary_key=True, autoincrement=True),
     Column('title', String, nullable=False),
-    Column('genres', String, nullable=False),
+    Column('genres', ARRAY(String), nullable=False, default=list),
     Column('release_date', DateTime, nullable=False),
     Column('isbn', String, nullable=False, unique=True),
     Column('price', Integer, nullable=False),
     Column('status', Enum(ReservationStatus), nullable=False, default=ReservationStatus.PENDING),
-    Column('version', Integer, nullable=False)
+    Column('version', Integer, nullable=False),
+    Column('search_vector', TSVECTOR, nullable=True)
+)
+
+# Read model for book listings, one flat row per book maintained from book events.
+# Listing filters run here, so the search, genre and (price, id) keyset indexes live on this table
+book_card_table = Table(
+    'book_cards',
+    metadata,
+    Column('book_id', Integer, ForeignKey('books.id'), primary_key=True),
+    Column('title', String, nullable=False),
+    Column('genres', ARRAY(String), nullable=False),
+    Column('isbn', String, nullable=False),
+    Column('release_date', DateTime, nullable=False),
+    Column('price', Integer, nullable=False),
+    Column('status', String, nullable=False),
+    Column('city_ids', ARRAY(Integer), nullable=False),
+    Column('authors', JSONB, nullable=False),
+    Column('search_vector', TSVECTOR, nullable=True),
+    Column('updated_at', DateTime, nullable=False)
 )
 
+Index('ix_book_cards_price_book_id', book_card_table.c.price, book_card_table.c.book_id)
+Index('ix_book_cards_genres', book_card_table.c.genres, postgresql_using='gin')
+Index('ix_book_cards_city_ids', book_card_table.c.city_ids, postgresql_using='gin')
+Index('ix_book_cards_search_vector', book_card_table.c.search_vector, postgresql_using='gin')
+Index('ix_book_cards_title_trgm', book_card_table.c.title, postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+
 reservation_table = Table(
     'reservations',
     metadata,
     Column("id", Integer, nullable=False, primary_key=True, autoincrement=True),
-    Column("book_id", Integer, ForeignKey('books.id'), unique=True),  # Enforce one-to-one with unique=True
+    Column("book_id", Integer, ForeignKey('books.id'), nullable=False),
     Column("member_id", Integer, ForeignKey('members.id'), nullable=False),
     Column("start_date", DateTime, nullable=False),
     Column("end_date", DateTime, nullable=False),
-    Column("total_cost", Integer, nullable=False)
+    Column("total_cost", Integer, nullable=False),
+    Column("released_at", DateTime, nullable=True)
+)
+
+# A book has at most one active reservation, released ones are kept as history
+Index('ux_reservations_active_book_id', reservation_table.c.book_id, unique=True,
+      postgresql_where=reservation_table.c.released_at.is_(None))
+Index('ix_reservations_member_id_start_date', reservation_table.c.member_id, reservation_table.c.start_date)
+# The expiry sweeper only ever scans active reservations, so the index stays as small as the active set
+Index('ix_reservations_active_end_date', reservation_table.c.end_date,
+      postgresql_where=reservation_table.c.released_at.is_(None))
+
+# Members waiting for a reserved book, served in id (arrival) order
+waitlist_table = Table(
+    'waitlist_entries',
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("book_id", Integer, ForeignKey('books.id'), nullable=False),
+    Column("member_id", Integer, ForeignKey('members.id'), nullable=False),
+    Column("duration", Integer, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    UniqueConstraint("book_id", "member_id", name="uq_waitlist_entries_book_member")
 )
 
+Index('ix_waitlist_entries_book_id_id', waitlist_table.c.book_id, waitlist_table.c.id)
+
 member_table = Table(
     'members',
     metadata,
@@ -80,8 +134,27 @@ payment_table = Table(
     Column("amount", Integer, nullable=False, default=0),
     Column("member_id", Integer, ForeignKey('members.id'), nullable=False),
     Column('payment_date', DateTime, nullable=False, default=datetime.now()),
+    Column("entry_type", Enum(LedgerEntryType), nullable=False, default=LedgerEntryType.DEPOSIT,
+           server_default=LedgerEntryType.DEPOSIT.name),
+    Column("balance_after", Integer, nullable=True)
+)
+
+Index('ix_payments_member_id_payment_date', payment_table.c.member_id, payment_table.c.payment_date)
+Index('ix_payments_member_id_id', payment_table.c.member_id, payment_table.c.id)
+
+# Periodic per member balances, reconciliation only replays the ledger entries after the latest one
+balance_snapshot_table = Table(
+    'balance_snapshots',
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("member_id", Integer, ForeignKey('members.id'), nullable=False),
+    Column("balance", Integer, nullable=False),
+    Column("last_payment_id", Integer, nullable=False),
+    Column("taken_at", DateTime, nullable=False)
 )
 
+Index('ix_balance_snapshots_member_id_id', balance_snapshot_table.c.member_id, balance_snapshot_table.c.id)
+
 # Initialize database and session
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
@@ -135,6 +208,14 @@ def init_db():
 
 
 
+def _init_events(entity, _):
+    entity.events = []
+
+
+def _reject_ledger_change(mapper, connection, target):
+    raise LedgerEntryImmutableError()
+
+
 # Define the mapping manually
 def start_mappers():
     mapper_registry.map_imperatively(
@@ -167,24 +248,37 @@ def start_mappers():
         book_table,
         properties={
             'authors': relationship("Author", secondary=book_author_association, back_populates="books", default=list),
-            'reservation': relationship("Reservation", back_populates="book", uselist=False)
+            'reservation': relationship(
+                "Reservation",
+                primaryjoin=and_(book_table.c.id == reservation_table.c.book_id,
+                                 reservation_table.c.released_at.is_(None)),
+                uselist=False,
+                viewonly=True),
+            'search_vector': deferred(book_table.c.search_vector)
         }
     )
 
 
+    # Loaded books do not go through __init__, so give them an event list to record into
+    event.listen(Book, 'load', _init_events)
+
     mapper_registry.map_imperatively(
         Payment,
         payment_table
     )
+    # Payments are the ledger, a correction is a new entry and never an edit of an old one
+    event.listen(Payment, 'before_update', _reject_ledger_change)
+    event.listen(Payment, 'before_delete', _reject_ledger_change)
 
     mapper_registry.map_imperatively(
         Reservation,
         reservation_table,
 
         properties={
-            'book': relationship(Book, back_populates="reservation", foreign_keys=[reservation_table.c.book_id]),
+            'book': relationship(Book, foreign_keys=[reservation_table.c.book_id]),
             'member': relationship(Member, back_populates='reservations')
         }
     )
+    event.listen(Reservation, 'load', _init_events)
 
     init_db()
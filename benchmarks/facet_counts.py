@@ -0,0 +1,89 @@
+# Runs the /books/facets query against a real database: seeds a few tagged books with known genres,
+# cities and prices, checks every facet count returned by get_book_facets, then reports its latency.
+# Needs the database configured in DatabaseConf.env:
+#     python -m benchmarks.facet_counts --iterations 200
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import delete
+
+from adapters import table_mapping
+from adapters.repositories.BookCardRepository import BookCardRepository
+from adapters.table_mapping import author_table, book_author_association, book_card_table, book_table, city_table
+from domains.models.BookManagementModels import Author, Book, City
+from services.UnitOfWork import UnitOfWork
+
+
+def create_fixtures(tag: str) -> tuple[list[int], list[int], list[int]]:
+    with UnitOfWork() as uow:
+        cities = [City(f"Facet {tag} {i}") for i in range(2)]
+        authors = [Author("Facet", f"Author{i}", city) for i, city in enumerate(cities)]
+        books = [
+            Book(f"Facet {tag} 0", [tag, f"{tag}-drama"], datetime.now(), f"facet-{tag}-0", 50000),
+            Book(f"Facet {tag} 1", [tag], datetime.now(), f"facet-{tag}-1", 300000),
+            Book(f"Facet {tag} 2", [tag, f"{tag}-drama"], datetime.now(), f"facet-{tag}-2", 320000),
+        ]
+        books[0].authors = [authors[0]]
+        books[1].authors = [authors[0], authors[1]]
+        books[2].authors = [authors[1]]
+        uow.session.add_all(books)
+        uow.session.flush()
+        book_ids = [book.id for book in books]
+        city_ids = [city.id for city in cities]
+        author_ids = [author.id for author in authors]
+        uow.session.commit()
+        uow.get_repository(BookCardRepository).refresh_book_cards(book_ids)
+        return book_ids, city_ids, author_ids
+
+
+def drop_fixtures(book_ids: list[int], city_ids: list[int], author_ids: list[int]):
+    with UnitOfWork() as uow:
+        uow.session.execute(delete(book_card_table).where(book_card_table.c.book_id.in_(book_ids)))
+        uow.session.execute(delete(book_author_association).where(book_author_association.c.book_id.in_(book_ids)))
+        uow.session.execute(delete(book_table).where(book_table.c.id.in_(book_ids)))
+        uow.session.execute(delete(author_table).where(author_table.c.id.in_(author_ids)))
+        uow.session.execute(delete(city_table).where(city_table.c.id.in_(city_ids)))
+        uow.session.commit()
+
+
+def check_facets(facets: dict, tag: str, city_ids: list[int]):
+    genres = {facet["genre"]: facet["count"] for facet in facets["genres"]}
+    cities = {facet["id"]: facet["count"] for facet in facets["cities"]}
+    buckets = {(facet["min"], facet["max"]): facet["count"] for facet in facets["price_buckets"]}
+    assert facets["total"] == 3, facets
+    assert genres == {tag: 3, f"{tag}-drama": 2}, genres
+    assert cities == {city_ids[0]: 2, city_ids[1]: 2}, cities
+    assert buckets == {(None, 100000): 1, (250000, 500000): 2}, buckets
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    table_mapping.start_mappers()
+    tag = f"facet-{uuid.uuid4().hex[:8]}"
+    book_ids, city_ids, author_ids = create_fixtures(tag)
+    try:
+        latencies = []
+        with UnitOfWork() as uow:
+            repo = uow.get_repository(BookCardRepository)
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                facets = repo.get_book_facets(genres=[tag])
+                latencies.append(time.perf_counter() - started)
+            check_facets(facets, tag, city_ids)
+
+        latencies.sort()
+        print(f"iterations={args.iterations} facets ok")
+        print(f"latency p50  {statistics.median(latencies) * 1000:10.2f} ms")
+        print(f"latency p99  {latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000:10.2f} ms")
+    finally:
+        drop_fixtures(book_ids, city_ids, author_ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Concurrency check for the payment ledger: many threads deposit into a few members at once through the
+# message bus, like /member/deposit does. Reports throughput and latency, then checks that no deposit was lost,
+# that the ledger entries agree with the stored balances and that snapshot + reconcile report no mismatch.
+# Needs the database configured in DatabaseConf.env:
+#     python -m benchmarks.ledger_concurrency --threads 32 --deposits 5000 --members 4
+import argparse
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+
+from adapters.repositories.LedgerRepository import LedgerRepository
+from adapters.table_mapping import member_table, payment_table, balance_snapshot_table
+from domains.models.MemberManagementModels import Member
+from events.commands import AddToMemberBalanceCommand
+from bootstrap import bootstrap
+from messaging.message_bus import MessageBus
+from services.UnitOfWork import UnitOfWork
+
+
+def create_fixtures(members: int) -> list[int]:
+    tag = uuid.uuid4().hex[:8]
+    with UnitOfWork() as uow:
+        created = [Member("Bench", f"Ledger{i}", f"ledger-{tag}-{i}") for i in range(members)]
+        uow.session.add_all(created)
+        uow.session.flush()
+        return [member.id for member in created]
+
+
+def drop_fixtures(member_ids: list[int]):
+    with UnitOfWork() as uow:
+        uow.session.execute(delete(balance_snapshot_table).where(balance_snapshot_table.c.member_id.in_(member_ids)))
+        uow.session.execute(delete(payment_table).where(payment_table.c.member_id.in_(member_ids)))
+        uow.session.execute(delete(member_table).where(member_table.c.id.in_(member_ids)))
+
+
+def deposit(bus: MessageBus, member_id: int, amount: int) -> float:
+    started = time.perf_counter()
+    bus.handle(AddToMemberBalanceCommand(member_id, amount))
+    return time.perf_counter() - started
+
+
+def snapshot(member_ids: list[int]):
+    with UnitOfWork() as uow:
+        repo = uow.get_repository(LedgerRepository)
+        locked = repo.lock_members(min(member_ids) - 1, max(member_ids) - min(member_ids) + 1)
+        repo.take_snapshots([member_id for member_id in locked if member_id in member_ids], datetime.now())
+
+
+def check(member_ids: list[int], expected: dict[int, int]) -> list[str]:
+    problems = []
+    with UnitOfWork() as uow:
+        balances = dict(uow.session.execute(
+            select(member_table.c.id, member_table.c.balance).where(member_table.c.id.in_(member_ids))).all())
+        entries = {row.member_id: row for row in uow.session.execute(
+            select(payment_table.c.member_id,
+                   func.count().label("count"),
+                   func.sum(payment_table.c.amount).label("total"),
+                   func.count(func.distinct(payment_table.c.balance_after)).label("distinct_after"),
+                   func.max(payment_table.c.balance_after).label("last_after"))
+            .where(payment_table.c.member_id.in_(member_ids))
+            .group_by(payment_table.c.member_id)).all()}
+        ledger = {row.member_id: row for row in
+                  uow.get_repository(LedgerRepository).reconcile_balances(
+                      min(member_ids) - 1, max(member_ids) - min(member_ids) + 1)}
+
+    for member_id in member_ids:
+        row = entries[member_id]
+        if balances[member_id] != expected[member_id]:
+            problems.append(f"member {member_id}: balance {balances[member_id]}, deposited {expected[member_id]}")
+        if row.total != balances[member_id] or row.last_after != balances[member_id]:
+            problems.append(f"member {member_id}: ledger total {row.total}, last balance_after {row.last_after}")
+        # Deposits are positive, so every entry must have seen a different running balance
+        if row.distinct_after != row.count:
+            problems.append(f"member {member_id}: {row.count} entries but {row.distinct_after} running balances")
+        if ledger[member_id].balance != ledger[member_id].ledger_balance:
+            problems.append(f"member {member_id}: reconcile found {ledger[member_id].ledger_balance}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--deposits", type=int, default=5000)
+    parser.add_argument("--members", type=int, default=4)
+    args = parser.parse_args()
+
+    bus = bootstrap(publish=lambda *args: None)
+    member_ids = create_fixtures(args.members)
+    work = [(random.choice(member_ids), random.randint(1, 100)) for _ in range(args.deposits)]
+    expected = {member_id: 0 for member_id in member_ids}
+    for member_id, amount in work:
+        expected[member_id] += amount
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            # Snapshots are taken in the middle of the run, reconciliation must still add up
+            futures = [pool.submit(deposit, bus, member_id, amount) for member_id, amount in work]
+            snapshot(member_ids)
+            latencies = sorted(future.result() for future in futures)
+        elapsed = time.perf_counter() - started
+
+        print(f"threads={args.threads} deposits={args.deposits} members={args.members}")
+        print(f"throughput   {args.deposits / elapsed:10.1f} deposits/s")
+        print(f"latency p50  {statistics.median(latencies) * 1000:10.2f} ms")
+        print(f"latency p99  {latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000:10.2f} ms")
+
+        problems = check(member_ids, expected)
+        for problem in problems:
+            print(problem)
+        assert not problems, "lost or inconsistent deposits"
+        print("all deposits accounted for")
+    finally:
+        drop_fixtures(member_ids)
+
+
+if __name__ == '__main__':
+    main()
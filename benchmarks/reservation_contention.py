@@ -0,0 +1,108 @@
+# Contention benchmark for the reservation path: every round, all threads try to reserve the same book
+# at once through reserve_handler. Reports attempt throughput and latency, and checks that each book
+# ends up with exactly one winner and one reservation row.
+# Needs the database configured in DatabaseConf.env:
+#     python -m benchmarks.reservation_contention --threads 32 --rounds 50
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+
+from adapters import table_mapping
+from adapters.table_mapping import book_table, member_table, reservation_table
+from domains.models.BookManagementModels import Book
+from domains.models.MemberManagementModels import Member, MembershipType
+from events.commands import ReserveBookCommand
+from exceptions.BaseException import BookIsReservedError
+from services.UnitOfWork import UnitOfWork
+from services.handlres.reservation_handler import reserve_handler
+
+
+def create_fixtures(threads: int, rounds: int) -> tuple[list[int], list[int]]:
+    tag = uuid.uuid4().hex[:8]
+    with UnitOfWork() as uow:
+        members = [Member("Bench", f"Member{i}", f"bench-{tag}-{i}", MembershipType.PREMIUM) for i in range(threads)]
+        books = [Book(f"Contended {tag} {i}", ["benchmark"], datetime.now(), f"bench-{tag}-{i}", 1000)
+                 for i in range(rounds)]
+        uow.session.add_all(members + books)
+        uow.session.flush()
+        return [member.id for member in members], [book.id for book in books]
+
+
+def drop_fixtures(member_ids: list[int], book_ids: list[int]):
+    with UnitOfWork() as uow:
+        uow.session.execute(delete(reservation_table).where(reservation_table.c.book_id.in_(book_ids)))
+        uow.session.execute(delete(book_table).where(book_table.c.id.in_(book_ids)))
+        uow.session.execute(delete(member_table).where(member_table.c.id.in_(member_ids)))
+
+
+def attempt(member_id: int, book_id: int) -> bool:
+    try:
+        reserve_handler(ReserveBookCommand(member_id, book_id, 3), UnitOfWork())
+        return True
+    except BookIsReservedError:
+        return False
+
+
+def run_round(member_ids: list[int], book_id: int, latencies: list[float]) -> int:
+    barrier = threading.Barrier(len(member_ids))
+    outcomes = []
+    lock = threading.Lock()
+
+    def worker(member_id):
+        barrier.wait()
+        started = time.perf_counter()
+        won = attempt(member_id, book_id)
+        elapsed = time.perf_counter() - started
+        with lock:
+            outcomes.append(won)
+            latencies.append(elapsed)
+
+    workers = [threading.Thread(target=worker, args=(member_id,)) for member_id in member_ids]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    table_mapping.start_mappers()
+    member_ids, book_ids = create_fixtures(args.threads, args.rounds)
+    latencies = []
+    try:
+        started = time.perf_counter()
+        winners = [run_round(member_ids, book_id, latencies) for book_id in book_ids]
+        elapsed = time.perf_counter() - started
+
+        with UnitOfWork() as uow:
+            rows = dict(uow.session.execute(
+                select(reservation_table.c.book_id, func.count())
+                .where(reservation_table.c.book_id.in_(book_ids))
+                .group_by(reservation_table.c.book_id)).all())
+
+        attempts = len(latencies)
+        latencies.sort()
+        print(f"threads={args.threads} rounds={args.rounds} attempts={attempts}")
+        print(f"throughput   {attempts / elapsed:10.1f} attempts/s")
+        print(f"latency p50  {statistics.median(latencies) * 1000:10.2f} ms")
+        print(f"latency p99  {latencies[max(int(attempts * 0.99) - 1, 0)] * 1000:10.2f} ms")
+
+        broken = [book_id for book_id, won in zip(book_ids, winners) if won != 1 or rows.get(book_id) != 1]
+        print(f"rounds with exactly one winner: {args.rounds - len(broken)}/{args.rounds}")
+        assert not broken, f"books reserved zero or several times: {broken}"
+    finally:
+        drop_fixtures(member_ids, book_ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# Per-1000-row cost of turning list endpoint rows into JSON bytes.
+# Runs on synthetic rows, no database or broker is needed:
+#     python -m benchmarks.serialization_benchmark
+import json
+import timeit
+from collections import namedtuple
+from datetime import datetime, timedelta
+from enum import Enum
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from helpers.serialization import dumps, row_serializer
+
+ROWS = 1000
+REPEAT = 7
+NUMBER = 20
+
+MEMBER_FIELDS = ("id", "first_name", "last_name", "phone_number", "membership_type", "membership_expiry", "balance")
+CARD_FIELDS = ("id", "title", "genres", "isbn", "release_date", "price", "status")
+CARD_KEYS = ("book_id", "title", "genres", "isbn", "release_date", "price", "status")
+
+CardRow = namedtuple("CardRow", CARD_KEYS + ("authors",))
+
+
+class MembershipType(Enum):
+    REGULAR = "Regular"
+    VIP = "VIP"
+
+
+def make_members():
+    start = datetime(2024, 1, 1)
+    return [SimpleNamespace(id=i, first_name=f"First{i}", last_name=f"Last{i}", phone_number=f"0912{i:07d}",
+                            membership_type=MembershipType.VIP if i % 5 == 0 else MembershipType.REGULAR,
+                            membership_expiry=start + timedelta(days=i), balance=i * 1000)
+            for i in range(ROWS)]
+
+
+def make_authors():
+    return [SimpleNamespace(id=i, first_name=f"First{i}", last_name=f"Last{i}",
+                            city=SimpleNamespace(id=i % 30, title=f"City{i % 30}"))
+            for i in range(ROWS)]
+
+
+def make_cards():
+    start = datetime(2000, 1, 1)
+    return [CardRow(i, f"Book title {i}", ["fiction", "history"], f"978-{i:09d}", start + timedelta(days=i),
+                    10000 + i, "Pending",
+                    [{"id": i % 50, "first_name": "Jane", "last_name": "Doe",
+                      "city": {"id": i % 30, "title": f"City{i % 30}"}}])
+            for i in range(ROWS)]
+
+
+# Before: dicts built field by field, then jsonable_encoder and json.dumps as FastAPI does
+def members_before(members):
+    result = []
+    for member in members:
+        result.append({
+            "id": member.id,
+            "first_name": member.first_name,
+            "last_name": member.last_name,
+            "phone_number": member.phone_number,
+            "membership_type": member.membership_type,
+            "membership_expiry": member.membership_expiry,
+            "balance": member.balance
+        })
+    return json.dumps(jsonable_encoder({"Members": result})).encode('utf-8')
+
+
+def authors_before(authors):
+    result = []
+    for author in authors:
+        result.append({
+            "id": author.id,
+            "first_name": author.first_name,
+            "last_name": author.last_name,
+            "city": {"id": author.city.id, "title": author.city.title}
+        })
+    return json.dumps(jsonable_encoder({"authors": result})).encode('utf-8')
+
+
+def cards_before(cards):
+    books = []
+    for card in cards:
+        books.append({
+            "id": card.book_id,
+            "title": card.title,
+            "genres": card.genres,
+            "isbn": card.isbn,
+            "release_date": card.release_date,
+            "price": card.price,
+            "status": card.status,
+            "authors": card.authors
+        })
+    return json.dumps(jsonable_encoder({"books": books})).encode('utf-8')
+
+
+# After: precompiled row serializers and orjson straight to bytes
+def members_after(members):
+    serialize = row_serializer(MEMBER_FIELDS)
+    return dumps({"Members": [serialize(member) for member in members]})
+
+
+def authors_after(authors):
+    serialize_author = row_serializer(("id", "first_name", "last_name"))
+    serialize_city = row_serializer(("id", "title"))
+    result = [serialize_author(author) for author in authors]
+    for author, author_data in zip(authors, result):
+        author_data["city"] = serialize_city(author.city)
+    return dumps({"authors": result})
+
+
+def cards_after(cards):
+    to_dict = row_serializer(CARD_KEYS, CARD_FIELDS)
+    books = []
+    for card in cards:
+        book_data = to_dict(card)
+        book_data["authors"] = card.authors
+        books.append(book_data)
+    return dumps({"books": books})
+
+
+def measure(function, rows) -> float:
+    # Best of REPEAT runs, in milliseconds per 1000 rows
+    best = min(timeit.repeat(lambda: function(rows), repeat=REPEAT, number=NUMBER))
+    return best / NUMBER * 1000 * 1000 / len(rows)
+
+
+def main():
+    cases = [
+        ("members", make_members(), members_before, members_after),
+        ("authors", make_authors(), authors_before, authors_after),
+        ("book cards", make_cards(), cards_before, cards_after),
+    ]
+    print(f"{'endpoint':<12}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name, rows, before, after in cases:
+        assert json.loads(before(rows)) == json.loads(after(rows)), name
+        before_ms, after_ms = measure(before, rows), measure(after, rows)
+        print(f"{name:<12}{before_ms:>12.3f}{after_ms:>12.3f}{before_ms / after_ms:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,37 @@
 import inspect
 import logging
-from typing import Callable
+from typing import Callable, Optional
 
-from adapters import redis_publisher, table_mapping
+from adapters import table_mapping
+from adapters.redis_connection import RedisConnectionManager, get_redis_manager
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository
 from messaging import message_bus, rabbitMQ_broker
 from messaging.rabbitMQ_broker import RabbitMQBroker
+from services.IdempotencyService import IdempotencyStore
 from services.UnitOfWork import UnitOfWork, AbstractUnitOfWork
 
 logger = logging.getLogger(__name__)
 
 def bootstrap(
     start_orm: bool = True,
-    uow: AbstractUnitOfWork = UnitOfWork(),
-    publish: Callable = RabbitMQBroker().publish_message,
+    uow_factory: Callable[[], AbstractUnitOfWork] = UnitOfWork,
+    publish: Optional[Callable] = None,
+    redis_manager: Optional[RedisConnectionManager] = None,
+    idempotency_store: Optional[IdempotencyStore] = None,
 ) -> message_bus.MessageBus:
 
     if start_orm:
         table_mapping.start_mappers()
-
-    dependencies = {"uow": uow, "publish": publish}
+    if publish is None:
+        # Connects when the bus is built, not when this module is imported
+        publish = RabbitMQBroker().publish_message
+    if redis_manager is None:
+        redis_manager = get_redis_manager()
+    cache = SyncMemoryCacheRepository(redis_manager)
+    if idempotency_store is None:
+        idempotency_store = IdempotencyStore(cache)
+
+    dependencies = {"publish": publish, "cache": cache}
     injected_event_handlers = {
         event_type: [
             inject_dependencies(handler, dependencies)
@@ -32,13 +45,17 @@ def bootstrap(
     }
 
     return message_bus.MessageBus(
-        uow=uow,
+        uow_factory=uow_factory,
         event_handlers=injected_event_handlers,
         command_handlers=injected_command_handlers,
+        idempotency_store=idempotency_store,
     )
 
 
 def inject_dependencies(handler, dependencies):
     params = inspect.signature(handler).parameters
     deps = {name: dependency for name, dependency in dependencies.items() if name in params}
-    return lambda message: handler(message, **deps)
+    # The unit of work is not shared, the bus hands each message its own
+    if "uow" in params:
+        return lambda message, uow: handler(message, uow=uow, **deps)
+    return lambda message, uow: handler(message, **deps)
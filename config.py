@@ -9,21 +9,85 @@ load_dotenv(dotenv_path="RedisConf.env")
 SQLALCHEMY_DATABASE_URL = f"postgresql://{os.getenv('POSTGRES_USER')}:{os.getenv('POSTGRES_PASSWORD')}@{os.getenv('POSTGRES_HOST')}:5432/{os.getenv('POSTGRES_DB')}"
 
 RABBITMQ_URL = os.getenv('RABBITMQ_URL')
+RABBITMQ_RECONNECT_DELAY_SECONDS = 5
 
 MEMBER_PREMIUM_COST=1000
 MEMBER_PREMIUM_Period_Month= 1
 
+LEDGER_SNAPSHOT_INTERVAL_SECONDS = 3600
+LEDGER_SNAPSHOT_BATCH_SIZE = 1000
+
 RESERVATION_COST_PER_DAY = 1000
 RESERVATION_MINIMUM_PAYMENT_FOR_DISCOUNT = 300000
 RESERVATION_MINIMUM_BOOKS_COUNT_FOR_DISCOUNT = 300000
+RESERVATION_DISCOUNT_BOOKS_WINDOW_MONTHS = 1
+RESERVATION_DISCOUNT_PAYMENT_WINDOW_MONTHS = 2
+RESERVATION_MAX_BOOKS_PER_REQUEST = 20
+
+RESERVATION_EXPIRY_ENABLED = True
+RESERVATION_EXPIRY_INTERVAL_SECONDS = 30
+RESERVATION_EXPIRY_BATCH_SIZE = 500
+RESERVATION_EXPIRY_MAX_BATCHES_PER_RUN = 20
+
+WAITLIST_NOTIFICATION_QUEUE = "waitlist_notifications"
+WAITLIST_HANDOFF_ATTEMPTS = 5
+
+BOOK_SEARCH_TEXT_CONFIG = "simple"
+BOOK_SEARCH_HIGHLIGHT_OPTIONS = "StartSel=<mark>, StopSel=</mark>, HighlightAll=true"
+
+BOOK_LIST_CACHE_ENABLED = True
+BOOK_LIST_CACHE_TTL_SECONDS = 60
+BOOK_LIST_CACHE_MAX_ENTRY_BYTES = 256 * 1024
+
+BOOK_EXPORT_BATCH_SIZE = 1000
+
+# Upper-exclusive price thresholds, facet buckets are the ranges between them
+BOOK_FACET_PRICE_BUCKETS = [100000, 250000, 500000, 1000000]
+BOOK_FACET_LIMIT = 50
+
+BOOK_BULK_MAX_BATCH_SIZE = 50000
+BOOK_BULK_INSERT_CHUNK_SIZE = 1000
+
+CATALOG_INDEX_ENABLED = False
+CATALOG_INDEX_MAX_AGE_SECONDS = 300
+
+REFERENCE_DATA_CACHE_TTL_SECONDS = 600
+REFERENCE_DATA_CACHE_MAX_ENTRIES = 64
+
+IDEMPOTENCY_RESULT_TTL_SECONDS = 24 * 60 * 60
+IDEMPOTENCY_LOCK_TTL_SECONDS = 30
+IDEMPOTENCY_WAIT_SECONDS = 10
+IDEMPOTENCY_POLL_INTERVAL_SECONDS = 0.05
 
 OTP_EXPIRY_MINUTES = 5
 OTP_REQUEST_LIMIT_PER_2_MINUTES = 5
 OTP_REQUEST_LIMIT_PER_HOUR = 10
+# The API runs a consumer too unless OTP requests are left to entry_points.otp_worker processes
+OTP_CONSUMER_IN_API = True
+OTP_CONSUMER_PREFETCH_COUNT = 20
+OTP_CONSUMER_WORKERS = 8
+OTP_CONSUMER_DRAIN_TIMEOUT_SECONDS = 30
+
+SMS_PROVIDER_TIMEOUT_SECONDS = 2
+SMS_HEDGING_ENABLED = True
+SMS_HEDGE_DELAY_SECONDS = 0.5
+SMS_BREAKER_WINDOW_SIZE = 20
+SMS_BREAKER_MINIMUM_CALLS = 5
+SMS_BREAKER_FAILURE_RATE = 0.5
+SMS_BREAKER_COOLDOWN_SECONDS = 30
+SMS_BREAKER_HALF_OPEN_CALLS = 1
 
 JWT_SECRET_KEY = "this-is-my-secret-key-yoyo"
 JWT_ALGORITHM = "HS256"
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = 30
+JWT_VERIFIED_CACHE_TTL_SECONDS = 30
+JWT_VERIFIED_CACHE_MAX_ENTRIES = 10000
+
+REDIS_MAX_CONNECTIONS = 50
+REDIS_POOL_TIMEOUT_SECONDS = 5
+REDIS_SOCKET_TIMEOUT_SECONDS = 2
+REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS = 2
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS = 30
 
 def get_redis_host_and_port():
     host = os.getenv("REDIS_HOST")
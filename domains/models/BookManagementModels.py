@@ -42,10 +42,21 @@ class ReservationStatus(Enum):
     RESERVED = 'Reserved'
     PENDING = 'Pending'
 
+def normalize_genres(genres: List[str]) -> List[str]:
+    # Trim, lowercase, drop blanks and keep the first occurrence of each genre.
+    # Stored genres and filters both go through here, so 'fiction' still finds 'Fiction'
+    normalized = []
+    for genre in genres or []:
+        genre = genre.strip().lower()
+        if genre and genre not in normalized:
+            normalized.append(genre)
+    return normalized
+
+
 class Book:
     id: int
     title: str
-    genres: str
+    genres: List[str]
     release_date: datetime
     isbn: str
     price: int
@@ -54,9 +65,9 @@ class Book:
     authors: List[Author]
     version: int
 
-    def __init__(self, title: str, genres: str, release_date: datetime, isbn: str, price: int):
+    def __init__(self, title: str, genres: List[str], release_date: datetime, isbn: str, price: int):
         self.title = title
-        self.genres = genres
+        self.genres = normalize_genres(genres)
         self.release_date = release_date
         self.isbn = isbn
         self.price = price
@@ -65,9 +76,9 @@ class Book:
         self.events = []
         self.version = 0  # Initialize version here
 
-    def update(self,title:str,genres:str,release_date:datetime,isbn:str,price:int):
+    def update(self,title:str,genres:List[str],release_date:datetime,isbn:str,price:int):
         self.title = title
-        self.genres = genres
+        self.genres = normalize_genres(genres)
         self.release_date = release_date
         self.isbn = isbn
         self.price = price
@@ -81,7 +92,7 @@ class Book:
         self.version += 1
 
     def __str__(self):
-        return f"Title: {self.title}, Genre: {self.genres}, Authors: {self.get_authors()}"
+        return f"Title: {self.title}, Genre: {', '.join(self.genres)}, Authors: {self.get_authors()}"
 
     def set_authors(self, authors: List[Author]):
         if not isinstance(authors, list):
@@ -96,10 +107,6 @@ class Book:
             return "No authors assigned"
         return ', '.join(f"{author.first_name} {author.last_name}" for author in self.authors)
 
-    def set_to_reserved(self, reservation_id: int):
-        self.status = ReservationStatus.RESERVED
-        self.reservation_id = reservation_id
-
     def add_event(self, event: Event):
         self.events.append(event)
 
@@ -119,6 +126,15 @@ class Reservation:
         self.start_date = datetime.now()
         self.end_date = datetime.now() + relativedelta(days=+ duration)
         self.total_cost = 0
+        self.released_at = None
+        self.events = []
 
     def set_total_cost(self, total_cost):
         self.total_cost = total_cost
+
+    def confirm(self):
+        # Called once the book has been claimed and the reservation row exists
+        self.add_event(events.BookReservedEvent(self.book_id, self.id))
+
+    def add_event(self, event: Event):
+        self.events.append(event)
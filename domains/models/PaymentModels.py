@@ -1,10 +1,19 @@
 from datetime import datetime
+from enum import Enum
 
 from domains.models.MemberManagementModels import Member
 
 
+class LedgerEntryType(Enum):
+    DEPOSIT = "deposit"
+    PREMIUM_PURCHASE = "premium_purchase"
+
+
+# A ledger entry: credits are positive, charges negative, and entries are never changed afterwards
 class Payment:
-    def __init__(self,amount,member_id:int):
+    def __init__(self, amount, member_id: int, entry_type=LedgerEntryType.DEPOSIT, balance_after: int = None):
         self.amount = amount
         self.member_id = member_id
+        self.entry_type = entry_type
+        self.balance_after = balance_after
         self.payment_date = datetime.now()
\ No newline at end of file
@@ -1,53 +1,78 @@
-import json
+import asyncio
 import logging
-import threading
 from contextlib import asynccontextmanager
 from typing import Optional
 
-from fastapi import FastAPI, Depends, Body
+from fastapi import FastAPI, Depends, Body, Query, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
-
-from adapters.repositories.AuthorRepository import AuthorRepository
-from adapters.repositories.BookRepository import BookRepository
-from adapters.repositories.CityRepository import CityRepository
-from adapters.repositories.MemberRepository import MemberRepository
-from adapters.repositories.ReservationRepository import ReservationRepository
+from fastapi.responses import StreamingResponse
+
+from adapters.redis_connection import RedisConnectionManager, init_redis_manager, close_redis_manager
+from adapters.repositories.AuthorRepository import AuthorRepository, AUTHOR_FIELDS, AUTHOR_INCLUDES
+from adapters.repositories.BookCardRepository import BookCardRepository, BOOK_CARD_FIELDS, BOOK_CARD_INCLUDES
+from adapters.repositories.CityRepository import CityRepository, CITY_FIELDS
+from adapters.repositories.MemberRepository import MemberRepository, MEMBER_FIELDS
+from adapters.repositories.MemoryCacheRepository import MemoryCacheRepository, SyncMemoryCacheRepository
 from bootstrap import bootstrap
-from config import FastApi_metadata, JWT_ACCESS_TOKEN_EXPIRE_MINUTES
+from config import FastApi_metadata, JWT_ACCESS_TOKEN_EXPIRE_MINUTES, CATALOG_INDEX_ENABLED, \
+    RESERVATION_EXPIRY_ENABLED, OTP_CONSUMER_IN_API
 from events import commands, events
-from events.commands import AddToMemberBalanceCommand, ReserveBookCommand, SetMemberVIPCommand
+from events.commands import AddToMemberBalanceCommand, ReserveBookCommand, SetMemberVIPCommand, \
+    JoinWaitlistCommand, LeaveWaitlistCommand, ReserveBooksCommand
 from events.events import OTPSendEvent
-from events.requests import ReserveBookRequest
-from helpers.json_web_token import create_jwt_token, get_current_member_id, JWTBearer
-from messaging.rabbitMQ_broker import RabbitMQBroker
+from events.requests import ReserveBookRequest, ReserveBooksRequest
+from helpers.serialization import RawJSONResponse, row_serializer
+from helpers.sparse_fields import resolve_projection
+from helpers.json_web_token import create_jwt_token, get_current_member_id, jwt_bearer, verified_tokens, \
+    TOKEN_REVOCATION_CHANNEL, handle_token_revocation_message
+from messaging.redis_pubsub import RedisPubSubListener
+from services.BookListCacheService import normalize_book_list_filters, get_cached_book_list, \
+    get_book_list_cache_stats
+from services.BookExportService import stream_book_export, EXPORT_MEDIA_TYPES
+from services.CatalogIndex import catalog_index
 from services.OTPService import verify_otp
-from services.RedisCacheService import set_redis_cache, delete_redis_cache
+from services.SMSProviderService import sms_dispatcher
+from services.ReservationExpiryService import ReservationExpirySweeper, get_reservation_expiry_stats
+from services.ReferenceDataCache import reference_data_response, invalidate_reference_data, \
+    handle_reference_data_message, REFERENCE_DATA_CHANNEL
+from services.RedisCacheService import set_redis_cache, delete_redis_cache, publish_redis_message
 from services.UnitOfWork import UnitOfWork
 from services.handlres import member_handler, otp_handler
 
 logger = logging.getLogger(__name__)
 
-msg_bus = bootstrap()
+# Every Redis user in the process borrows its pools from this one manager
+redis_manager = init_redis_manager()
+msg_bus = bootstrap(redis_manager=redis_manager)
 
 @asynccontextmanager
 async def lifespan_context(app: FastAPI):
-    rabbit = RabbitMQBroker()
-    rabbit.declare_queue('otp_request')
-    threading.Thread(
-        target=lambda: rabbit.consume_messages(queue_name='otp_request', callback=handle_otp_request),
-        daemon=True
-    ).start()
+    app.state.redis = redis_manager
+    otp_consumer = None
+    if OTP_CONSUMER_IN_API:
+        otp_consumer = otp_handler.create_otp_consumer(SyncMemoryCacheRepository(redis_manager))
+        otp_consumer.start()
+    redis_pubsub = RedisPubSubListener(SyncMemoryCacheRepository(redis_manager))
+    redis_pubsub.subscribe(REFERENCE_DATA_CHANNEL, handle_reference_data_message)
+    redis_pubsub.subscribe(TOKEN_REVOCATION_CHANNEL, handle_token_revocation_message)
+    redis_pubsub.start()
+    expiry_task = None
+    if RESERVATION_EXPIRY_ENABLED:
+        sweeper = ReservationExpirySweeper(bootstrap(start_orm=False, redis_manager=redis_manager),
+                                           SyncMemoryCacheRepository(redis_manager))
+        expiry_task = asyncio.create_task(sweeper.run())
     yield
 
-    rabbit.close_connection()
-    logger.info("rabbitMQ pubsub stopped")
-
-def handle_otp_request(ch,method,properties,msg):
-    data_str = msg.decode('utf-8')
-    data_dict = json.loads(data_str)
-    event = events.OTPSendEvent(data_dict.get("phone_number"))
-    otp_handler.send_otp_handler(event)
-
+    if expiry_task is not None:
+        expiry_task.cancel()
+    # Both join their threads, off the event loop so requests still being served are not stalled
+    await run_in_threadpool(redis_pubsub.stop)
+    if otp_consumer is not None:
+        # Finishes and acks the OTP requests in flight before the process exits
+        await run_in_threadpool(otp_consumer.stop)
+        logger.info("rabbitMQ otp consumer stopped")
+    await close_redis_manager()
 
 app = FastAPI(lifespan=lifespan_context,openapi_tags=FastApi_metadata)
 
@@ -60,16 +85,35 @@ def generate_otp_code(phone_number: str):
     except Exception as error:
         return {"error_message": str(error)}
 
+def get_redis(request: Request) -> RedisConnectionManager:
+    return request.app.state.redis
+
+
+def get_cache(request: Request) -> MemoryCacheRepository:
+    return MemoryCacheRepository(request.app.state.redis)
+
+
+@app.get("/redis/stats", dependencies=[Depends(jwt_bearer)])
+async def get_redis_statistics(redis: RedisConnectionManager = Depends(get_redis)):
+    # Pool usage and command latency of this process, plus a live ping
+    return {**redis.get_stats(), "health": await redis.health()}
+
+
+@app.get("/otp/providers", tags=['Authorization'], dependencies=[Depends(jwt_bearer)])
+def get_sms_provider_metrics():
+    # Breaker state, failure rate and latency percentiles per SMS provider of this process
+    return sms_dispatcher.get_metrics()
+
 @app.get("/otp/verify-code", tags=['Authorization'])
-async def verify_otp_code(phone_number: str, code: str):
+async def verify_otp_code(phone_number: str, code: str, cache: MemoryCacheRepository = Depends(get_cache)):
     try:
-        result = verify_otp(phone_number, int(code))
+        result = await verify_otp(cache, phone_number, int(code))
         with UnitOfWork() as uow:
             member = member_handler.get_member_by_phone_number_handler(uow, phone_number)
             token = create_jwt_token({"UserData": jsonable_encoder(member)})
 
             # Cache the token in Redis with expiration
-            await set_redis_cache(phone_number, token, JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+            await set_redis_cache(cache, phone_number, token, JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
         return {"Bearer": token}
 
@@ -77,110 +121,268 @@ async def verify_otp_code(phone_number: str, code: str):
         return {"error_message": str(error)}
 
 
-@app.get("/member/dismiss", tags=['Members'], dependencies=[Depends(JWTBearer())])
-async def dismiss_member(phone_number: str):
+@app.get("/member/dismiss", tags=['Members'], dependencies=[Depends(jwt_bearer)])
+async def dismiss_member(phone_number: str, cache: MemoryCacheRepository = Depends(get_cache)):
     try:
-        await delete_redis_cache(phone_number)
+        await delete_redis_cache(cache, phone_number)
+        # Every worker drops its verified copies of the phone's tokens, this one right away
+        verified_tokens.revoke(phone_number)
+        await publish_redis_message(cache, TOKEN_REVOCATION_CHANNEL, phone_number)
         return {"message": "Member Dismissed"}
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.get("/cities", dependencies=[Depends(JWTBearer())])
-def get_city_list():
+@app.get("/cities", dependencies=[Depends(jwt_bearer)])
+def get_city_list(if_none_match: Optional[str] = Header(None)):
     try:
-        with UnitOfWork() as uow:
-            repo = uow.get_repository(CityRepository)
-            cities = repo.get_city_list()
-
-            city_list = []
-            for city in cities:
-                city_data = {
-                    "id": city.id,
-                    "title": city.title
-                }
-                city_list.append(city_data)
-            return {"cities": city_list}
+        return reference_data_response(("cities",), load_city_list, if_none_match)
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.get("/authors", dependencies=[Depends(JWTBearer())])
-def get_author_list():
+def load_city_list() -> dict:
+    with UnitOfWork() as uow:
+        repo = uow.get_repository(CityRepository)
+        cities = repo.get_city_list()
+
+        serialize_city = row_serializer(CITY_FIELDS)
+        return {"cities": [serialize_city(city) for city in cities]}
+
+
+@app.get("/authors", dependencies=[Depends(jwt_bearer)])
+def get_author_list(fields: Optional[str] = None, include: Optional[str] = None,
+                    if_none_match: Optional[str] = Header(None)):
     try:
-        with UnitOfWork() as uow:
-            repo = uow.get_repository(AuthorRepository)
-            authors = repo.get_author_list()
-            author_list = []
-            for author in authors:
-                city_data = {
-                    "id": author.id,
-                    "first_name": author.first_name,
-                    "last_name": author.last_name,
-                    "city": {
-                        "id": author.city.id,
-                        "title": author.city.title
-                    }
-                }
-                author_list.append(city_data)
-
-            return {"authors": author_list}
+        fields, include = resolve_projection(fields, include, AUTHOR_FIELDS, AUTHOR_INCLUDES)
+        return reference_data_response(("authors", fields, include),
+                                       lambda: load_author_list(fields, include), if_none_match)
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+def load_author_list(fields: tuple, include: tuple) -> dict:
+    with UnitOfWork() as uow:
+        repo = uow.get_repository(AuthorRepository)
+        # Authors and their cities come back from a single joined query
+        authors = repo.get_author_list(fields, include_city="city" in include)
+        serialize_author = row_serializer(fields)
+        author_list = [serialize_author(author) for author in authors]
+        if "city" in include:
+            serialize_city = row_serializer(CITY_FIELDS)
+            for author, author_data in zip(authors, author_list):
+                author_data["city"] = serialize_city(author.city) if author.city else None
+
+        return {"authors": author_list}
+
+
+@app.post("/reference-data/invalidate", dependencies=[Depends(jwt_bearer)])
+def invalidate_reference_data_cache(name: Optional[str] = None):
+    # For cities or authors changed outside the API, every worker drops its cached copy
+    try:
+        invalidate_reference_data(SyncMemoryCacheRepository(redis_manager), name)
+        return "Ok"
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.get("/books", tags=['Books'], dependencies=[Depends(JWTBearer())])
-def get_book_list(
+@app.get("/books", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+async def get_book_list(
         search: Optional[str] = None,
         min_price: Optional[float] = None,
         max_price: Optional[float] = None,
-        genres: Optional[str] = None,
+        genres: Optional[list[str]] = Query(None),
+        genres_match: str = 'any',
         city_id: Optional[int] = None,
         page: int = 1,
         per_page: int = 10,
-        sort_by_price: str = 'asc'
+        sort_by_price: str = 'asc',
+        sort_by_relevance: bool = False,
+        pagination: str = 'page',
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        fields: Optional[str] = None,
+        include: Optional[str] = None,
+        cache: MemoryCacheRepository = Depends(get_cache)
 ):
     try:
-        with UnitOfWork() as uow:
-            repo = uow.get_repository(BookRepository)
-            books = repo.get_book_list_filtered(
-                search,
-                min_price,
-                max_price,
-                genres,
-                city_id,
-                page,
-                per_page,
-                sort_by_price)
-            return {"books": books}
+        # e.g. fields=id,title,price for a lean listing, include=authors.city for the full one
+        fields, include = resolve_projection(fields, include, tuple(BOOK_CARD_FIELDS), BOOK_CARD_INCLUDES)
+        filters = normalize_book_list_filters(
+            search, min_price, max_price, genres, genres_match, city_id, page, per_page,
+            sort_by_price, sort_by_relevance, pagination, cursor, with_total, fields, include)
+        body = await get_cached_book_list(cache, filters, lambda: load_book_list(
+            search, min_price, max_price, genres, genres_match, city_id, page, per_page,
+            sort_by_price, sort_by_relevance, pagination, cursor, with_total, fields, include))
+        return RawJSONResponse(body)
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.post("/book", tags=['Books'], dependencies=[Depends(JWTBearer())])
-def create_book(command: commands.CreateBookCommand):
+@app.get("/books/facets", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+async def get_book_facets(
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = Query(None),
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        cache: MemoryCacheRepository = Depends(get_cache)
+):
     try:
-        msg_bus.handle(command)
+        # Shares the listing cache and its invalidation, under its own keys
+        filters = ("facets",) + normalize_book_list_filters(
+            search, min_price, max_price, genres, genres_match, city_id)
+        body = await get_cached_book_list(cache, filters, lambda: load_book_facets(
+            search, min_price, max_price, genres, genres_match, city_id))
+        return RawJSONResponse(body)
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+def load_book_facets(
+        search: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        genres: Optional[list[str]],
+        genres_match: str,
+        city_id: Optional[int]
+) -> dict:
+    with UnitOfWork() as uow:
+        repo = uow.get_repository(BookCardRepository)
+        return repo.get_book_facets(
+            search=search,
+            min_price=min_price,
+            max_price=max_price,
+            genres=genres,
+            genres_match=genres_match,
+            city_id=city_id)
+
+
+def load_book_list(
+        search: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        genres: Optional[list[str]],
+        genres_match: str,
+        city_id: Optional[int],
+        page: int,
+        per_page: int,
+        sort_by_price: str,
+        sort_by_relevance: bool,
+        pagination: str,
+        cursor: Optional[str],
+        with_total: bool,
+        fields: tuple,
+        include: tuple
+) -> dict:
+    with UnitOfWork() as uow:
+        repo = uow.get_repository(BookCardRepository)
+        # Cursor mode keeps page latency flat no matter how deep the client scrolls
+        if pagination == 'cursor' or cursor is not None:
+            return repo.get_book_list_by_cursor(
+                search=search,
+                min_price=min_price,
+                max_price=max_price,
+                genres=genres,
+                genres_match=genres_match,
+                city_id=city_id,
+                cursor=cursor,
+                per_page=per_page,
+                sort_by_price=sort_by_price,
+                with_total=with_total,
+                fields=fields,
+                include=include)
+
+        # Price/city browsing can be answered from the in-memory index, then only the page is read
+        if CATALOG_INDEX_ENABLED and catalog_index.can_answer(search, genres):
+            book_ids = catalog_index.query(
+                min_price=min_price,
+                max_price=max_price,
+                city_id=city_id,
+                sort_by_price=sort_by_price,
+                offset=(page-1)*per_page,
+                limit=per_page)
+            return {"books": repo.get_book_cards_by_ids(book_ids, fields, include)}
+
+        books = repo.get_book_list_filtered(
+            search=search,
+            min_price=min_price,
+            max_price=max_price,
+            genres=genres,
+            genres_match=genres_match,
+            city_id=city_id,
+            page=page,
+            per_page=per_page,
+            sort_by_price=sort_by_price,
+            sort_by_relevance=sort_by_relevance,
+            fields=fields,
+            include=include)
+        return {"books": books}
+
+
+@app.get("/books/export", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+def export_books(
+        format: str = 'ndjson',
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = Query(None),
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        after_id: Optional[int] = None
+):
+    try:
+        rows = stream_book_export(format, search, min_price, max_price, genres, genres_match, city_id, after_id)
+        return StreamingResponse(
+            rows,
+            media_type=EXPORT_MEDIA_TYPES[format],
+            headers={"Content-Disposition": f"attachment; filename=books.{format}"})
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+@app.get("/books/cache-stats", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+async def get_book_list_cache_statistics(cache: MemoryCacheRepository = Depends(get_cache)):
+    try:
+        return await get_book_list_cache_stats(cache)
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+@app.post("/book", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+def create_book(command: commands.CreateBookCommand, idempotency_key: Optional[str] = Header(None)):
+    try:
+        msg_bus.handle(command, idempotency_key)
         return "Ok"
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.put("/book", tags=['Books'], dependencies=[Depends(JWTBearer())])
-def update_book(command: commands.UpdateBookCommand):
+@app.post("/books/bulk", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+def create_books_bulk(command: commands.CreateBooksBatchCommand, idempotency_key: Optional[str] = Header(None)):
     try:
-        msg_bus.handle(command)
+        return msg_bus.handle(command, idempotency_key)[0]
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+@app.put("/book", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+def update_book(command: commands.UpdateBookCommand, idempotency_key: Optional[str] = Header(None)):
+    try:
+        msg_bus.handle(command, idempotency_key)
         return "Ok"
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.post("/member/deposit", tags=['Members'], dependencies=[Depends(JWTBearer())])
-def add_to_balance(amount:int = Body(), token: str = Depends(JWTBearer())):
+@app.post("/member/deposit", tags=['Members'], dependencies=[Depends(jwt_bearer)])
+def add_to_balance(amount:int = Body(), member_id: int = Depends(get_current_member_id),
+                   idempotency_key: Optional[str] = Header(None)):
+    # Clients retry deposits on timeouts, with the same Idempotency-Key a retry is never applied twice
     try:
-        member_id = get_current_member_id(token)
         command = AddToMemberBalanceCommand(member_id, amount)
-        msg_bus.handle(command)
+        msg_bus.handle(command, idempotency_key)
         return "Ok"
     except Exception as error:
         raise error
@@ -189,70 +391,93 @@ def add_to_balance(amount:int = Body(), token: str = Depends(JWTBearer())):
 
 
 
-@app.post("/book/reserve", tags=['Books'], dependencies=[Depends(JWTBearer())])
-def reserve_book(req:ReserveBookRequest, token: str = Depends(JWTBearer())):
+@app.post("/books/reserve", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+def reserve_books(req:ReserveBooksRequest, member_id: int = Depends(get_current_member_id),
+                  idempotency_key: Optional[str] = Header(None)):
+    # mode=all_or_nothing reserves every book or none, best_effort reserves whichever are free
+    try:
+        cmd = ReserveBooksCommand(member_id, req.book_ids, req.duration, req.mode)
+        return msg_bus.handle(cmd, idempotency_key)[0]
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+@app.post("/book/waitlist", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+def join_waitlist(req:ReserveBookRequest, member_id: int = Depends(get_current_member_id),
+                  idempotency_key: Optional[str] = Header(None)):
+    # Instead of retrying /book/reserve, wait in line and get notified once the book is reserved for you
+    try:
+        return msg_bus.handle(JoinWaitlistCommand(member_id, req.book_id, req.duration), idempotency_key)[0]
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+@app.delete("/book/waitlist", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+def leave_waitlist(book_id: int, member_id: int = Depends(get_current_member_id)):
+    try:
+        left = msg_bus.handle(LeaveWaitlistCommand(member_id, book_id))[0]
+        return "Ok" if left else {"error_message": "Not on the waitlist for this book"}
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+@app.get("/reservations/expiry-stats", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+async def get_reservation_expiry_statistics(cache: MemoryCacheRepository = Depends(get_cache)):
+    try:
+        return await get_reservation_expiry_stats(cache)
+    except Exception as error:
+        return {"error_message": str(error)}
+
+
+@app.post("/book/reserve", tags=['Books'], dependencies=[Depends(jwt_bearer)])
+def reserve_book(req:ReserveBookRequest, member_id: int = Depends(get_current_member_id),
+                 idempotency_key: Optional[str] = Header(None)):
     try:
-        member_id = get_current_member_id(token)
         cmd = ReserveBookCommand(member_id, req.book_id,req.duration)
-        msg_bus.handle(cmd)
+        msg_bus.handle(cmd, idempotency_key)
         return "Ok"
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.get("/member/reserved-books", tags=['Members'], dependencies=[Depends(JWTBearer())])
-def get_reserved_books(token: str = Depends(JWTBearer())):
+@app.get("/member/reserved-books", tags=['Members'], dependencies=[Depends(jwt_bearer)])
+def get_reserved_books(member_id: int = Depends(get_current_member_id)):
     try:
         with UnitOfWork() as uow:
-            member_id = get_current_member_id(token)
-            repo = uow.get_repository(ReservationRepository)
-            books = repo.get_reserved_books(member_id)
-            return {"books": books}
+            repo = uow.get_repository(BookCardRepository)
+            books = repo.get_reserved_book_cards(member_id)
+            return RawJSONResponse({"books": books})
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.get("/members", tags=['Members'], dependencies=[Depends(JWTBearer())])
-def get_member_list():
+@app.get("/members", tags=['Members'], dependencies=[Depends(jwt_bearer)])
+def get_member_list(fields: Optional[str] = None):
     try:
+        fields, _ = resolve_projection(fields, None, MEMBER_FIELDS)
         with UnitOfWork() as uow:
             repo = uow.get_repository(MemberRepository)
-            members = repo.get_members_list()
-            result = []
-            for member in members:
-                # Now we can serialize the book with all the author data
-                member_data = {
-                    "id": member.id,
-                    "first_name": member.first_name,
-                    "last_name": member.last_name,
-                    "phone_number": member.phone_number,
-                    "membership_type": member.membership_type,
-                    "membership_expiry": member.membership_expiry,
-                    "balance": member.balance
-                }
-
-                result.append(member_data)
-
-            return {"Members": result}
+            members = repo.get_members_list(fields)
+            serialize_member = row_serializer(fields)
+            return RawJSONResponse({"Members": [serialize_member(member) for member in members]})
     except Exception as error:
         return {"error_message": str(error)}
 
 
 @app.post("/member", tags=['Members'])
-def create_member(command: commands.CreateMemberCommand):
+def create_member(command: commands.CreateMemberCommand, idempotency_key: Optional[str] = Header(None)):
     try:
-        msg_bus.handle(command)
+        msg_bus.handle(command, idempotency_key)
         return "Ok"
     except Exception as error:
         return {"error_message": str(error)}
 
 
-@app.post("/member/set-vip", tags=['Members'], dependencies=[Depends(JWTBearer())])
-def set_vip(token: str = Depends(JWTBearer())):
+@app.post("/member/set-vip", tags=['Members'], dependencies=[Depends(jwt_bearer)])
+def set_vip(member_id: int = Depends(get_current_member_id), idempotency_key: Optional[str] = Header(None)):
     try:
-        member_id = get_current_member_id(token)
         cmd = SetMemberVIPCommand(member_id)
-        msg_bus.handle(cmd)
+        msg_bus.handle(cmd, idempotency_key)
         return "Ok"
     except Exception as error:
         return {"error_message": str(error)}
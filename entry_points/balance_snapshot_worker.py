@@ -0,0 +1,38 @@
+# Takes the periodic balance snapshots of the payment ledger and reconciles the stored balances:
+#     python -m entry_points.balance_snapshot_worker
+import logging
+import signal
+import threading
+
+from adapters.redis_connection import init_redis_manager
+from bootstrap import bootstrap
+from config import LEDGER_SNAPSHOT_INTERVAL_SECONDS, LEDGER_SNAPSHOT_BATCH_SIZE
+from events.commands import SnapshotBalancesCommand, ReconcileBalancesCommand
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    stopped = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stopped.set())
+
+    bus = bootstrap(redis_manager=init_redis_manager())
+    logger.info("balance snapshot worker started")
+    while not stopped.is_set():
+        try:
+            taken = bus.handle(SnapshotBalancesCommand(LEDGER_SNAPSHOT_BATCH_SIZE))[0]
+            report = bus.handle(ReconcileBalancesCommand(LEDGER_SNAPSHOT_BATCH_SIZE))[0]
+            logger.info("took %s balance snapshots, checked %s members", taken, report["checked"])
+            for mismatch in report["mismatches"]:
+                logger.error("balance of member %(member_id)s is %(balance)s, the ledger says %(ledger_balance)s",
+                             mismatch)
+        except Exception:
+            logger.exception("balance snapshot run failed")
+        stopped.wait(LEDGER_SNAPSHOT_INTERVAL_SECONDS)
+    logger.info("balance snapshot worker stopped")
+
+
+if __name__ == '__main__':
+    main()
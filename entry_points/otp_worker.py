@@ -0,0 +1,27 @@
+# Standalone OTP request consumer, scaled independently of the API processes
+# (set OTP_CONSUMER_IN_API = False to leave the queue to these workers):
+#     python -m entry_points.otp_worker
+import logging
+import signal
+
+from adapters.redis_connection import init_redis_manager
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository
+from services.handlres.otp_handler import create_otp_consumer
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    consumer = create_otp_consumer(SyncMemoryCacheRepository(init_redis_manager()))
+    # stop() only flags the consumer, run() then drains the deliveries in flight and returns
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: consumer.stop())
+
+    logger.info("otp worker started")
+    consumer.run()
+    logger.info("otp worker stopped")
+
+
+if __name__ == '__main__':
+    main()
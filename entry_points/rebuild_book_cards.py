@@ -0,0 +1,18 @@
+# Rebuilds the whole book card projection and reloads the catalog index, run by an operator after a
+# migration or when the cards drifted from the books:
+#     python -m entry_points.rebuild_book_cards
+import logging
+
+from adapters.redis_connection import init_redis_manager
+from bootstrap import bootstrap
+from events.commands import RebuildBookCardsCommand
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    # The handler logs the number of cards it rebuilt
+    bootstrap(redis_manager=init_redis_manager()).handle(RebuildBookCardsCommand())
+
+
+if __name__ == '__main__':
+    main()
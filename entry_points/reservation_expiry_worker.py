@@ -0,0 +1,29 @@
+# Standalone reservation expiry sweeper, for deployments that keep it out of the API processes:
+#     python -m entry_points.reservation_expiry_worker
+import logging
+import signal
+import threading
+
+from adapters.redis_connection import init_redis_manager
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository
+from bootstrap import bootstrap
+from services.ReservationExpiryService import ReservationExpirySweeper
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    stopped = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stopped.set())
+
+    logger.info("reservation expiry worker started")
+    redis_manager = init_redis_manager()
+    sweeper = ReservationExpirySweeper(bootstrap(redis_manager=redis_manager), SyncMemoryCacheRepository(redis_manager))
+    sweeper.run_forever(stopped)
+    logger.info("reservation expiry worker stopped")
+
+
+if __name__ == '__main__':
+    main()
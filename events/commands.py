@@ -8,7 +8,7 @@ class Command:
 @dataclass
 class CreateBookCommand(Command):
     title:str
-    genres:str
+    genres:list[str]
     release_date:datetime
     isbn:str
     price:int
@@ -18,12 +18,16 @@ class CreateBookCommand(Command):
 class UpdateBookCommand(Command):
     id:int
     title:str
-    genres: str
+    genres: list[str]
     release_date: datetime
     isbn: str
     price: int
     author_ids:list[int]
 
+@dataclass
+class CreateBooksBatchCommand(Command):
+    books:list[CreateBookCommand]
+
 @dataclass
 class CreateMemberCommand(Command):
     first_name:str
@@ -45,5 +49,36 @@ class ReserveBookCommand(Command):
 class SetMemberVIPCommand(Command):
     member_id:int
 
+@dataclass
+class SnapshotBalancesCommand(Command):
+    batch_size:int
+
+@dataclass
+class ReconcileBalancesCommand(Command):
+    batch_size:int
+
+@dataclass
+class RebuildBookCardsCommand(Command):
+    pass
+
+@dataclass
+class ReserveBooksCommand(Command):
+    member_id:int
+    book_ids:list[int]
+    duration:int
+    mode:str = 'all_or_nothing'
+
+@dataclass
+class ReleaseExpiredReservationsCommand(Command):
+    batch_size:int
 
-    
\ No newline at end of file
+@dataclass
+class JoinWaitlistCommand(Command):
+    member_id:int
+    book_id:int
+    duration:int
+
+@dataclass
+class LeaveWaitlistCommand(Command):
+    member_id:int
+    book_id:int
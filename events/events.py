@@ -8,3 +8,48 @@ class Event:
 @dataclass
 class OTPSendEvent(Event):
     phone_number: str = None
+
+
+@dataclass
+class BookCreatedEvent(Event):
+    book_id: int
+
+
+@dataclass
+class BookUpdatedEvent(Event):
+    book_id: int
+
+
+@dataclass
+class BookReservedEvent(Event):
+    book_id: int
+    reservation_id: int
+
+
+@dataclass
+class BooksImportedEvent(Event):
+    book_ids: list[int]
+
+
+@dataclass
+class BooksReservedEvent(Event):
+    book_ids: list[int]
+
+
+@dataclass
+class BookReleasedEvent(Event):
+    book_id: int
+    reservation_id: int
+    member_id: int
+
+
+@dataclass
+class WaitlistJoinedEvent(Event):
+    book_id: int
+
+
+@dataclass
+class WaitlistHandoffEvent(Event):
+    member_id: int
+    book_id: int
+    reservation_id: int
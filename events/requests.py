@@ -7,11 +7,17 @@ class ReserveBookRequest(BaseModel):
     duration:int
 
 
+class ReserveBooksRequest(BaseModel):
+    book_ids:list[int]
+    duration:int
+    mode:str = 'all_or_nothing'
+
+
 class SearchBooksRequest(BaseModel):
     search: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    genres: Optional[str] = None,
+    genres: Optional[list[str]] = None,
     city_id: Optional[int] = None,
     page: int = 1,
     per_page: int = 10,
@@ -84,4 +84,58 @@ class OTPMaximumRequestInOneHourError(BaseExceptions):
 class OTPMaximumRequestInTwoMinutesError(BaseExceptions):
     message:str = "Too many OTP requests in the last 2 minutes"
     def __str__(self):
-        return self.message
\ No newline at end of file
+        return self.message
+
+@dataclass
+class InvalidCursorError(BaseExceptions):
+    message:str = "Invalid or expired pagination cursor"
+    def __str__(self):
+        return self.message
+
+@dataclass
+class BulkImportTooLargeError(BaseExceptions):
+    message:str = "Too many books in one bulk import"
+    def __str__(self):
+        return self.message
+
+@dataclass
+class InvalidFieldsError(BaseExceptions):
+    message:str = "Unknown field requested"
+    def __str__(self):
+        return self.message
+
+@dataclass
+class AuthorsNotFoundError(BaseExceptions):
+    message:str = "Authors not found"
+    def __str__(self):
+        return self.message
+
+@dataclass
+class BooksNotAvailableError(BaseExceptions):
+    message:str = "Some of the requested books are not available"
+    def __str__(self):
+        return self.message
+
+@dataclass
+class TooManyBooksToReserveError(BaseExceptions):
+    message:str = "Too many books in one reservation request"
+    def __str__(self):
+        return self.message
+
+@dataclass
+class IdempotencyKeyReusedError(BaseExceptions):
+    message:str = "Idempotency key was already used for a different request"
+    def __str__(self):
+        return self.message
+
+@dataclass
+class IdempotencyRequestInProgressError(BaseExceptions):
+    message:str = "A request with this idempotency key is still in progress, retry later"
+    def __str__(self):
+        return self.message
+
+@dataclass
+class LedgerEntryImmutableError(BaseExceptions):
+    message:str = "Ledger entries can not be changed, record a new entry instead"
+    def __str__(self):
+        return self.message
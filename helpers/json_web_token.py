@@ -1,15 +1,85 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import redis.asyncio as redis
+from typing import Optional
+
 import jwt
 from fastapi import Request, Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 # Configuration settings (make sure these are defined in config)
-from config import JWT_ACCESS_TOKEN_EXPIRE_MINUTES, JWT_SECRET_KEY, JWT_ALGORITHM
+from config import JWT_ACCESS_TOKEN_EXPIRE_MINUTES, JWT_SECRET_KEY, JWT_ALGORITHM, JWT_VERIFIED_CACHE_TTL_SECONDS, \
+    JWT_VERIFIED_CACHE_MAX_ENTRIES
+from adapters.repositories.MemoryCacheRepository import MemoryCacheRepository
 from services.RedisCacheService import get_redis_cache
 
-# Initialize Redis connection
-redis = redis.from_url("redis://localhost:6379", decode_responses=True)
+logger = logging.getLogger(__name__)
+
+TOKEN_REVOCATION_CHANNEL = "auth:revoke"
+ALL_TOKENS = "*"
+
+# Process-local cache of tokens that passed signature, expiry and Redis checks, token -> UserData claims.
+# Entries live for a short TTL at most and never past the token's own expiry. A revocation drops every
+# token of the phone number, and checks that started before it can not put their result back afterwards.
+class VerifiedTokenCache:
+    def __init__(self, ttl: int = JWT_VERIFIED_CACHE_TTL_SECONDS, max_entries: int = JWT_VERIFIED_CACHE_MAX_ENTRIES):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tokens_of_phone = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return entry[1]
+
+    def put(self, token: str, user_data: dict, expires_at: float, generation: int):
+        now = time.monotonic()
+        expires = now + min(self._ttl, expires_at - time.time())
+        with self._lock:
+            if generation != self._generation or expires <= now:
+                return
+            self._entries[token] = (expires, user_data)
+            self._entries.move_to_end(token)
+            self._tokens_of_phone.setdefault(user_data["phone_number"], set()).add(token)
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def revoke(self, phone_number: Optional[str] = None):
+        with self._lock:
+            self._generation += 1
+            if phone_number is None or phone_number == ALL_TOKENS:
+                self._entries.clear()
+                self._tokens_of_phone.clear()
+                return
+            for token in self._tokens_of_phone.pop(phone_number, ()):
+                self._entries.pop(token, None)
+
+    def _remove(self, token: str):
+        _, user_data = self._entries.pop(token)
+        tokens = self._tokens_of_phone.get(user_data["phone_number"])
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_of_phone[user_data["phone_number"]]
+
+
+verified_tokens = VerifiedTokenCache()
+
 
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
@@ -17,32 +87,44 @@ class JWTBearer(HTTPBearer):
 
     async def __call__(self, request: Request):
         credentials: HTTPAuthorizationCredentials = await super(JWTBearer, self).__call__(request)
-        data = get_current_user(credentials.credentials)
-        token_status = await get_redis_cache(data["phone_number"])
-        if credentials:
-            if credentials.scheme != "Bearer":
-                raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
-            if not await self.verify_jwt(credentials.credentials) or not token_status:
-                raise HTTPException(status_code=403, detail="Invalid or expired token.")
-            return credentials.credentials
-        else:
+        if not credentials:
             raise HTTPException(status_code=403, detail="Invalid authorization code.")
+        if credentials.scheme != "Bearer":
+            raise HTTPException(status_code=403, detail="Invalid authentication scheme.")
+
+        token = credentials.credentials
+        # Hot path: a token verified a moment ago is a dictionary lookup
+        user_data = verified_tokens.get(token)
+        if user_data is None:
+            generation = verified_tokens.generation
+            payload = self.verify_jwt(token)
+            user_data = payload.get("UserData")
+            cache = MemoryCacheRepository(request.app.state.redis)
+            if not await get_redis_cache(cache, user_data["phone_number"]):
+                raise HTTPException(status_code=403, detail="Invalid or expired token.")
+            verified_tokens.put(token, user_data, payload["exp"], generation)
+
+        request.state.user_data = user_data
+        return token
 
-    async def verify_jwt(self, jwt_token: str) -> bool:
+    def verify_jwt(self, jwt_token: str) -> dict:
         try:
-            payload = jwt_decode(jwt_token)
-            return True
+            return jwt_decode(jwt_token)
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=403, detail="Token expired.")
         except jwt.InvalidTokenError:
             raise HTTPException(status_code=403, detail="Invalid token.")
 
-def get_current_user(token: str):
-    user_data = jwt_decode(token)
-    return user_data.get("UserData")
 
-def get_current_member_id(token: str) -> int:
-    user_data = get_current_user(token)
+# One shared instance, so FastAPI resolves it once per request however many times an endpoint depends on it
+jwt_bearer = JWTBearer()
+
+
+def get_current_user(request: Request, token: str = Depends(jwt_bearer)) -> dict:
+    # JWTBearer already verified the token and left its claims on the request, nothing is decoded twice
+    return request.state.user_data
+
+def get_current_member_id(user_data: dict = Depends(get_current_user)) -> int:
     return int(user_data.get("id"))
 
 def jwt_decode(token: str):
@@ -54,3 +136,8 @@ def create_jwt_token(data: dict):
     expire = datetime.now() + timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+
+def handle_token_revocation_message(message: Optional[str]):
+    # None after a resubscribe: revocations may have been missed, so nothing cached can be trusted
+    verified_tokens.revoke(message)
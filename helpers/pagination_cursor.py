@@ -0,0 +1,31 @@
+import base64
+import json
+
+from exceptions.BaseException import InvalidCursorError
+
+CURSOR_DIRECTION_NEXT = 'next'
+CURSOR_DIRECTION_PREV = 'prev'
+
+
+def encode_cursor(price: int, book_id: int, sort_by_price: str, direction: str) -> str:
+    payload = json.dumps({"p": price, "i": book_id, "s": sort_by_price, "d": direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort_by_price: str) -> dict:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        decoded = {
+            "price": int(data["p"]),
+            "id": int(data["i"]),
+            "sort_by_price": data["s"],
+            "direction": data["d"]
+        }
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursorError()
+
+    # A cursor is only meaningful for the ordering it was issued for
+    if decoded["sort_by_price"] != sort_by_price or decoded["direction"] not in (CURSOR_DIRECTION_NEXT, CURSOR_DIRECTION_PREV):
+        raise InvalidCursorError()
+    return decoded
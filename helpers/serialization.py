@@ -0,0 +1,32 @@
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Optional
+
+import orjson
+from fastapi.responses import Response
+
+
+def dumps(content: Any) -> bytes:
+    # datetimes, enums and dataclasses are encoded natively by orjson
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class RawJSONResponse(Response):
+    # Returned from endpoints as is, so FastAPI never runs the body through jsonable_encoder
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+@lru_cache(maxsize=128)
+def row_serializer(attributes: tuple, keys: Optional[tuple] = None) -> Callable[[Any], dict]:
+    # Built once per projection, each row then costs a single attrgetter call instead of a getattr per field
+    keys = attributes if keys is None else keys
+    if len(attributes) == 1:
+        getter, key = attrgetter(attributes[0]), keys[0]
+        return lambda row: {key: getter(row)}
+    getter = attrgetter(*attributes)
+    return lambda row: dict(zip(keys, getter(row)))
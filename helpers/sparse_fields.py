@@ -0,0 +1,38 @@
+from typing import Optional
+
+from exceptions.BaseException import InvalidFieldsError
+
+
+def _split(value: str, allowed: tuple, kind: str) -> set:
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = sorted(requested - set(allowed))
+    if unknown:
+        raise InvalidFieldsError(f"Unknown {kind}: {', '.join(unknown)}")
+    return requested
+
+
+def resolve_projection(fields: Optional[str],
+                       include: Optional[str],
+                       allowed_fields: tuple,
+                       allowed_includes: tuple = (),
+                       always: tuple = ('id',)) -> tuple[tuple, tuple]:
+    # Without either parameter the endpoint keeps its full representation
+    if fields is None:
+        selected_fields = allowed_fields
+    else:
+        requested = _split(fields, allowed_fields, "fields") | set(always)
+        selected_fields = tuple(name for name in allowed_fields if name in requested)
+
+    if include is None:
+        # Asking for specific fields means relations have to be asked for as well
+        selected_includes = allowed_includes if fields is None else ()
+    else:
+        requested = _split(include, allowed_includes, "include")
+        # 'authors.city' needs 'authors' loaded first
+        for name in list(requested):
+            parts = name.split('.')
+            requested.update('.'.join(parts[:end]) for end in range(1, len(parts)))
+        selected_includes = tuple(name for name in allowed_includes if name in requested)
+
+    # Declared order, so equal requests give equal payloads and cache keys
+    return selected_fields, selected_includes
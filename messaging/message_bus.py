@@ -1,10 +1,10 @@
 import logging
-from typing import List, Union, Dict, Type, Callable
+from typing import List, Union, Dict, Type, Callable, Optional
 
 from events import commands,events
 from services.UnitOfWork import AbstractUnitOfWork, UnitOfWork
-from services.handlres import book_handler, member_handler
-from services.handlres import reservation_handler
+from services.handlres import book_handler, member_handler, book_card_handler
+from services.handlres import reservation_handler, ledger_handler
 from services.handlres.otp_handler import publish_otp_event, send_otp_handler
 
 logger = logging.getLogger(__name__)
@@ -14,7 +14,16 @@ Message = Union[commands.Command, events.Event]
 
 
 EVENT_HANDLERS = {
-    events.OTPSendEvent:[publish_otp_event]
+    events.OTPSendEvent:[publish_otp_event],
+    events.BookCreatedEvent:[book_card_handler.refresh_book_card_handler],
+    events.BookUpdatedEvent:[book_card_handler.refresh_book_card_handler],
+    events.BookReservedEvent:[book_card_handler.refresh_book_card_handler],
+    events.BooksImportedEvent:[book_card_handler.refresh_many_book_cards_handler],
+    events.BooksReservedEvent:[book_card_handler.refresh_many_book_cards_handler],
+    events.BookReleasedEvent:[book_card_handler.refresh_book_card_handler,
+                              reservation_handler.handoff_to_waitlist_handler],
+    events.WaitlistJoinedEvent:[reservation_handler.handoff_to_waitlist_handler],
+    events.WaitlistHandoffEvent:[reservation_handler.notify_waitlist_handoff_handler]
 }# type: Dict[Type[events.Event], List[Callable]]
 
 COMMAND_HANDLERS = {
@@ -23,48 +32,72 @@ COMMAND_HANDLERS = {
     commands.AddToMemberBalanceCommand:member_handler.add_to_balance_handler,
     commands.ReserveBookCommand:reservation_handler.reserve_handler,
     commands.SetMemberVIPCommand:member_handler.set_to_vip_handler,
-    commands.CreateMemberCommand:member_handler.add_member_handler
+    commands.CreateMemberCommand:member_handler.add_member_handler,
+    commands.RebuildBookCardsCommand:book_card_handler.rebuild_book_cards_handler,
+    commands.CreateBooksBatchCommand:book_handler.add_books_batch_handler,
+    commands.ReleaseExpiredReservationsCommand:reservation_handler.release_expired_reservations_handler,
+    commands.JoinWaitlistCommand:reservation_handler.join_waitlist_handler,
+    commands.LeaveWaitlistCommand:reservation_handler.leave_waitlist_handler,
+    commands.ReserveBooksCommand:reservation_handler.reserve_books_handler,
+    commands.SnapshotBalancesCommand:ledger_handler.snapshot_balances_handler,
+    commands.ReconcileBalancesCommand:ledger_handler.reconcile_balances_handler
 }# type: Dict[Type[commands.Command], Callable]
 
 class MessageBus:
     def __init__(
         self,
-        uow: UnitOfWork,
+        uow_factory: Callable[[], AbstractUnitOfWork],
         event_handlers: Dict[Type[events.Event], List[Callable]],
         command_handlers: Dict[Type[commands.Command], Callable],
+        idempotency_store=None,
     ):
-        self.uow = uow
+        self.uow_factory = uow_factory
         self.event_handlers = event_handlers
         self.command_handlers = command_handlers
+        self.idempotency_store = idempotency_store
 
-    def handle(self, message: Message):
-        self.queue = [message]
-        while self.queue:
-            message = self.queue.pop(0)
+    def handle(self, message: Message, idempotency_key: Optional[str] = None) -> list:
+        # A retried command with the same key gets the stored results instead of running again
+        if idempotency_key and self.idempotency_store is not None and isinstance(message, commands.Command):
+            return self.idempotency_store.run(idempotency_key, message, lambda: self._handle(message))
+        return self._handle(message)
+
+    def _handle(self, message: Message) -> list:
+        # Return values of the command handlers, for endpoints that report back more than "Ok".
+        # Endpoints call the bus from many threads at once, so the queue and every unit of work
+        # (one session each) belong to a single message and are never shared between calls.
+        results = []
+        queue = [message]
+        while queue:
+            message = queue.pop(0)
             logger.debug(type(message))
             if isinstance(message, events.Event):
-                self.handle_event(message)
+                self.handle_event(message, queue)
             elif isinstance(message, commands.Command):
-                self.handle_command(message)
+                results.append(self.handle_command(message, queue))
             else:
                 raise Exception(f"{message} was not an Event or Command")
+        return results
 
-    def handle_event(self, event: events.Event):
+    def handle_event(self, event: events.Event, queue: list):
         for handler in self.event_handlers[type(event)]:
             try:
                 logger.debug("handling event %s with handler %s", event, handler)
-                handler(event)
-                self.queue.extend(self.uow.collect_new_events())
+                uow = self.uow_factory()
+                handler(event, uow)
+                queue.extend(uow.collect_new_events())
             except Exception:
                 logger.exception("Exception handling event %s", event)
                 continue
 
-    def handle_command(self, command: commands.Command):
+    def handle_command(self, command: commands.Command, queue: list):
         logger.debug("handling command %s", command)
         try:
             handler = self.command_handlers[type(command)]
-            handler(command)
-            self.queue.extend(self.uow.collect_new_events())
+            uow = self.uow_factory()
+            result = handler(command, uow)
+            queue.extend(uow.collect_new_events())
+            return result
         except Exception:
             logger.exception("Exception handling command %s", command)
-            raise
\ No newline at end of file
+            raise
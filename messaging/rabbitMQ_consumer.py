@@ -0,0 +1,143 @@
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import pika
+
+from config import RABBITMQ_URL, RABBITMQ_RECONNECT_DELAY_SECONDS
+from exceptions.BaseException import BaseExceptions
+
+logger = logging.getLogger(__name__)
+
+
+# Consumes one queue with manual acks and a bounded worker pool.
+# The connection lives in the consumer thread, which is the only one that may touch it: workers hand
+# their acks back with add_callback_threadsafe. prefetch_count caps the unacked deliveries, and with that
+# the work queued in the pool. Messages are acked only after the handler returned, so whatever is in
+# flight when a process dies is redelivered by the broker.
+class RabbitMQConsumer:
+    def __init__(self,
+                 queue_name: str,
+                 handler: Callable[[bytes], None],
+                 prefetch_count: int,
+                 workers: int,
+                 drain_timeout: float,
+                 url: str = RABBITMQ_URL):
+        self.queue_name = queue_name
+        self.handler = handler
+        self.prefetch_count = prefetch_count
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.url = url
+        self._stopping = threading.Event()
+        self._abandoned = threading.Event()
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._executor = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._abandoned.clear()
+        self._thread = threading.Thread(target=self.run, name=f"{self.queue_name}-consumer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Stops taking deliveries, lets the ones in flight finish and ack, then closes
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.drain_timeout + RABBITMQ_RECONNECT_DELAY_SECONDS)
+            self._thread = None
+
+    def run(self):
+        # Blocks until stop(), reconnecting whenever the broker connection drops
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.queue_name}-worker")
+        while not self._stopping.is_set():
+            try:
+                self._consume()
+            except Exception:
+                logger.exception("%s consumer lost its connection, reconnecting", self.queue_name)
+                self._stopping.wait(RABBITMQ_RECONNECT_DELAY_SECONDS)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def _consume(self):
+        connection = pika.BlockingConnection(pika.URLParameters(self.url))
+        try:
+            channel = connection.channel()
+            channel.queue_declare(queue=self.queue_name)
+            channel.basic_qos(prefetch_count=self.prefetch_count)
+            consumer_tag = channel.basic_consume(
+                queue=self.queue_name,
+                on_message_callback=functools.partial(self._on_message, connection),
+                auto_ack=False)
+            logger.info("consuming %s with prefetch %s and %s workers", self.queue_name, self.prefetch_count, self.workers)
+            while not self._stopping.is_set():
+                connection.process_data_events(time_limit=1)
+
+            channel.basic_cancel(consumer_tag)
+            self._drain(connection)
+        finally:
+            if connection.is_open:
+                # Unacked deliveries go back to the queue for the next consumer
+                connection.close()
+
+    def _drain(self, connection):
+        # Acks are sent by this thread, so it keeps serving the connection while the workers finish
+        deadline = time.monotonic() + self.drain_timeout
+        while self._in_flight and time.monotonic() < deadline:
+            connection.process_data_events(time_limit=0.1)
+        if self._in_flight:
+            logger.warning("%s messages of %s still running after %ss, leaving them to redelivery",
+                           self._in_flight, self.queue_name, self.drain_timeout)
+            self._abandoned.set()
+        connection.process_data_events(time_limit=0)
+
+    def _on_message(self, connection, channel, method, properties, body):
+        with self._in_flight_lock:
+            self._in_flight += 1
+        self._executor.submit(self._process, connection, channel, method, body)
+
+    def _process(self, connection, channel, method, body):
+        try:
+            # Not started before the drain gave up: the broker redelivers it, running it here would duplicate it
+            if self._abandoned.is_set():
+                return
+            try:
+                self.handler(body)
+                outcome = self._ack
+            except BaseExceptions as error:
+                # A rejected request (throttled, invalid number) would fail the same way again
+                logger.warning("%s message rejected: %s", self.queue_name, error)
+                outcome = self._ack
+            except Exception:
+                logger.exception("%s message failed%s", self.queue_name, ", dropping it" if method.redelivered else "")
+                # One retry through the queue, a message failing twice is not requeued again
+                outcome = self._reject if method.redelivered else self._requeue
+            try:
+                connection.add_callback_threadsafe(functools.partial(outcome, channel, method.delivery_tag))
+            except Exception:
+                logger.warning("%s connection closed before the ack, the message will be redelivered", self.queue_name)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+
+    @staticmethod
+    def _ack(channel, delivery_tag):
+        if channel.is_open:
+            channel.basic_ack(delivery_tag)
+
+    @staticmethod
+    def _requeue(channel, delivery_tag):
+        if channel.is_open:
+            channel.basic_nack(delivery_tag, requeue=True)
+
+    @staticmethod
+    def _reject(channel, delivery_tag):
+        if channel.is_open:
+            channel.basic_nack(delivery_tag, requeue=False)
@@ -0,0 +1,61 @@
+import logging
+import threading
+from typing import Callable, Optional
+
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY_SECONDS = 5
+
+
+# One background thread per process that fans Redis pub/sub messages out to in-process handlers.
+# Handlers get the message payload, or None right after (re)subscribing since messages published
+# while the connection was down are lost and local state has to be treated as stale.
+class RedisPubSubListener:
+    def __init__(self, cache: SyncMemoryCacheRepository):
+        self._cache = cache
+        self._handlers: dict[str, list[Callable[[Optional[str]], None]]] = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def subscribe(self, channel: str, handler: Callable[[Optional[str]], None]):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def start(self):
+        if self._thread is not None or not self._handlers:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="redis-pubsub", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=RECONNECT_DELAY_SECONDS)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            pubsub = self._cache.pubsub()
+            try:
+                pubsub.subscribe(*self._handlers)
+                for channel in self._handlers:
+                    self._dispatch(channel, None)
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._dispatch(message["channel"].decode('utf-8'), message["data"].decode('utf-8'))
+            except Exception:
+                logger.exception("redis pub/sub connection lost, reconnecting")
+                self._stopped.wait(RECONNECT_DELAY_SECONDS)
+            finally:
+                pubsub.close()
+
+    def _dispatch(self, channel: str, payload: Optional[str]):
+        for handler in self._handlers.get(channel, []):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception("pub/sub handler for %s failed", channel)
+
@@ -0,0 +1,78 @@
+import csv
+import io
+from typing import Iterator, Optional
+
+from adapters.repositories.BookCardRepository import BookCardRepository
+from config import BOOK_EXPORT_BATCH_SIZE
+from helpers.serialization import dumps
+from services.UnitOfWork import UnitOfWork
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+CSV_COLUMNS = ["id", "title", "genres", "isbn", "release_date", "price", "status", "authors"]
+
+
+def _ndjson_line(card: dict) -> str:
+    return dumps(card).decode('utf-8') + "\n"
+
+
+def _csv_row(card: dict) -> list:
+    authors = "; ".join(
+        f"{author['first_name']} {author['last_name']}" + (f" ({author['city']['title']})" if author.get('city') else "")
+        for author in card["authors"]
+    )
+    return [card["id"], card["title"], "|".join(card["genres"]), card["isbn"],
+            card["release_date"].isoformat(), card["price"], card["status"], authors]
+
+
+def stream_book_export(
+        export_format: str,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        after_id: Optional[int] = None) -> Iterator[str]:
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise ValueError(f"Unsupported export format '{export_format}', use one of {', '.join(EXPORT_MEDIA_TYPES)}")
+    return _generate(export_format, search, min_price, max_price, genres, genres_match, city_id, after_id)
+
+
+def _generate(export_format, search, min_price, max_price, genres, genres_match, city_id, after_id) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(CSV_COLUMNS)
+
+    with UnitOfWork() as uow:
+        repo = uow.get_repository(BookCardRepository)
+        cards = repo.stream_book_cards(
+            search=search,
+            min_price=min_price,
+            max_price=max_price,
+            genres=genres,
+            genres_match=genres_match,
+            city_id=city_id,
+            after_id=after_id,
+            batch_size=BOOK_EXPORT_BATCH_SIZE)
+
+        # Rows are flushed to the client one batch at a time, so memory stays flat for any catalog size
+        pending = 0
+        for card in cards:
+            if export_format == "csv":
+                writer.writerow(_csv_row(card))
+            else:
+                buffer.write(_ndjson_line(card))
+            pending += 1
+            if pending == BOOK_EXPORT_BATCH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+from typing import Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from adapters.repositories.MemoryCacheRepository import MemoryCacheRepository, SyncMemoryCacheRepository
+from config import BOOK_LIST_CACHE_ENABLED, BOOK_LIST_CACHE_TTL_SECONDS, BOOK_LIST_CACHE_MAX_ENTRY_BYTES
+from domains.models.BookManagementModels import normalize_genres
+from helpers.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+BOOK_LIST_CACHE_PREFIX = "books:list"
+BOOK_LIST_VERSION_KEY = f"{BOOK_LIST_CACHE_PREFIX}:version"
+BOOK_LIST_HITS_KEY = f"{BOOK_LIST_CACHE_PREFIX}:stats:hits"
+BOOK_LIST_MISSES_KEY = f"{BOOK_LIST_CACHE_PREFIX}:stats:misses"
+BOOK_LIST_OVERSIZE_KEY = f"{BOOK_LIST_CACHE_PREFIX}:stats:oversize"
+
+
+def _normalize_price(price: Optional[float]):
+    if price is None:
+        return None
+    return int(price) if float(price).is_integer() else float(price)
+
+
+def normalize_book_list_filters(
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        genres: Optional[list[str]] = None,
+        genres_match: str = 'any',
+        city_id: Optional[int] = None,
+        page: int = 1,
+        per_page: int = 10,
+        sort_by_price: str = 'asc',
+        sort_by_relevance: bool = False,
+        pagination: str = 'page',
+        cursor: Optional[str] = None,
+        with_total: bool = False,
+        fields: tuple = (),
+        include: tuple = ()) -> tuple:
+    # Requests that the repository answers identically must map to the same tuple
+    search = search.strip().lower() if search and search.strip() else None
+    genres = tuple(sorted(normalize_genres(genres))) if genres else ()
+    cursor_mode = pagination == 'cursor' or cursor is not None
+    return (
+        search,
+        _normalize_price(min_price),
+        _normalize_price(max_price),
+        genres,
+        'all' if genres and genres_match == 'all' else 'any',
+        city_id,
+        None if cursor_mode else page,
+        per_page,
+        'asc' if sort_by_price == 'asc' else 'desc',
+        bool(search and sort_by_relevance and not cursor_mode),
+        cursor_mode,
+        cursor,
+        bool(cursor_mode and with_total),
+        fields,
+        include
+    )
+
+
+def _cache_key(version: bytes, filters: tuple) -> str:
+    digest = hashlib.sha1(json.dumps(filters).encode('utf-8')).hexdigest()
+    return f"{BOOK_LIST_CACHE_PREFIX}:v{int(version or 0)}:{digest}"
+
+
+async def get_cached_book_list(repo: MemoryCacheRepository, filters: tuple, loader: Callable[[], dict]) -> bytes:
+    if not BOOK_LIST_CACHE_ENABLED:
+        return _encode(await run_in_threadpool(loader))
+
+    try:
+        version = await repo.get(BOOK_LIST_VERSION_KEY)
+        key = _cache_key(version, filters)
+        cached = await repo.get(key)
+    except Exception:
+        # The cache is an optimization, a Redis outage must not take the listing down
+        logger.exception("book list cache lookup failed")
+        return _encode(await run_in_threadpool(loader))
+
+    if cached is not None:
+        try:
+            await repo.incr(BOOK_LIST_HITS_KEY)
+        except Exception:
+            logger.exception("could not count a book list cache hit")
+        return cached
+
+    body = _encode(await run_in_threadpool(loader))
+    try:
+        async with repo.pipeline() as pipe:
+            pipe.incr(BOOK_LIST_MISSES_KEY)
+            # Very large pages are not worth the Redis memory, they are served uncached
+            if len(body) > BOOK_LIST_CACHE_MAX_ENTRY_BYTES:
+                pipe.incr(BOOK_LIST_OVERSIZE_KEY)
+            else:
+                pipe.set(key, body, BOOK_LIST_CACHE_TTL_SECONDS)
+    except Exception:
+        # The page is already loaded, it is served even if it could not be cached
+        logger.exception("could not store the book list in the cache")
+    return body
+
+
+def bump_book_list_version(cache: SyncMemoryCacheRepository) -> None:
+    # Entries of older versions are never read again and simply expire with their TTL
+    try:
+        cache.incr(BOOK_LIST_VERSION_KEY)
+    except Exception:
+        logger.exception("could not invalidate the book list cache")
+
+
+async def get_book_list_cache_stats(repo: MemoryCacheRepository) -> dict:
+    version, hits, misses, oversize = await repo.get_many(
+        [BOOK_LIST_VERSION_KEY, BOOK_LIST_HITS_KEY, BOOK_LIST_MISSES_KEY, BOOK_LIST_OVERSIZE_KEY])
+    hits, misses = int(hits or 0), int(misses or 0)
+    return {
+        "version": int(version or 0),
+        "hits": hits,
+        "misses": misses,
+        "oversize": int(oversize or 0),
+        "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None
+    }
+
+
+def _encode(result: dict) -> bytes:
+    return dumps(result)
@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from adapters.repositories.AuthorRepository import AuthorRepository
+from adapters.repositories.BookRepository import BookRepository
+from config import CATALOG_INDEX_MAX_AGE_SECONDS
+from domains.models.BookManagementModels import ReservationStatus
+from services.UnitOfWork import UnitOfWork
+
+logger = logging.getLogger(__name__)
+
+STATUS_CODES = {status: code for code, status in enumerate(ReservationStatus)}
+NO_CITY = -1
+NO_ROW = -1
+
+
+# In-process columnar copy of the fields the cheap /books filters need.
+# Rows hold book id, price and status. Authors are kept CSR style: every row points at a
+# [start, end) slice of the entry arrays and author ids map to their city through a dense array.
+# An updated book gets a fresh slice at the tail, stale slices are dropped when the index compacts.
+class CatalogIndex:
+
+    def __init__(self, loader: Callable[[Optional[list[int]]], tuple], max_age: int = CATALOG_INDEX_MAX_AGE_SECONDS):
+        # loader(book_ids) returns (book rows, author city rows); book_ids None means the whole catalog
+        self._loader = loader
+        self._max_age = max_age
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._loaded_at = None
+        self._reset(0, 0)
+
+    def _reset(self, rows: int, entries: int):
+        self._size = 0
+        self._entry_size = 0
+        self._garbage = 0
+        self._row_of = {}
+        self._ids = np.zeros(max(rows, 16), dtype=np.int64)
+        self._prices = np.zeros(max(rows, 16), dtype=np.int64)
+        self._statuses = np.zeros(max(rows, 16), dtype=np.int8)
+        self._starts = np.zeros(max(rows, 16), dtype=np.int64)
+        self._ends = np.zeros(max(rows, 16), dtype=np.int64)
+        self._entry_author = np.zeros(max(entries, 16), dtype=np.int64)
+        self._entry_row = np.full(max(entries, 16), NO_ROW, dtype=np.int64)
+        self._author_city = np.full(16, NO_CITY, dtype=np.int64)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def can_answer(self, search: Optional[str], genres: Optional[list[str]]) -> bool:
+        # Text search and genres stay with Postgres, the index only knows price, status and city
+        return not search and not genres
+
+    def load(self):
+        books, author_cities = self._loader(None)
+        with self._lock:
+            self._reset(len(books), sum(len(author_ids) for _, _, _, author_ids in books))
+            self._set_author_cities(author_cities)
+            for book_id, price, status, author_ids in books:
+                self._upsert(book_id, price, status, author_ids)
+            self._loaded_at = time.monotonic()
+        logger.info("catalog index loaded with %s books", len(books))
+
+    def refresh_books(self, book_ids: Iterable[int]):
+        if not self.loaded:
+            return
+        books, author_cities = self._loader(list(book_ids))
+        with self._lock:
+            self._set_author_cities(author_cities)
+            for book_id, price, status, author_ids in books:
+                self._upsert(book_id, price, status, author_ids)
+
+    def query(self,
+              min_price: Optional[float] = None,
+              max_price: Optional[float] = None,
+              city_id: Optional[int] = None,
+              status: Optional[ReservationStatus] = None,
+              sort_by_price: str = 'asc',
+              offset: int = 0,
+              limit: int = 10) -> list[int]:
+        self._ensure_fresh()
+        with self._lock:
+            size = self._size
+            ids = self._ids[:size]
+            prices = self._prices[:size]
+
+            mask = np.ones(size, dtype=bool)
+            if min_price is not None:
+                mask &= prices >= min_price
+            if max_price is not None:
+                mask &= prices <= max_price
+            if status is not None:
+                mask &= self._statuses[:size] == STATUS_CODES[status]
+            if city_id is not None:
+                entry_rows = self._entry_row[:self._entry_size]
+                entry_cities = self._author_city[self._entry_author[:self._entry_size]]
+                matched_rows = entry_rows[(entry_cities == city_id) & (entry_rows != NO_ROW)]
+                in_city = np.zeros(size, dtype=bool)
+                in_city[matched_rows] = True
+                mask &= in_city
+
+            candidates = np.flatnonzero(mask)
+            end = offset + limit
+            if offset >= len(candidates) or limit <= 0:
+                return []
+
+            # (price, id) folded into one sortable key, so one partition + sort replaces a full lexsort
+            key = prices[candidates] * (int(ids.max()) + 1) + ids[candidates]
+            if sort_by_price != 'asc':
+                key = -key
+            if end < len(candidates):
+                head = np.argpartition(key, end - 1)[:end]
+                order = head[np.argsort(key[head], kind='stable')]
+            else:
+                order = np.argsort(key, kind='stable')
+            return ids[candidates[order[offset:end]]].tolist()
+
+    def _ensure_fresh(self):
+        # Other workers change the catalog too, a periodic full load bounds how stale this copy gets
+        if not self._is_stale():
+            return
+        # One thread reloads, the others keep answering from the current copy meanwhile
+        if self._reload_lock.acquire(blocking=not self.loaded):
+            try:
+                if self._is_stale():
+                    self.load()
+            finally:
+                self._reload_lock.release()
+
+    def _is_stale(self) -> bool:
+        return not self.loaded or time.monotonic() - self._loaded_at > self._max_age
+
+    def _set_author_cities(self, author_cities):
+        for author_id, city_id in author_cities:
+            if author_id >= len(self._author_city):
+                grown = np.full(max(author_id + 1, len(self._author_city) * 2), NO_CITY, dtype=np.int64)
+                grown[:len(self._author_city)] = self._author_city
+                self._author_city = grown
+            self._author_city[author_id] = NO_CITY if city_id is None else city_id
+
+    def _upsert(self, book_id: int, price: int, status: ReservationStatus, author_ids: list[int]):
+        row = self._row_of.get(book_id)
+        if row is None:
+            row = self._size
+            if row == len(self._ids):
+                self._grow_rows()
+            self._size += 1
+            self._row_of[book_id] = row
+            self._ids[row] = book_id
+        else:
+            start, end = self._starts[row], self._ends[row]
+            self._entry_row[start:end] = NO_ROW
+            self._garbage += int(end - start)
+
+        self._prices[row] = price
+        self._statuses[row] = STATUS_CODES[status]
+
+        author_ids = [author_id for author_id in author_ids if author_id is not None]
+        while self._entry_size + len(author_ids) > len(self._entry_author):
+            self._grow_entries()
+        start = self._entry_size
+        end = start + len(author_ids)
+        self._entry_author[start:end] = author_ids
+        self._entry_row[start:end] = row
+        self._starts[row], self._ends[row] = start, end
+        self._entry_size = end
+
+        # Ids handed out to new authors are not in the dense city map yet
+        if author_ids and max(author_ids) >= len(self._author_city):
+            self._set_author_cities([(max(author_ids), None)])
+
+        if self._garbage > self._entry_size // 2 > 0:
+            self._compact()
+
+    def _grow_rows(self):
+        capacity = len(self._ids) * 2
+        for name in ('_ids', '_prices', '_statuses', '_starts', '_ends'):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _grow_entries(self):
+        capacity = len(self._entry_author) * 2
+        entry_author = np.zeros(capacity, dtype=np.int64)
+        entry_author[:self._entry_size] = self._entry_author[:self._entry_size]
+        entry_row = np.full(capacity, NO_ROW, dtype=np.int64)
+        entry_row[:self._entry_size] = self._entry_row[:self._entry_size]
+        self._entry_author, self._entry_row = entry_author, entry_row
+
+    def _compact(self):
+        # Repack live slices in row order, which gives back a plain CSR layout
+        lengths = self._ends[:self._size] - self._starts[:self._size]
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        live = np.flatnonzero(self._entry_row[:self._entry_size] != NO_ROW)
+        live = live[np.argsort(self._entry_row[live], kind='stable')]
+        capacity = max(len(live) * 2, 16)
+        entry_author = np.zeros(capacity, dtype=np.int64)
+        entry_author[:len(live)] = self._entry_author[live]
+        entry_row = np.full(capacity, NO_ROW, dtype=np.int64)
+        entry_row[:len(live)] = np.repeat(np.arange(self._size), lengths)
+        self._entry_author, self._entry_row = entry_author, entry_row
+        self._starts[:self._size] = indptr[:-1]
+        self._ends[:self._size] = indptr[1:]
+        self._entry_size = len(live)
+        self._garbage = 0
+
+
+def load_catalog_rows(book_ids: Optional[list[int]]) -> tuple:
+    with UnitOfWork() as uow:
+        books = uow.get_repository(BookRepository).get_catalog_rows(book_ids)
+        author_cities = uow.get_repository(AuthorRepository).get_author_city_ids()
+        return books, author_cities
+
+
+catalog_index = CatalogIndex(load_catalog_rows)
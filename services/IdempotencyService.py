@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from dataclasses import asdict
+from typing import Callable
+
+import orjson
+
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository
+from config import IDEMPOTENCY_RESULT_TTL_SECONDS, IDEMPOTENCY_LOCK_TTL_SECONDS, IDEMPOTENCY_WAIT_SECONDS, \
+    IDEMPOTENCY_POLL_INTERVAL_SECONDS
+from events.commands import Command
+from exceptions.BaseException import IdempotencyKeyReusedError, IdempotencyRequestInProgressError
+from helpers.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_PREFIX = "idempotency"
+STATE_PENDING = "pending"
+STATE_DONE = "done"
+
+
+def command_fingerprint(command: Command) -> str:
+    payload = orjson.dumps([type(command).__name__, asdict(command)], option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _public_attributes(value):
+    # Handlers may return entities, only their plain attributes are kept for the replay
+    if hasattr(value, '__dict__'):
+        return {name: attribute for name, attribute in vars(value).items() if not name.startswith('_')}
+    raise TypeError
+
+
+# Remembers the outcome of a command per client supplied key.
+# The first call takes a short lived pending marker with SET NX and runs the command, duplicates that arrive
+# meanwhile poll until the outcome is stored and later retries replay it without touching the database.
+# The marker is a lease renewed while the command runs, so slow commands do not lose it to a duplicate.
+# A failed call removes its marker, so the client can retry it for real.
+class IdempotencyStore:
+
+    def __init__(self,
+                 cache: SyncMemoryCacheRepository,
+                 result_ttl: int = IDEMPOTENCY_RESULT_TTL_SECONDS,
+                 lock_ttl: int = IDEMPOTENCY_LOCK_TTL_SECONDS,
+                 wait: float = IDEMPOTENCY_WAIT_SECONDS,
+                 poll_interval: float = IDEMPOTENCY_POLL_INTERVAL_SECONDS):
+        self._cache = cache
+        self._result_ttl = result_ttl
+        self._lock_ttl = lock_ttl
+        self._wait = wait
+        self._poll_interval = poll_interval
+
+    def run(self, idempotency_key: str, command: Command, execute: Callable[[], list]) -> list:
+        # Keys are scoped per command type and hashed, so their length and content do not matter
+        key = f"{IDEMPOTENCY_PREFIX}:{type(command).__name__}:{hashlib.sha1(idempotency_key.encode('utf-8')).hexdigest()}"
+        fingerprint = command_fingerprint(command)
+        deadline = time.monotonic() + self._wait
+        while True:
+            pending = dumps({"state": STATE_PENDING, "fingerprint": fingerprint, "token": uuid.uuid4().hex})
+            try:
+                acquired = self._cache.set_if_absent(key, pending, self._lock_ttl)
+            except Exception:
+                # Without Redis duplicates can not be detected, the command still runs once per call
+                logger.exception("idempotency store unavailable, running %s without it", type(command).__name__)
+                return execute()
+            if acquired:
+                return self._execute(key, pending, fingerprint, execute)
+
+            try:
+                stored = self._cache.get(key)
+            except Exception:
+                # Another call holds the key and may still commit, running it here could apply it twice
+                logger.exception("idempotency store unavailable while %s is in progress", type(command).__name__)
+                raise IdempotencyRequestInProgressError()
+            if stored is None:
+                # The first call failed and released the key, this one takes over
+                continue
+            entry = orjson.loads(stored)
+            if entry["fingerprint"] != fingerprint:
+                raise IdempotencyKeyReusedError()
+            if entry["state"] == STATE_DONE:
+                return entry["results"]
+            if time.monotonic() >= deadline:
+                raise IdempotencyRequestInProgressError()
+            time.sleep(self._poll_interval)
+
+    def _renew_lease(self, key: str, pending: bytes, finished: threading.Event):
+        while not finished.wait(self._lock_ttl / 3):
+            try:
+                if not self._cache.expire_if_equal(key, pending, self._lock_ttl):
+                    logger.warning("idempotency lease on %s was lost before the command finished", key)
+                    return
+            except Exception:
+                logger.exception("could not renew the idempotency lease on %s", key)
+
+    def _execute(self, key: str, pending: bytes, fingerprint: str, execute: Callable[[], list]) -> list:
+        finished = threading.Event()
+        threading.Thread(target=self._renew_lease, args=(key, pending, finished),
+                         name="idempotency-lease", daemon=True).start()
+        try:
+            results = execute()
+        except Exception:
+            finished.set()
+            try:
+                self._cache.delete_if_equal(key, pending)
+            except Exception:
+                logger.exception("could not release the idempotency key %s", key)
+            raise
+        finished.set()
+        try:
+            body = orjson.dumps({"state": STATE_DONE, "fingerprint": fingerprint, "results": results},
+                                default=_public_attributes, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Only the stored replay is emptied, this caller still gets the real results
+            logger.warning("result of idempotent command is not serializable, storing it empty")
+            body = dumps({"state": STATE_DONE, "fingerprint": fingerprint, "results": [None] * len(results)})
+        try:
+            self._cache.set(key, body, self._result_ttl)
+        except Exception:
+            # The command is committed, its caller gets the outcome even though retries can not replay it
+            logger.exception("could not store the outcome of idempotency key %s", key)
+        return results
@@ -1,104 +1,102 @@
 import logging
 import random
-from collections import defaultdict
-from datetime import datetime, timedelta
+import uuid
 
 from uvicorn.config import LOG_LEVELS
 
+from adapters.repositories.MemoryCacheRepository import MemoryCacheRepository, SyncMemoryCacheRepository
 from config import OTP_EXPIRY_MINUTES, OTP_REQUEST_LIMIT_PER_2_MINUTES, OTP_REQUEST_LIMIT_PER_HOUR
-from exceptions.BaseException import NotValidPhoneNumberError, NoOTPRequestError, OTPExpiredError, \
+from exceptions.BaseException import NotValidPhoneNumberError, NoOTPRequestError, \
     InvalidOTPError, OTPMaximumRequestInTwoMinutesError, OTPMaximumRequestInOneHourError
 from helpers.PhoneNumberValidation import is_valid_mobile
-
-otp_store = {}
-otp_requests = defaultdict(list)
+from services.SMSProviderService import sms_dispatcher, SMSDeliveryError
+
+OTP_CODE_PREFIX = "otp:code"
+OTP_REQUESTS_PREFIX = "otp:requests"
+# (window ms, limit) pairs checked from the longest window down
+OTP_REQUEST_LIMITS = (60 * 60 * 1000, OTP_REQUEST_LIMIT_PER_HOUR, 2 * 60 * 1000, OTP_REQUEST_LIMIT_PER_2_MINUTES)
+
+# Sorted set of request timestamps per phone number, trimmed to the longest window on every call.
+# Returns 0 and records the request when it is allowed, otherwise the 1-based index of the violated window.
+# Uses the Redis clock, so workers with drifting clocks still share one window.
+SLIDING_WINDOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local longest = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - longest)
+for i = 2, #ARGV, 2 do
+    local window, limit = tonumber(ARGV[i]), tonumber(ARGV[i + 1])
+    if redis.call('ZCOUNT', KEYS[1], '(' .. (now - window), '+inf') >= limit then
+        return i / 2
+    end
+end
+redis.call('ZADD', KEYS[1], now, ARGV[1])
+redis.call('PEXPIRE', KEYS[1], longest)
+return 0
+"""
+
+# 1 when the code matches and is consumed, 0 without a pending code, -1 on a wrong code
+VERIFY_OTP_SCRIPT = """
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return 0
+end
+if stored ~= ARGV[1] then
+    return -1
+end
+redis.call('DEL', KEYS[1])
+return 1
+"""
 
 logger = logging.getLogger(__name__)
 
-class SMSProviderInterface:
-    def send_otp(self, otp, phone_number):
-        raise NotImplementedError()
-
-class KaveNegarProvider(SMSProviderInterface):
-    def send_otp(self, otp, phone_number):
-        print(f"KaveNegar: Sending OTP to {phone_number}")
-        if random.choice([True, False]):
-            raise Exception("KaveNegar is down!")
-
-class SignalProvider(SMSProviderInterface):
-
-    def send_otp(self, otp,phone_number):
-        print(f"Signal: Sending OTP to {phone_number}")
-        if random.choice([True, False]):
-            raise Exception("Signal is down!")
-
-class CircuitBreaker:
-    def __init__(self, providers):
-        self.providers = providers
-        self.current_provider_index = 0
-
-    def send_otp(self, otp, phone_number):
-        for _ in range(len(self.providers)):
-            provider = self.providers[self.current_provider_index]
-            try:
-                provider.send_otp(otp, phone_number)
-                return
-            except Exception as e:
-                print(e)
-                self.current_provider_index = (self.current_provider_index + 1) % len(self.providers)
-        print("All providers are currently unavailable.")
-
-
-
-def check_throttling(phone_number):
-    now = datetime.now()
 
-    otp_requests[phone_number] = [t for t in otp_requests[phone_number] if t > now - timedelta(hours=1)]
-
-    if len(otp_requests[phone_number]) >= OTP_REQUEST_LIMIT_PER_HOUR:
+def check_throttling(cache: SyncMemoryCacheRepository, phone_number) -> str:
+    # Both windows are checked and the request recorded by one script, so parallel requests on
+    # other workers can not slip past the limits. The set never holds more than an hour of requests.
+    request_id = uuid.uuid4().hex
+    violated = cache.run_script(
+        SLIDING_WINDOW_SCRIPT,
+        [f"{OTP_REQUESTS_PREFIX}:{phone_number}"],
+        [request_id, *OTP_REQUEST_LIMITS])
+    if violated == 1:
         raise OTPMaximumRequestInOneHourError()
-
-    if len([t for t in otp_requests[phone_number] if
-            t > now - timedelta(minutes=2)]) >= OTP_REQUEST_LIMIT_PER_2_MINUTES:
+    if violated == 2:
         raise OTPMaximumRequestInTwoMinutesError()
-
-    otp_requests[phone_number].append(now)
+    return request_id
 
 # OTP generation and storage
-def generate_otp(phone_number:str):
-    # Add to the request dict and raise error if violates rules
-    check_throttling(phone_number)
-
+def generate_otp(cache: SyncMemoryCacheRepository, phone_number:str):
     if not is_valid_mobile(phone_number):
-        raise Exception("Invalid mobile number!")
+        raise NotValidPhoneNumberError()
+
+    # Add to the request windows and raise error if violates rules
+    request_id = check_throttling(cache, phone_number)
 
     otp = random.randint(100000, 999999)
-    expiration_time = datetime.now() + timedelta(minutes=OTP_EXPIRY_MINUTES)
-    otp_store[phone_number] = {"otp": otp, "expires": expiration_time}
+    # Redis drops the code once it expires, whichever worker verifies it
+    cache.set(f"{OTP_CODE_PREFIX}:{phone_number}", otp, OTP_EXPIRY_MINUTES * 60)
 
-    # Send OTP using circuit breaker
-    providers = [KaveNegarProvider(), SignalProvider()]
-    circuit_breaker = CircuitBreaker(providers)
-    circuit_breaker.send_otp(otp, phone_number)
+    # Shared breakers and hedging across providers, see SMSDispatcher
+    if sms_dispatcher.deliver(otp, phone_number) is None:
+        # The code never reached the user, so the retry of this request must not count against the limits twice
+        cache.zrem(f"{OTP_REQUESTS_PREFIX}:{phone_number}", request_id)
+        raise SMSDeliveryError("All providers are currently unavailable.")
 
     print(f"OTP Verification Code: {otp}")
 
 # Verify OTP
-def verify_otp(phone_number:str, user_otp:int):
+async def verify_otp(cache: MemoryCacheRepository, phone_number:str, user_otp:int):
 
     if not is_valid_mobile(phone_number):
         raise NotValidPhoneNumberError()
 
-    if phone_number not in otp_store:
+    # Compared and consumed atomically, a code verifies at most once
+    verified = await cache.run_script(
+        VERIFY_OTP_SCRIPT, [f"{OTP_CODE_PREFIX}:{phone_number}"], [str(user_otp)])
+    if verified == 0:
+        # Expired codes are gone as well, so both end up here
         raise NoOTPRequestError()
-
-    otp_data = otp_store[phone_number]
-    if datetime.now() > otp_data["expires"]:
-        del otp_store[phone_number]
-        raise OTPExpiredError()
-
-    if otp_data["otp"] == user_otp:
-        del otp_store[phone_number]
+    if verified == 1:
         return True, "OTP verified successfully!"
-    else:
-        raise InvalidOTPError()
+    raise InvalidOTPError()
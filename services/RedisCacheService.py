@@ -1,18 +1,19 @@
 from adapters.repositories.MemoryCacheRepository import MemoryCacheRepository
 
 
-async def get_redis_cache(key:str):
-    repo = MemoryCacheRepository()
+async def get_redis_cache(repo: MemoryCacheRepository, key:str):
     return await repo.get(key)
 
 async def set_redis_cache(
+        repo: MemoryCacheRepository,
         key:str,
         value:str,
         expires:int
 )->None:
-    repo = MemoryCacheRepository()
     await repo.set(key, value, expires)
 
-async def delete_redis_cache(key:str):
-    repo = MemoryCacheRepository()
-    await repo.delete(key)
\ No newline at end of file
+async def delete_redis_cache(repo: MemoryCacheRepository, key:str):
+    await repo.delete(key)
+
+async def publish_redis_message(repo: MemoryCacheRepository, channel:str, message:str):
+    await repo.publish(channel, message)
\ No newline at end of file
@@ -0,0 +1,88 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from fastapi import Response
+
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository
+from config import REFERENCE_DATA_CACHE_TTL_SECONDS, REFERENCE_DATA_CACHE_MAX_ENTRIES
+from helpers.serialization import dumps, RawJSONResponse
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_DATA_CHANNEL = "reference-data:invalidate"
+ALL_REFERENCE_DATA = "*"
+# Author payloads embed city titles, so a city change has to drop them too
+REFERENCE_DATA_DEPENDENTS = {"cities": ("cities", "authors")}
+
+
+# Process-local cache of rendered reference data responses, bounded by age and entry count.
+# Keys are tuples starting with the data set name, e.g. ("authors", fields, include).
+class ReferenceDataCache:
+    def __init__(self, ttl: int = REFERENCE_DATA_CACHE_TTL_SECONDS, max_entries: int = REFERENCE_DATA_CACHE_MAX_ENTRIES):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, loader: Callable[[], dict]) -> tuple[bytes, str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1], entry[2]
+            generation = self._generation
+
+        # Loaded outside the lock so a slow query does not block readers of other keys
+        body = dumps(loader())
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        with self._lock:
+            # An invalidation that arrived while loading may have made this result stale already
+            if generation == self._generation:
+                self._entries[key] = (now + self._ttl, body, etag)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        return body, etag
+
+    def invalidate(self, name: Optional[str] = None):
+        with self._lock:
+            self._generation += 1
+            if name is None or name == ALL_REFERENCE_DATA:
+                self._entries.clear()
+                return
+            names = REFERENCE_DATA_DEPENDENTS.get(name, (name,))
+            for key in [key for key in self._entries if key[0] in names]:
+                del self._entries[key]
+
+
+reference_data_cache = ReferenceDataCache()
+
+
+def invalidate_reference_data(cache: SyncMemoryCacheRepository, name: Optional[str] = None):
+    reference_data_cache.invalidate(name)
+    # Other workers drop their copies when the message reaches their listener
+    try:
+        cache.publish(REFERENCE_DATA_CHANNEL, name or ALL_REFERENCE_DATA)
+    except Exception:
+        logger.exception("could not publish reference data invalidation")
+
+
+def handle_reference_data_message(message: Optional[str]):
+    reference_data_cache.invalidate(message)
+
+
+def reference_data_response(key: tuple, loader: Callable[[], dict], if_none_match: Optional[str]) -> Response:
+    body, etag = reference_data_cache.get(key, loader)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match is not None:
+        # Clients may send several tags, weak ones included
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(',')}
+        if etag in tags or ALL_REFERENCE_DATA in tags:
+            return Response(status_code=304, headers=headers)
+    return RawJSONResponse(body, headers=headers)
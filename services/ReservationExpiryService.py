@@ -0,0 +1,108 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository, MemoryCacheRepository
+from adapters.repositories.ReservationRepository import ReservationRepository
+from config import RESERVATION_EXPIRY_BATCH_SIZE, RESERVATION_EXPIRY_INTERVAL_SECONDS, \
+    RESERVATION_EXPIRY_MAX_BATCHES_PER_RUN
+from events.commands import ReleaseExpiredReservationsCommand
+from helpers.serialization import dumps
+from messaging.message_bus import MessageBus
+from services.UnitOfWork import UnitOfWork
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_EXPIRY_STATS_KEY = "reservations:expiry:stats"
+RESERVATION_EXPIRY_RELEASED_KEY = "reservations:expiry:released"
+
+
+# Releases expired reservations in bounded batches through the message bus, so every release
+# raises its BookReleasedEvent. Works as an asyncio task in the app or as a blocking worker loop,
+# and any number of sweepers can run at once since each batch skips rows another one holds.
+class ReservationExpirySweeper:
+    def __init__(self,
+                 bus: MessageBus,
+                 cache: SyncMemoryCacheRepository,
+                 batch_size: int = RESERVATION_EXPIRY_BATCH_SIZE,
+                 interval: int = RESERVATION_EXPIRY_INTERVAL_SECONDS,
+                 max_batches: int = RESERVATION_EXPIRY_MAX_BATCHES_PER_RUN):
+        self.bus = bus
+        self.cache = cache
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_batches = max_batches
+
+    def run_once(self) -> dict:
+        started = time.monotonic()
+        now = datetime.now()
+        lag = self._lag(now)
+
+        released = 0
+        batches = 0
+        last_batch_size = 0
+        # A full batch means there is probably more, a short one means the backlog is drained
+        while batches < self.max_batches:
+            last_batch_size = self.bus.handle(ReleaseExpiredReservationsCommand(self.batch_size))[0]
+            batches += 1
+            released += last_batch_size
+            if last_batch_size < self.batch_size:
+                break
+
+        stats = {
+            "last_run_at": now,
+            "lag_seconds": lag,
+            "released": released,
+            "batches": batches,
+            "last_batch_size": last_batch_size,
+            "batch_size": self.batch_size,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1)
+        }
+        self._record(stats)
+        if released:
+            logger.info("released %s expired reservations in %s batches, lag %.0fs", released, batches, lag)
+        return stats
+
+    def run_forever(self, stopped: threading.Event):
+        while not stopped.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("reservation expiry run failed")
+            stopped.wait(self.interval)
+
+    async def run(self):
+        while True:
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception:
+                logger.exception("reservation expiry run failed")
+            await asyncio.sleep(self.interval)
+
+    def _lag(self, now: datetime) -> float:
+        # Age of the oldest reservation that should have been released already, 0 when caught up
+        with UnitOfWork() as uow:
+            oldest = uow.get_repository(ReservationRepository).get_oldest_expired_end_date(now)
+        return round((now - oldest).total_seconds(), 1) if oldest else 0.0
+
+    def _record(self, stats: dict):
+        try:
+            with self.cache.pipeline() as pipe:
+                pipe.set(RESERVATION_EXPIRY_STATS_KEY, dumps(stats), self.interval * 10)
+                if stats["released"]:
+                    pipe.incr(RESERVATION_EXPIRY_RELEASED_KEY, stats["released"])
+        except Exception:
+            logger.exception("could not record reservation expiry stats")
+
+
+async def get_reservation_expiry_stats(repo: MemoryCacheRepository) -> Optional[dict]:
+    stats, total_released = await repo.get_many([RESERVATION_EXPIRY_STATS_KEY, RESERVATION_EXPIRY_RELEASED_KEY])
+    if stats is None:
+        return None
+    return {**json.loads(stats), "total_released": int(total_released or 0)}
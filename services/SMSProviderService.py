@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from enum import Enum
+from typing import Optional
+
+from config import SMS_PROVIDER_TIMEOUT_SECONDS, SMS_HEDGING_ENABLED, SMS_HEDGE_DELAY_SECONDS, \
+    SMS_BREAKER_WINDOW_SIZE, SMS_BREAKER_MINIMUM_CALLS, SMS_BREAKER_FAILURE_RATE, SMS_BREAKER_COOLDOWN_SECONDS, \
+    SMS_BREAKER_HALF_OPEN_CALLS
+
+logger = logging.getLogger(__name__)
+
+LATENCY_SAMPLES = 256
+
+
+class SMSDeliveryError(Exception):
+    # Deliberately not a domain error, so the OTP consumer retries the request instead of dropping it
+    pass
+
+
+class SMSProviderInterface:
+    name = None
+
+    async def send_otp(self, otp, phone_number):
+        raise NotImplementedError()
+
+class KaveNegarProvider(SMSProviderInterface):
+    name = "kavenegar"
+
+    async def send_otp(self, otp, phone_number):
+        print(f"KaveNegar: Sending OTP to {phone_number}")
+        await asyncio.sleep(random.uniform(0.05, 0.4))
+        if random.choice([True, False]):
+            raise Exception("KaveNegar is down!")
+
+class SignalProvider(SMSProviderInterface):
+    name = "signal"
+
+    async def send_otp(self, otp, phone_number):
+        print(f"Signal: Sending OTP to {phone_number}")
+        await asyncio.sleep(random.uniform(0.05, 0.4))
+        if random.choice([True, False]):
+            raise Exception("Signal is down!")
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+# Per provider breaker over a count based window of recent outcomes.
+# Closed: calls pass, once the window holds enough calls and the failure rate reaches the threshold it opens.
+# Open: calls are rejected until the cooldown passes. Half open: a few trial calls pass,
+# one success closes it with a fresh window and one failure opens it again.
+class CircuitBreaker:
+    def __init__(self,
+                 window_size: int = SMS_BREAKER_WINDOW_SIZE,
+                 minimum_calls: int = SMS_BREAKER_MINIMUM_CALLS,
+                 failure_rate: float = SMS_BREAKER_FAILURE_RATE,
+                 cooldown: float = SMS_BREAKER_COOLDOWN_SECONDS,
+                 half_open_calls: int = SMS_BREAKER_HALF_OPEN_CALLS):
+        self.minimum_calls = minimum_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.half_open_calls = half_open_calls
+        self.state = CircuitState.CLOSED
+        self.opened_at = None
+        self._outcomes = deque(maxlen=window_size)
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == CircuitState.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = CircuitState.HALF_OPEN
+                self._trials = 0
+            if self.state == CircuitState.HALF_OPEN:
+                if self._trials >= self.half_open_calls:
+                    return False
+                self._trials += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == CircuitState.HALF_OPEN:
+                self.state = CircuitState.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            if self.state == CircuitState.HALF_OPEN or (
+                    len(self._outcomes) >= self.minimum_calls and self._current_failure_rate() >= self.failure_rate):
+                self.state = CircuitState.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        # A call that was cancelled (lost a hedge) says nothing about the provider, only its trial slot is freed
+        with self._lock:
+            if self.state == CircuitState.HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def _current_failure_rate(self) -> float:
+        return self._outcomes.count(False) / len(self._outcomes) if self._outcomes else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state.value,
+                "failure_rate": round(self._current_failure_rate(), 4),
+                "window_calls": len(self._outcomes)
+            }
+
+
+class ProviderMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.hedges = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        # Failed and timed out attempts, kept apart so a slow failing provider does not look fast
+        self.failure_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def snapshot(self) -> dict:
+        def percentiles(samples):
+            latencies = sorted(samples)
+
+            def percentile(p):
+                return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 1) if latencies else None
+
+            return {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)}
+
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "hedges": self.hedges,
+            "latency_ms": percentiles(self.latencies),
+            "failure_latency_ms": percentiles(self.failure_latencies)
+        }
+
+
+# Sends through the providers in order, each behind its own breaker and a per call timeout.
+# A failed call moves on to the next provider right away. With hedging, a call that is still running
+# after the hedge delay gets the next provider started next to it and the first success wins.
+# The dispatcher lives for the whole process, so breaker state and metrics carry over between requests.
+class SMSDispatcher:
+    def __init__(self,
+                 providers: list[SMSProviderInterface],
+                 timeout: float = SMS_PROVIDER_TIMEOUT_SECONDS,
+                 hedging: bool = SMS_HEDGING_ENABLED,
+                 hedge_delay: float = SMS_HEDGE_DELAY_SECONDS):
+        self.providers = providers
+        self.timeout = timeout
+        self.hedging = hedging
+        self.hedge_delay = hedge_delay
+        self.breakers = {provider.name: CircuitBreaker() for provider in providers}
+        self.metrics = {provider.name: ProviderMetrics() for provider in providers}
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    async def send(self, otp, phone_number) -> Optional[str]:
+        # Returns the name of the provider that delivered, None when none could
+        remaining = iter(self.providers)
+        running = {}
+
+        def start_next(hedge: bool = False) -> bool:
+            for provider in remaining:
+                if not self.breakers[provider.name].allow_request():
+                    self.metrics[provider.name].rejected += 1
+                    continue
+                if hedge:
+                    self.metrics[provider.name].hedges += 1
+                running[asyncio.ensure_future(self._attempt(provider, otp, phone_number))] = provider
+                return True
+            return False
+
+        exhausted = not start_next()
+        try:
+            while running:
+                hedge_now = self.hedging and not exhausted
+                done, _ = await asyncio.wait(running, timeout=self.hedge_delay if hedge_now else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    exhausted = not start_next(hedge=True)
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    if task.result():
+                        return provider.name
+                    if not exhausted:
+                        exhausted = not start_next()
+            return None
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _attempt(self, provider: SMSProviderInterface, otp, phone_number) -> bool:
+        breaker, metrics = self.breakers[provider.name], self.metrics[provider.name]
+        metrics.calls += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(provider.send_otp(otp, phone_number), self.timeout)
+        except asyncio.CancelledError:
+            metrics.cancelled += 1
+            breaker.release()
+            raise
+        except asyncio.TimeoutError:
+            logger.warning("%s timed out after %ss", provider.name, self.timeout)
+            metrics.timeouts += 1
+            metrics.failure_latencies.append(time.perf_counter() - started)
+            breaker.record_failure()
+            return False
+        except Exception as error:
+            logger.warning("%s failed: %s", provider.name, error)
+            metrics.failures += 1
+            metrics.failure_latencies.append(time.perf_counter() - started)
+            breaker.record_failure()
+            return False
+        metrics.successes += 1
+        metrics.latencies.append(time.perf_counter() - started)
+        breaker.record_success()
+        return True
+
+    def deliver(self, otp, phone_number) -> Optional[str]:
+        # Entry point for blocking callers such as the OTP queue consumer,
+        # all sends share one event loop in a background thread
+        return asyncio.run_coroutine_threadsafe(self.send(otp, phone_number), self._ensure_loop()).result()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="sms-dispatcher", daemon=True).start()
+            return self._loop
+
+    def get_metrics(self) -> dict:
+        return {
+            "hedging": self.hedging,
+            "timeout_seconds": self.timeout,
+            "providers": {
+                provider.name: {**self.breakers[provider.name].snapshot(), **self.metrics[provider.name].snapshot()}
+                for provider in self.providers
+            }
+        }
+
+
+sms_dispatcher = SMSDispatcher([KaveNegarProvider(), SignalProvider()])
@@ -43,7 +43,13 @@ class UnitOfWork:
             self.repositories[repo_class] = repo_class(self.session)
         return self.repositories[repo_class]
 
+    def add_event(self, event):
+        # For set-based writes that have no entity to record the event on
+        self.events.append(event)
+
     def collect_new_events(self):
+        while self.events:
+            yield self.events.pop(0)
         # Assuming each entity has events to be collected
         for repo in self.repositories.values():
             if repo.seen is not None:
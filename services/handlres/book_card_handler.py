@@ -0,0 +1,57 @@
+import logging
+from typing import Union
+
+from adapters.repositories.BookCardRepository import BookCardRepository
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository
+from events.commands import RebuildBookCardsCommand
+from events.events import BookCreatedEvent, BookUpdatedEvent, BookReservedEvent, BooksImportedEvent, \
+    BookReleasedEvent, BooksReservedEvent
+from config import CATALOG_INDEX_ENABLED, BOOK_BULK_INSERT_CHUNK_SIZE
+from services.BookListCacheService import bump_book_list_version
+from services.CatalogIndex import catalog_index
+from services.UnitOfWork import UnitOfWork
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_book_card_handler(
+        event: Union[BookCreatedEvent, BookUpdatedEvent, BookReservedEvent, BookReleasedEvent],
+        uow: UnitOfWork(),
+        cache: SyncMemoryCacheRepository
+):
+    with uow:
+        repo = uow.get_repository(BookCardRepository)
+        repo.refresh_book_cards([event.book_id])
+    if CATALOG_INDEX_ENABLED:
+        catalog_index.refresh_books([event.book_id])
+    # Only invalidate once the listing sources reflect the change
+    bump_book_list_version(cache)
+
+
+def refresh_many_book_cards_handler(
+        event: Union[BooksImportedEvent, BooksReservedEvent],
+        uow: UnitOfWork(),
+        cache: SyncMemoryCacheRepository
+):
+    with uow:
+        repo = uow.get_repository(BookCardRepository)
+        for start in range(0, len(event.book_ids), BOOK_BULK_INSERT_CHUNK_SIZE):
+            repo.refresh_book_cards(event.book_ids[start:start + BOOK_BULK_INSERT_CHUNK_SIZE])
+    if CATALOG_INDEX_ENABLED:
+        catalog_index.refresh_books(event.book_ids)
+    bump_book_list_version(cache)
+
+
+def rebuild_book_cards_handler(
+        cmd: RebuildBookCardsCommand,
+        uow: UnitOfWork(),
+        cache: SyncMemoryCacheRepository
+) -> int:
+    with uow:
+        repo = uow.get_repository(BookCardRepository)
+        count = repo.rebuild_book_cards()
+        logger.info("rebuilt %s book cards", count)
+    if CATALOG_INDEX_ENABLED and catalog_index.loaded:
+        catalog_index.load()
+    bump_book_list_version(cache)
+    return count
@@ -1,11 +1,14 @@
 import logging
 
-from fastapi import HTTPException
+from sqlalchemy.exc import SQLAlchemyError
 
 from adapters.repositories.AuthorRepository import AuthorRepository
 from adapters.repositories.BookRepository import BookRepository
-from domains.models.BookManagementModels import Book
-from events.commands import CreateBookCommand, UpdateBookCommand
+from config import BOOK_BULK_MAX_BATCH_SIZE, BOOK_BULK_INSERT_CHUNK_SIZE
+from domains.models.BookManagementModels import Book, normalize_genres
+from events.commands import CreateBookCommand, UpdateBookCommand, CreateBooksBatchCommand
+from events.events import BookCreatedEvent, BookUpdatedEvent, BooksImportedEvent
+from exceptions.BaseException import BulkImportTooLargeError
 
 from services.UnitOfWork import UnitOfWork
 
@@ -27,36 +30,94 @@ def add_book_handler(
             price=cmd.price
         )
         author_repo = uow.get_repository(AuthorRepository)
-        authors = []
-        for author_id in cmd.author_ids:
-            author = author_repo.get_author_by_id(author_id)
-            if author is None:
-                raise HTTPException(status_code=404, detail=f"Author {author_id} not found")
-            authors.append(author)
+        authors = author_repo.get_authors_by_ids(cmd.author_ids)
 
         # Set all authors at once
         new_book.set_authors(authors)
 
         repo.add_book(new_book)
+        new_book.add_event(BookCreatedEvent(new_book.id))
         uow.commit()
 
 
 def update_book_handler(
-        cmd:UpdateBookCommand
+        cmd:UpdateBookCommand,
+        uow: UnitOfWork()
 ):
-    with UnitOfWork() as uow:
+    with uow:
         repo = uow.get_repository(BookRepository)
         book = repo.get_book_by_id(cmd.id)
         book.update(cmd.title, cmd.genres,cmd.release_date, cmd.isbn, cmd.price)
         author_repo = uow.get_repository(AuthorRepository)
-        authors = []
-        for author_id in cmd.author_ids:
-            author = author_repo.get_author_by_id(author_id)
-            if author is None:
-                raise HTTPException(status_code=404, detail=f"Author {author_id} not found")
-            authors.append(author)
+        authors = author_repo.get_authors_by_ids(cmd.author_ids)
 
         # Set all authors at once
         book.set_authors(authors)
 
-        repo.update_book(book,cmd.id)
\ No newline at end of file
+        repo.update_book(book,cmd.id)
+        book.add_event(BookUpdatedEvent(book.id))
+
+
+def add_books_batch_handler(
+        cmd: CreateBooksBatchCommand,
+        uow: UnitOfWork()
+) -> dict:
+    if len(cmd.books) > BOOK_BULK_MAX_BATCH_SIZE:
+        raise BulkImportTooLargeError(f"At most {BOOK_BULK_MAX_BATCH_SIZE} books per bulk import")
+
+    errors = []
+    valid = []
+    with uow:
+        repo = uow.get_repository(BookRepository)
+        author_repo = uow.get_repository(AuthorRepository)
+
+        # Every lookup is done once for the whole batch instead of once per row
+        existing_authors = author_repo.get_existing_author_ids(
+            list({author_id for book in cmd.books for author_id in book.author_ids}))
+        existing_isbns = repo.get_existing_isbns(list({book.isbn for book in cmd.books}))
+
+        seen_isbns = set()
+        for row, book in enumerate(cmd.books):
+            missing = [author_id for author_id in book.author_ids if author_id not in existing_authors]
+            if missing:
+                errors.append({"row": row, "isbn": book.isbn, "error": f"Authors not found: {missing}"})
+            elif book.isbn in existing_isbns:
+                errors.append({"row": row, "isbn": book.isbn, "error": "ISBN already exists"})
+            elif book.isbn in seen_isbns:
+                errors.append({"row": row, "isbn": book.isbn, "error": "Duplicate ISBN in batch"})
+            else:
+                seen_isbns.add(book.isbn)
+                valid.append((row, {
+                    "title": book.title,
+                    "genres": normalize_genres(book.genres),
+                    "release_date": book.release_date,
+                    "isbn": book.isbn,
+                    "price": book.price,
+                    "author_ids": book.author_ids
+                }))
+
+        book_ids = []
+        for start in range(0, len(valid), BOOK_BULK_INSERT_CHUNK_SIZE):
+            chunk = valid[start:start + BOOK_BULK_INSERT_CHUNK_SIZE]
+            # Each chunk is its own transaction, a failing chunk does not undo the ones before it
+            try:
+                inserted = repo.add_books_bulk([book for _, book in chunk])
+                uow.commit()
+            except SQLAlchemyError as error:
+                uow.rollback()
+                logger.exception("bulk import chunk starting at row %s failed", chunk[0][0])
+                errors.extend({"row": row, "isbn": book["isbn"], "error": str(error.__cause__ or error)}
+                              for row, book in chunk)
+                continue
+            for row, book in chunk:
+                if book["isbn"] in inserted:
+                    book_ids.append(inserted[book["isbn"]])
+                else:
+                    # Inserted by someone else between the ISBN check and the insert
+                    errors.append({"row": row, "isbn": book["isbn"], "error": "ISBN already exists"})
+
+        if book_ids:
+            uow.add_event(BooksImportedEvent(book_ids))
+
+    errors.sort(key=lambda error: error["row"])
+    return {"created": len(book_ids), "failed": len(errors), "book_ids": book_ids, "errors": errors}
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from adapters.repositories.LedgerRepository import LedgerRepository
+from events.commands import SnapshotBalancesCommand, ReconcileBalancesCommand
+from services.UnitOfWork import UnitOfWork
+
+
+def snapshot_balances_handler(
+        cmd: SnapshotBalancesCommand,
+        uow: UnitOfWork()) -> int:
+    taken, after_id = 0, 0
+    with uow:
+        repo = uow.get_repository(LedgerRepository)
+        while True:
+            member_ids = repo.lock_members(after_id, cmd.batch_size)
+            if not member_ids:
+                break
+            taken += repo.take_snapshots(member_ids, datetime.now())
+            # Deposits of the batch only wait for its own short transaction
+            uow.commit()
+            after_id = member_ids[-1]
+    return taken
+
+
+def reconcile_balances_handler(
+        cmd: ReconcileBalancesCommand,
+        uow: UnitOfWork()) -> dict:
+    checked, mismatches, after_id = 0, [], 0
+    with uow:
+        repo = uow.get_repository(LedgerRepository)
+        while True:
+            rows = repo.reconcile_balances(after_id, cmd.batch_size)
+            if not rows:
+                break
+            checked += len(rows)
+            mismatches += [{"member_id": row.member_id,
+                            "balance": row.balance,
+                            "ledger_balance": row.ledger_balance} for row in rows if row.balance != row.ledger_balance]
+            after_id = rows[-1].member_id
+    return {"checked": checked, "mismatches": mismatches}
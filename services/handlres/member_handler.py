@@ -1,9 +1,10 @@
 from adapters.repositories.MemberRepository import MemberRepository
 from adapters.repositories.PaymentRepository import PaymentRepository
 from domains.models.MemberManagementModels import Member
-from domains.models.PaymentModels import Payment
+from config import MEMBER_PREMIUM_COST
+from domains.models.PaymentModels import Payment, LedgerEntryType
 from events.commands import CreateMemberCommand, AddToMemberBalanceCommand, SetMemberVIPCommand
-from exceptions.BaseException import MemberDoesNotExistError
+from exceptions.BaseException import MemberDoesNotExistError, CanNotAddNegativeAmountError
 from services.UnitOfWork import UnitOfWork
 
 
@@ -41,12 +42,16 @@ def get_member_by_phone_number_handler(uow:UnitOfWork, phone_number:str):
 
 def add_to_balance_handler(
         cmd:AddToMemberBalanceCommand,
-        uow: UnitOfWork()):
+        uow: UnitOfWork()) -> int:
+    if cmd.amount < 0:
+        raise CanNotAddNegativeAmountError()
+    # Balance change and ledger entry commit together, once
     with uow:
         repo = uow.get_repository(MemberRepository)
         payment_repo = uow.get_repository(PaymentRepository)
-        payment_repo.add_payment(Payment(cmd.amount,cmd.member_id))
-        repo.add_to_balance(cmd.member_id,cmd.amount)
+        balance = repo.add_to_balance(cmd.member_id,cmd.amount)
+        payment_repo.add_payment(Payment(cmd.amount, cmd.member_id, LedgerEntryType.DEPOSIT, balance))
+        return balance
 
 def set_to_vip_handler(
         cmd:SetMemberVIPCommand,
@@ -54,4 +59,8 @@ def set_to_vip_handler(
 ):
     with uow:
         repo = uow.get_repository(MemberRepository)
-        repo.set_vip(cmd.member_id)
\ No newline at end of file
+        payment_repo = uow.get_repository(PaymentRepository)
+        balance = repo.set_vip(cmd.member_id)
+        payment_repo.add_payment(
+            Payment(-MEMBER_PREMIUM_COST, cmd.member_id, LedgerEntryType.PREMIUM_PURCHASE, balance))
+        return balance
\ No newline at end of file
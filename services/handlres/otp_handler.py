@@ -3,18 +3,38 @@ from collections.abc import Callable
 from dataclasses import asdict
 from json import JSONEncoder
 
+from adapters.repositories.MemoryCacheRepository import SyncMemoryCacheRepository
+from config import OTP_CONSUMER_PREFETCH_COUNT, OTP_CONSUMER_WORKERS, OTP_CONSUMER_DRAIN_TIMEOUT_SECONDS
 from events.events import OTPSendEvent
+from messaging.rabbitMQ_consumer import RabbitMQConsumer
 from services.OTPService import generate_otp
 
+OTP_REQUEST_QUEUE = "otp_request"
+
 
 def publish_otp_event(
         event: OTPSendEvent(),
         publish: Callable
 ):
-    publish("otp_request",JSONEncoder().encode(asdict(event)))
+    publish(OTP_REQUEST_QUEUE,JSONEncoder().encode(asdict(event)))
 
 
 def send_otp_handler(
-        event: OTPSendEvent
+        event: OTPSendEvent,
+        cache: SyncMemoryCacheRepository
 ):
-    generate_otp(event.phone_number)
+    generate_otp(cache, event.phone_number)
+
+
+def handle_otp_request_message(body: bytes, cache: SyncMemoryCacheRepository):
+    data_dict = json.loads(body.decode('utf-8'))
+    send_otp_handler(OTPSendEvent(data_dict.get("phone_number")), cache)
+
+
+def create_otp_consumer(cache: SyncMemoryCacheRepository) -> RabbitMQConsumer:
+    return RabbitMQConsumer(
+        OTP_REQUEST_QUEUE,
+        lambda body: handle_otp_request_message(body, cache),
+        prefetch_count=OTP_CONSUMER_PREFETCH_COUNT,
+        workers=OTP_CONSUMER_WORKERS,
+        drain_timeout=OTP_CONSUMER_DRAIN_TIMEOUT_SECONDS)
@@ -1,47 +1,211 @@
+from collections.abc import Callable
+from dataclasses import asdict
+from datetime import datetime
+from json import JSONEncoder
+from typing import Union
+
+from dateutil.relativedelta import relativedelta
+
 from config import RESERVATION_MINIMUM_PAYMENT_FOR_DISCOUNT, \
-    RESERVATION_MINIMUM_BOOKS_COUNT_FOR_DISCOUNT
+    RESERVATION_MINIMUM_BOOKS_COUNT_FOR_DISCOUNT, WAITLIST_NOTIFICATION_QUEUE, WAITLIST_HANDOFF_ATTEMPTS, \
+    RESERVATION_DISCOUNT_BOOKS_WINDOW_MONTHS, RESERVATION_DISCOUNT_PAYMENT_WINDOW_MONTHS, \
+    RESERVATION_MAX_BOOKS_PER_REQUEST
 from adapters.repositories.BookRepository import BookRepository
 from adapters.repositories.MemberRepository import MemberRepository
 from adapters.repositories.PaymentRepository import PaymentRepository
 from adapters.repositories.ReservationRepository import ReservationRepository
-from events.commands import ReserveBookCommand
-from exceptions.BaseException import MaximumRegularMemberError, MaximumPremiumMemberError, BookIsReservedError
+from adapters.repositories.WaitlistRepository import WaitlistRepository
+from events.commands import ReserveBookCommand, ReleaseExpiredReservationsCommand, JoinWaitlistCommand, \
+    LeaveWaitlistCommand, ReserveBooksCommand
+from events.events import BookReleasedEvent, WaitlistJoinedEvent, WaitlistHandoffEvent, BooksReservedEvent
+from exceptions.BaseException import MaximumRegularMemberError, MaximumPremiumMemberError, MemberDoesNotExistError, \
+    BookIsReservedError, BooksNotAvailableError, TooManyBooksToReserveError
 from domains.models.BookManagementModels import Reservation, ReservationStatus
 from domains.models.MemberManagementModels import MembershipType
 from services.UnitOfWork import UnitOfWork
 
+RESERVE_MODE_ALL_OR_NOTHING = 'all_or_nothing'
+RESERVE_MODE_BEST_EFFORT = 'best_effort'
+RESERVE_MODES = (RESERVE_MODE_ALL_OR_NOTHING, RESERVE_MODE_BEST_EFFORT)
+
 
 def reserve_handler(
         cmd: ReserveBookCommand,
         uow:UnitOfWork()):
     with uow:
-        try:
-            repo = uow.get_repository(ReservationRepository)
-            book_repo = uow.get_repository(BookRepository)
-            member_repo = uow.get_repository(MemberRepository)
-            payment_repo = uow.get_repository(PaymentRepository)
-
-            reservation = Reservation(
-                cmd.book_id,
-                cmd.member_id,
-                cmd.duration
-            )
-
-            book = book_repo.get_book_by_id(cmd.book_id)
-            if book.status == ReservationStatus.RESERVED:
-                raise BookIsReservedError()
-
-            member = member_repo.get_member_by_id(cmd.member_id)
-            payments = payment_repo.get_payments_by_dates(cmd.member_id, reservation.start_date, reservation.end_date)
-            total_cost = calculate_reservation_cost(member, book, cmd.duration, payments)
-            reservation.set_total_cost(total_cost)
-            new_reservation = repo.reserve(reservation)
-            book_repo.set_to_reserved(book, new_reservation.id)
-            return new_reservation
-        except Exception as error:
-            raise error
-
-def calculate_reservation_cost(member, book, duration,payments):
+        return reserve_book(uow, cmd.member_id, cmd.book_id, cmd.duration)
+
+
+def reserve_book(uow: UnitOfWork, member_id: int, book_id: int, duration: int) -> Reservation:
+    # Runs inside the caller's transaction, nothing is committed here
+    repo = uow.get_repository(ReservationRepository)
+    book_repo = uow.get_repository(BookRepository)
+    member_repo = uow.get_repository(MemberRepository)
+
+    reservation = Reservation(
+        book_id,
+        member_id,
+        duration
+    )
+
+    # Read everything that does not depend on the book first, so the claimed row stays locked briefly
+    member = member_repo.get_member_by_id(member_id)
+    if member is None:
+        raise MemberDoesNotExistError()
+    recent_reservations, recent_payments = load_discount_inputs(uow, member)
+
+    # Raises BookIsReservedError right away when another reservation got the book first
+    book = book_repo.claim_for_reservation(book_id)
+    total_cost = calculate_reservation_cost(member, book, duration, recent_reservations, recent_payments)
+    reservation.set_total_cost(total_cost)
+    new_reservation = repo.reserve(reservation)
+    new_reservation.confirm()
+    return new_reservation
+
+
+def reserve_books_handler(
+        cmd: ReserveBooksCommand,
+        uow: UnitOfWork()) -> dict:
+    if cmd.mode not in RESERVE_MODES:
+        raise ValueError(f"Unknown reservation mode '{cmd.mode}', use one of {', '.join(RESERVE_MODES)}")
+    book_ids = sorted(set(cmd.book_ids))
+    if len(book_ids) > RESERVATION_MAX_BOOKS_PER_REQUEST:
+        raise TooManyBooksToReserveError(f"At most {RESERVATION_MAX_BOOKS_PER_REQUEST} books per request")
+
+    with uow:
+        repo = uow.get_repository(ReservationRepository)
+        book_repo = uow.get_repository(BookRepository)
+
+        # Member, limits and discount inputs are read once for the whole set
+        member = uow.get_repository(MemberRepository).get_member_by_id(cmd.member_id)
+        if member is None:
+            raise MemberDoesNotExistError()
+        check_reservation_duration(member, cmd.duration)
+        recent_reservations, recent_payments = load_discount_inputs(uow, member)
+
+        books = book_repo.claim_books_for_reservation(book_ids)
+        unavailable = sorted(set(book_ids) - {book.id for book in books})
+        if unavailable and cmd.mode == RESERVE_MODE_ALL_OR_NOTHING:
+            # Leaving the block with an error rolls back the books claimed so far
+            raise BooksNotAvailableError(f"Books not available: {', '.join(map(str, unavailable))}")
+
+        reservations = []
+        for book in books:
+            reservation = Reservation(book.id, cmd.member_id, cmd.duration)
+            reservation.set_total_cost(
+                calculate_reservation_cost(member, book, cmd.duration, recent_reservations, recent_payments))
+            reservations.append(reservation)
+        repo.reserve_many(reservations)
+        # One event for the whole set, so the projections refresh in one transaction rather than one per book
+        if reservations:
+            uow.add_event(BooksReservedEvent([reservation.book_id for reservation in reservations]))
+
+        return {
+            "reserved": [{"book_id": reservation.book_id,
+                          "reservation_id": reservation.id,
+                          "total_cost": reservation.total_cost} for reservation in reservations],
+            "unavailable": unavailable
+        }
+
+
+def join_waitlist_handler(
+        cmd: JoinWaitlistCommand,
+        uow: UnitOfWork()) -> dict:
+    with uow:
+        member = uow.get_repository(MemberRepository).get_member_by_id(cmd.member_id)
+        if member is None:
+            raise MemberDoesNotExistError()
+        # Rejected now rather than when the book comes back
+        check_reservation_duration(member, cmd.duration)
+        book = uow.get_repository(BookRepository).get_book_by_id(cmd.book_id)
+
+        repo = uow.get_repository(WaitlistRepository)
+        repo.join(cmd.book_id, cmd.member_id, cmd.duration)
+        uow.commit()
+        position = repo.get_position(cmd.book_id, cmd.member_id)
+        available = book.status == ReservationStatus.PENDING
+    # The book may have been released between the failed reservation and joining,
+    # no release event would follow then, so the handoff is tried right away
+    if available:
+        uow.add_event(WaitlistJoinedEvent(cmd.book_id))
+    return {"position": position}
+
+
+def leave_waitlist_handler(
+        cmd: LeaveWaitlistCommand,
+        uow: UnitOfWork()) -> bool:
+    with uow:
+        return uow.get_repository(WaitlistRepository).leave(cmd.book_id, cmd.member_id)
+
+
+def handoff_to_waitlist_handler(
+        event: Union[BookReleasedEvent, WaitlistJoinedEvent],
+        uow: UnitOfWork()):
+    # Dequeueing the next member, claiming the book and creating the reservation commit together,
+    # so either the member gets the book or stays first in line
+    for _ in range(WAITLIST_HANDOFF_ATTEMPTS):
+        with uow:
+            repo = uow.get_repository(WaitlistRepository)
+            entry = repo.pop_next(event.book_id)
+            if entry is None:
+                return
+            try:
+                reservation = reserve_book(uow, entry.member_id, event.book_id, entry.duration)
+            except BookIsReservedError:
+                # Reserved directly in the meantime, the rollback puts the entry back
+                uow.rollback()
+                return
+            except (MemberDoesNotExistError, MaximumRegularMemberError, MaximumPremiumMemberError):
+                # This member can no longer take the book, drop the entry and offer it to the next one
+                uow.rollback()
+                repo.remove(entry.id)
+                uow.commit()
+                continue
+            uow.commit()
+        uow.add_event(WaitlistHandoffEvent(entry.member_id, event.book_id, reservation.id))
+        return
+
+
+def notify_waitlist_handoff_handler(
+        event: WaitlistHandoffEvent,
+        publish: Callable):
+    publish(WAITLIST_NOTIFICATION_QUEUE, JSONEncoder().encode(asdict(event)))
+
+
+def load_discount_inputs(uow: UnitOfWork, member) -> tuple[int, int]:
+    # Only regular members pay, premium reservations need no history at all
+    if member.membership_type != MembershipType.REGULAR:
+        return 0, 0
+    # Two aggregates over fixed windows, their cost does not grow with the member's history
+    now = datetime.now()
+    recent_reservations = uow.get_repository(ReservationRepository).count_member_reservations(
+        member.id, now - relativedelta(months=RESERVATION_DISCOUNT_BOOKS_WINDOW_MONTHS), now)
+    recent_payments = uow.get_repository(PaymentRepository).get_payments_total(
+        member.id, now - relativedelta(months=RESERVATION_DISCOUNT_PAYMENT_WINDOW_MONTHS), now)
+    return recent_reservations, recent_payments
+
+
+def check_reservation_duration(member, duration):
+    # Premium users can reserve books up to 14 days, regular users up to 7
+    if member.membership_type == MembershipType.PREMIUM and duration > 14:
+        raise MaximumPremiumMemberError()
+    if member.membership_type == MembershipType.REGULAR and duration > 7:
+        raise MaximumRegularMemberError()
+
+
+def release_expired_reservations_handler(
+        cmd: ReleaseExpiredReservationsCommand,
+        uow: UnitOfWork()) -> int:
+    with uow:
+        repo = uow.get_repository(ReservationRepository)
+        released = repo.release_expired(datetime.now(), cmd.batch_size)
+        uow.commit()
+    # Only announced once the releases are committed
+    for reservation_id, book_id, member_id, _ in released:
+        uow.add_event(BookReleasedEvent(book_id, reservation_id, member_id))
+    return len(released)
+
+def calculate_reservation_cost(member, book, duration, recent_reservations, recent_payments):
 
     if member.membership_type == MembershipType.PREMIUM:
         # Premium users can reserve books up to 14 days and it's free
@@ -60,20 +224,19 @@ def calculate_reservation_cost(member, book, duration,payments):
         total_cost = cost_per_day * duration
 
         # Apply discount if there is any
-        discount = calculate_discount(member,payments)
+        discount = calculate_discount(recent_reservations, recent_payments)
         total_cost *= (1 - discount)
 
         return total_cost
     else:
         raise Exception("error")
 
-def calculate_discount(member,payments):
+def calculate_discount(recent_reservations, recent_payments):
     # Check for reserved books in a month
-    if len(member.reservations) > RESERVATION_MINIMUM_BOOKS_COUNT_FOR_DISCOUNT:
+    if recent_reservations > RESERVATION_MINIMUM_BOOKS_COUNT_FOR_DISCOUNT:
         return 0.3  # 30% discount
 
-    # calc total spent in the past 2 month
-    total_spent_last_2_months = sum(res.amount for res in payments)
-    if total_spent_last_2_months > RESERVATION_MINIMUM_PAYMENT_FOR_DISCOUNT:
+    # Total spent in the past 2 months
+    if recent_payments > RESERVATION_MINIMUM_PAYMENT_FOR_DISCOUNT:
         return 1.0  # Free
     return 0.0
\ No newline at end of file
@@ -0,0 +1,90 @@
+# Parallel deposits through the message bus, the way /member/deposit runs them on the threadpool:
+# every balance must add up, and the ledger must hold one entry with its own running balance per deposit.
+# Needs the database configured in DatabaseConf.env and is skipped without it:
+#     python -m pytest tests/test_ledger_concurrency.py
+import random
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, delete, func, select
+
+from config import SQLALCHEMY_DATABASE_URL
+
+THREADS = 16
+DEPOSITS = 400
+MEMBERS = 4
+
+
+def _database_available() -> bool:
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    try:
+        with engine.connect():
+            return True
+    except Exception:
+        return False
+    finally:
+        engine.dispose()
+
+
+pytestmark = pytest.mark.skipif(not _database_available(), reason="no database configured")
+
+
+@pytest.fixture(scope="module")
+def bus():
+    # Imported here, the table mapping creates the schema on import
+    from bootstrap import bootstrap
+    return bootstrap(publish=lambda *args: None)
+
+
+@pytest.fixture
+def member_ids(bus):
+    from adapters.table_mapping import member_table, payment_table, balance_snapshot_table
+    from domains.models.MemberManagementModels import Member
+    from services.UnitOfWork import UnitOfWork
+
+    tag = uuid.uuid4().hex[:8]
+    with UnitOfWork() as uow:
+        members = [Member("Test", f"Ledger{i}", f"ledger-test-{tag}-{i}") for i in range(MEMBERS)]
+        uow.session.add_all(members)
+        uow.session.flush()
+        ids = [member.id for member in members]
+    yield ids
+    with UnitOfWork() as uow:
+        uow.session.execute(delete(balance_snapshot_table).where(balance_snapshot_table.c.member_id.in_(ids)))
+        uow.session.execute(delete(payment_table).where(payment_table.c.member_id.in_(ids)))
+        uow.session.execute(delete(member_table).where(member_table.c.id.in_(ids)))
+
+
+def test_parallel_deposits_are_not_lost(bus, member_ids):
+    from adapters.table_mapping import member_table, payment_table
+    from events.commands import AddToMemberBalanceCommand
+    from services.UnitOfWork import UnitOfWork
+
+    work = [(random.choice(member_ids), random.randint(1, 100)) for _ in range(DEPOSITS)]
+    expected = {member_id: 0 for member_id in member_ids}
+    for member_id, amount in work:
+        expected[member_id] += amount
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(lambda job: bus.handle(AddToMemberBalanceCommand(*job)), work))
+
+    with UnitOfWork() as uow:
+        balances = dict(uow.session.execute(
+            select(member_table.c.id, member_table.c.balance).where(member_table.c.id.in_(member_ids))).all())
+        entries = {row.member_id: row for row in uow.session.execute(
+            select(payment_table.c.member_id,
+                   func.count().label("count"),
+                   func.sum(payment_table.c.amount).label("total"),
+                   func.count(func.distinct(payment_table.c.balance_after)).label("distinct_after"))
+            .where(payment_table.c.member_id.in_(member_ids))
+            .group_by(payment_table.c.member_id)).all()}
+
+    assert balances == expected
+    for member_id in member_ids:
+        if not expected[member_id]:
+            continue
+        assert entries[member_id].total == expected[member_id]
+        # Deposits are positive, so every entry must have seen a different running balance
+        assert entries[member_id].distinct_after == entries[member_id].count
+    assert sum(row.count for row in entries.values()) == DEPOSITS